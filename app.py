@@ -1,11 +1,47 @@
+import io
+import os
+import contextlib
+import logging
 import streamlit as st
 import pandas as pd
 from logic import (
-    parse_docx, parse_pdf, parse_csv_employee, parse_excel_employee, 
-    load_master_file, append_employee_record, export_master_file
+    ingest_employee_files, file_fingerprint, load_master_file, append_employee_records,
+    upsert_employee_records, export_master_file, excel_sheet_names, load_openai_key, unreadable_master_values,
+    MASTER_SCHEMA, LOGGER, instrumented
 )
 
-DEBUG = True
+# Debug output (extracted lines, mappings, merge summaries) is logged, not printed:
+# run with ONBOARDING_LOG_LEVEL=DEBUG to see it.
+if not LOGGER.handlers:
+    LOGGER.addHandler(logging.StreamHandler())
+LOG_LEVEL = os.getenv("ONBOARDING_LOG_LEVEL", "WARNING").strip().upper()
+if not isinstance(logging.getLevelName(LOG_LEVEL), int):
+    # getLevelName maps a known level name to its number and anything else to a string.
+    LOGGER.warning("Ignoring ONBOARDING_LOG_LEVEL=%r: not a logging level name; using WARNING", LOG_LEVEL)
+    LOG_LEVEL = "WARNING"
+LOGGER.setLevel(LOG_LEVEL)
+DEBUG = LOGGER.isEnabledFor(logging.DEBUG)
+
+# Streamlit reruns this whole script on every widget interaction. The master load
+# and the merge/export are cached on content, and parsed employee files are cached
+# inside logic (PARSE_CACHE), so a rerun only redoes work for inputs that changed.
+@st.cache_data(show_spinner=False, max_entries=8)
+def load_master_cached(master_bytes, master_name):
+    return load_master_file(io.BytesIO(master_bytes), master_name)
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def build_master_cached(master_bytes, master_name, file_keys, upsert, export_fmt, compress, _emp_data):
+    # _emp_data is not hashed: file_keys already identifies the parsed records.
+    df = load_master_cached(master_bytes, master_name)
+    df, summary = merge_records(df, _emp_data, upsert)
+    output, mime, file_ext = export_master_file(df, master_name, fmt=export_fmt, compress=compress)
+    return df, summary, output, mime, file_ext
+
+def merge_records(df, emp_data, upsert):
+    # Merge every extracted record into the master in a single batch.
+    if upsert:
+        return upsert_employee_records(df, emp_data, debug=DEBUG)
+    return append_employee_records(df, emp_data, debug=DEBUG), None
 
 # Inject custom CSS for a modern, stylish UI.
 st.markdown(
@@ -74,6 +110,20 @@ st.markdown(
 
 # Single checkbox for AI mapping on all file types.
 use_ai_mapping = st.checkbox("AI mapping")
+if use_ai_mapping:
+    try:
+        load_openai_key()
+    except ValueError as e:
+        st.warning(f"{e}. Columns will be matched locally.")
+upsert = st.checkbox(
+    "Update existing employees",
+    help="Match people already in the master on NI number (or surname, first name and date of birth) "
+         "and update them instead of adding duplicate rows.",
+)
+show_report = st.sidebar.checkbox(
+    "Show performance report",
+    help="Time each processing stage of the next run. Steps answered from Streamlit's cache are not timed.",
+)
 
 # Two-column layout for file uploads.
 col1, col2 = st.columns(2)
@@ -87,54 +137,97 @@ with col2:
     master_file = st.file_uploader("Upload the Master File", type=["xlsx", "xls", "csv", "txt"])
 
 if emp_files is not None and len(emp_files) > 0 and master_file is not None:
-    try:
-        df = load_master_file(master_file, master_file.name)
-    except Exception as e:
-        st.error(f"Error reading master file: {e}")
-        df = pd.DataFrame()
+    # Each session runs in its own thread, so the report only covers this session's run.
+    with (instrumented() if show_report else contextlib.nullcontext()) as instruments:
+        master_bytes = master_file.getvalue()
+        try:
+            load_master_cached(master_bytes, master_file.name)
+        except Exception as e:
+            st.error(f"Error reading master file: {e}")
+            master_bytes = None
     
-    for emp_file in emp_files:
-        file_bytes = emp_file.read()
-        emp_data_list = []
-        if emp_file.name.lower().endswith(".docx"):
-            emp_data = parse_docx(file_bytes, use_ai=use_ai_mapping, debug=DEBUG)
-            emp_data_list.append(emp_data)
-        elif emp_file.name.lower().endswith(".pdf"):
-            emp_data = parse_pdf(file_bytes, use_ai=use_ai_mapping, debug=DEBUG)
-            emp_data_list.append(emp_data)
-        elif emp_file.name.lower().endswith((".csv", ".txt")):
-            emp_data_list.extend(parse_csv_employee(file_bytes, use_ai=use_ai_mapping, debug=DEBUG))
-        elif emp_file.name.lower().endswith((".xlsx", ".xls")):
-            # For Excel files, check if there are multiple sheets.
-            try:
-                xls = pd.ExcelFile(file_bytes)
-                if len(xls.sheet_names) > 1:
-                    sheet = st.selectbox(f"Select sheet for {emp_file.name}", xls.sheet_names)
-                    emp_data_list = parse_excel_employee(file_bytes, sheet_name=sheet, use_ai=use_ai_mapping, debug=DEBUG)
-                else:
-                    emp_data_list = parse_excel_employee(file_bytes, use_ai=use_ai_mapping, debug=DEBUG)
-            except Exception as e:
-                st.error(f"Error processing Excel file {emp_file.name}: {e}")
+        # Read every upload (and pick sheets for multi-sheet workbooks) before parsing,
+        # so the files can be parsed concurrently.
+        jobs = []
+        for emp_file in emp_files:
+            # A view of the upload Streamlit already holds: the parsers read it in place.
+            file_bytes = emp_file.getbuffer()
+            sheet = None
+            if emp_file.name.lower().endswith((".xlsx", ".xls")):
+                # For Excel files, check if there are multiple sheets. Only the sheet
+                # list is read here; the workbook itself is opened once, when parsed.
+                try:
+                    sheet_names = excel_sheet_names(file_bytes)
+                    if len(sheet_names) > 1:
+                        chosen = st.multiselect(f"Sheets to import from {emp_file.name}", sheet_names, default=sheet_names)
+                        sheet = None if len(chosen) == len(sheet_names) else tuple(chosen)
+                except Exception as e:
+                    st.error(f"Error processing Excel file {emp_file.name}: {e}")
+                    continue
+            jobs.append((emp_file.name, file_bytes, sheet))
+
+        all_emp_data = []
+        fallback = False
+        for result in ingest_employee_files(jobs, use_ai=use_ai_mapping, debug=DEBUG):
+            if result.error:
+                st.error(f"Error processing {result.file_name}: {result.error}")
                 continue
+            if result.fallback:
+                fallback = True
+                st.warning(f"GPT mapping failed for {result.file_name}; its columns were matched locally.")
+            for idx, emp_data in enumerate(result.records):
+                st.subheader(f"Extracted Data from {result.file_name} - Employee {idx+1}")
+                # Uncomment the line below to see the extracted data for debugging
+                # st.write(emp_data)
+            all_emp_data.extend(result.records)
+
+        export_choice = st.selectbox("Download format", ["Same as master", "xlsx", "csv", "parquet"])
+        export_fmt = None if export_choice == "Same as master" else export_choice
+        compress = st.checkbox("Compress download (gzip)", help="Applies to CSV and Parquet downloads.")
+
+        file_keys = tuple(
+            file_fingerprint(name, file_bytes, sheet, use_ai_mapping) for name, file_bytes, sheet in jobs
+        )
+        if master_bytes is None or fallback:
+            # Unreadable master: start from an empty one, as before. Records mapped
+            # by the fallback are merged without caching, so a rerun once GPT is
+            # back maps them properly instead of reusing this best guess.
+            df = pd.DataFrame() if master_bytes is None else load_master_cached(master_bytes, master_file.name)
+            df, summary = merge_records(df, all_emp_data, upsert)
+            output, mime, file_ext = export_master_file(df, master_file.name, fmt=export_fmt, compress=compress)
         else:
-            st.error(f"Unsupported employee file format: {emp_file.name}")
-            continue
+            df, summary, output, mime, file_ext = build_master_cached(
+                master_bytes, master_file.name, file_keys, upsert, export_fmt, compress, all_emp_data
+            )
 
-        for idx, emp_data in enumerate(emp_data_list):
-            st.subheader(f"Extracted Data from {emp_file.name} - Employee {idx+1}")
-            # Uncomment the line below to see the extracted data for debugging
-            # st.write(emp_data)
-            df = append_employee_record(df, emp_data, debug=DEBUG)
+        if summary is not None:
+            st.info(
+                f"{summary['inserted']} employee(s) added, {summary['updated']} updated, "
+                f"{len(summary['conflicts'])} conflict(s) skipped."
+            )
+            for conflict in summary["conflicts"]:
+                st.warning(f"Record {conflict['record'] + 1} skipped: {conflict['reason']}")
+        for col, (count, examples) in unreadable_master_values(df).items():
+            kind = "numbers" if MASTER_SCHEMA[col] == "Float64" else "dates"
+            st.warning(f"{count} value(s) in {col} are not {kind} (e.g. {', '.join(map(repr, examples))}), "
+                       "so the column is kept as text.")
     
-    st.subheader("Current Master Record")
-    st.dataframe(df)
+        st.subheader("Current Master Record")
+        st.dataframe(df)
     
-    output, mime, file_ext = export_master_file(df, master_file.name)
-    st.markdown("<hr>", unsafe_allow_html=True)
-    st.markdown("<h3 style='text-align: center;'>Download Updated Master File</h3>", unsafe_allow_html=True)
-    st.download_button(
-        label="Download Updated Master File",
-        data=output,
-        file_name=f"Updated_Master_File.{file_ext}",
-        mime=mime
-    )
+        st.markdown("<hr>", unsafe_allow_html=True)
+        st.markdown("<h3 style='text-align: center;'>Download Updated Master File</h3>", unsafe_allow_html=True)
+        st.download_button(
+            label="Download Updated Master File",
+            data=output,
+            file_name=f"Updated_Master_File.{file_ext}",
+            mime=mime
+        )
+
+    if show_report:
+        report = instruments.report()
+        with st.sidebar.expander("Performance report", expanded=True):
+            st.caption(f"{report['elapsed_s']:.2f} s for this run")
+            if report["stages"]:
+                st.dataframe(pd.DataFrame.from_dict(report["stages"], orient="index"))
+            st.json(report["counters"])
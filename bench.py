@@ -0,0 +1,1455 @@
+"""
+Offline benchmarks for the onboarding pipeline.
+
+Run with:
+
+    python bench.py                # every benchmark
+    python bench.py append         # only the named benchmark(s)
+    python bench.py --suite --save --report   # stage timings, kept per commit and compared
+
+The regression suite (--suite) times each pipeline stage and the end-to-end
+merge on a fixed synthetic corpus (make_corpus) and appends the results to
+.bench_history.jsonl; --commits REV... measures other commits the same way.
+
+No network access or OpenAI key is needed: AI mapping runs against a
+local fake of the OpenAI API (see FakeOpenAIServer).
+"""
+import ast
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+os.environ.setdefault("GPT_MAPPING_CACHE_PATH", "")
+
+import numpy as np
+import pandas as pd
+
+import logic
+
+
+# =========================
+# Synthetic data helpers
+# =========================
+def make_employee_rows(n, seed=0):
+    """Return n raw employee dicts in the shape parse_docx/parse_pdf produce."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n):
+        day = int(rng.integers(1, 28))
+        month = int(rng.integers(1, 12))
+        rows.append({
+            "Title": "Mr" if i % 2 else "Ms",
+            "Full Name": f"First{i} Surname{i}",
+            "Home Address": f"{i} High Street, Flat {i % 7}, Leeds, West Yorkshire, LS{i % 30} 1AB",
+            "Date of Birth": f"{day}th/{month}/19{70 + i % 30}",
+            "Start Date": f"{day}/{month}/2024",
+            "National Insurance Number": f"QQ{i:06d}C",
+            "Basic Salary": str(20000 + i),
+        })
+    return rows
+
+def make_employee_table(n, seed=0):
+    """Return an n-row employee sheet with Excel-style headers and messy dates."""
+    rng = np.random.default_rng(seed)
+    days = rng.integers(1, 28, n)
+    months = rng.integers(1, 12, n)
+    years = rng.integers(1960, 2004, n)
+    suffixes = np.array(["st", "nd", "rd", "th", ""])[rng.integers(0, 5, n)]
+    return pd.DataFrame({
+        "Title": np.where(np.arange(n) % 2, "Mr", "Ms"),
+        "Firstname": [f"First{i}" for i in range(n)],
+        "Surname": [f"Surname{i}" for i in range(n)],
+        "NI Number": [f"QQ{i:06d}C" for i in range(n)],
+        "Date Of Birth": [f"{d}{s}/{m}/{y}" for d, s, m, y in zip(days, suffixes, months, years)],
+        "Sex": np.where(np.arange(n) % 3, "M", "F"),
+        "Address Line1": [f"{i} High Street" for i in range(n)],
+        "City": "Leeds",
+        "Postcode": "LS1 1AB",
+        # Hire dates repeat heavily, with the odd O/0 and l/1 typo.
+        "Hire Date": np.array(["01/04/2024", "O1/05/2024", "1st June 2024", "0l/07/2024"])[np.arange(n) % 4],
+        "Salary": 20000 + np.arange(n),
+    })
+
+def employee_form_lines(row):
+    """Label/value lines as they appear on a starter form."""
+    return [f"{label}: {value}" for label, value in row.items()]
+
+def make_docx_bytes(lines, filler_paragraphs=0):
+    """Build a DOCX document with one paragraph per line (plus optional filler text)."""
+    import docx
+    document = docx.Document()
+    for line in lines:
+        document.add_paragraph(line)
+    for i in range(filler_paragraphs):
+        document.add_paragraph(f"Terms and conditions paragraph {i}. " * 8)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def make_pdf_bytes(pages):
+    """Build a minimal text PDF. pages is a list of pages, each a list of text lines."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        stream = "BT /F1 10 Tf 12 TL 40 800 Td " + " ".join(f"({_pdf_escape(line)}) '" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        content_id = len(objects)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1"))
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode("latin-1"))
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1"))
+    return out.getvalue()
+
+def _fake_mapping_reply(prompt):
+    # Map each column listed in the prompt by exact name, like a well-behaved model.
+    start = prompt.index("[")
+    columns = ast.literal_eval(prompt[start:prompt.index("]", start) + 1])
+    return json.dumps({col: (col if col in logic.EXCEL_FIELD_MAP else None) for col in columns})
+
+class FakeOpenAIServer:
+    """
+    Local HTTP server speaking enough of the OpenAI chat completions API for
+    gpt_map_columns. While running, openai.api_base points at it. Every request
+    body is kept in .requests; latency adds a delay to each response and
+    fail_first makes that many initial requests return HTTP 500.
+
+        with FakeOpenAIServer(latency=0.2) as server:
+            logic.gpt_map_columns(["Surname"], logic.EXCEL_FIELD_MAP)
+    """
+    def __init__(self, latency=0.0, fail_first=0):
+        self.latency = latency
+        self.fail_first = fail_first
+        self.requests = []
+
+    def __enter__(self):
+        import http.server
+        import threading
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                server.requests.append(body)
+                time.sleep(server.latency)
+                if len(server.requests) <= server.fail_first:
+                    payload, status = {"error": {"message": "fake outage", "type": "server_error"}}, 500
+                else:
+                    prompt = body["messages"][-1]["content"]
+                    content = _fake_mapping_reply(prompt)
+                    payload, status = {
+                        "id": "fake", "object": "chat.completion", "model": body.get("model"),
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": content}}],
+                        "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4},
+                    }, 200
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                try:
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client gave up on this request (timeout)
+
+        self._httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        self._saved_api_base = logic.openai.api_base
+        logic.openai.api_base = f"http://127.0.0.1:{self._httpd.server_address[1]}/v1"
+        self.url = logic.openai.api_base
+        if hasattr(logic, "MAPPING_CACHE"):
+            logic.MAPPING_CACHE.clear()
+        return self
+
+    def __exit__(self, *exc):
+        logic.openai.api_base = self._saved_api_base
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+def make_master(n):
+    """Return an n-row master DataFrame with the standard master columns."""
+    records = [logic.map_employee_data(row) for row in make_employee_rows(min(n, 500))]
+    # MASTER_COLUMNS is missing from the oldest commits the regression suite runs against.
+    columns = getattr(logic, "MASTER_COLUMNS", None) or list(logic.map_employee_data({}))
+    if not records:
+        return pd.DataFrame(columns=columns)
+    base = pd.DataFrame(records, columns=columns)
+    reps = -(-n // len(base))
+    return pd.concat([base] * reps, ignore_index=True).iloc[:n]
+
+def _timeit(func, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+# =========================
+# Benchmarks
+# =========================
+def bench_append(master_sizes=(1_000, 10_000, 50_000), batch_sizes=(10, 100, 1_000)):
+    """Row-by-row append_employee_record vs the batched append_employee_records."""
+    print("append: master_rows batch  per_row_s  batch_s  speedup")
+    for m in master_sizes:
+        master = make_master(m)
+        for n in batch_sizes:
+            batch = [logic.map_employee_data(row) for row in make_employee_rows(n, seed=n)]
+
+            def per_row():
+                df = master
+                for record in batch:
+                    df = logic.append_employee_record(df, record)
+                return df
+
+            repeat = 1 if m * n > 5_000_000 else 3
+            t_row = _timeit(per_row, repeat=repeat)
+            t_batch = _timeit(lambda: logic.append_employee_records(master, batch), repeat=repeat)
+            print(f"append: {m:>11} {n:>5}  {t_row:9.4f}  {t_batch:7.4f}  {t_row / t_batch:6.1f}x")
+
+def _same_records(expected, actual):
+    if len(expected) != len(actual):
+        return False
+    for left, right in zip(expected, actual):
+        if list(left) != list(right):
+            return False
+        for key in left:
+            if pd.isnull(left[key]) and pd.isnull(right[key]):
+                continue
+            if left[key] != right[key]:
+                return False
+    return True
+
+def bench_excel_mapping(sizes=(1_000, 10_000, 50_000)):
+    """iterrows + map_excel_employee_data vs map_excel_employee_frame."""
+    print("excel_mapping: rows  per_row_s  frame_s  speedup  identical")
+    for n in sizes:
+        df = make_employee_table(n, seed=n)
+        per_row = [logic.map_excel_employee_data(row.to_dict()) for _, row in df.iterrows()]
+        frame = logic.map_excel_employee_frame(df).to_dict("records")
+        t_row = _timeit(lambda: [logic.map_excel_employee_data(row.to_dict()) for _, row in df.iterrows()], repeat=1)
+        t_frame = _timeit(lambda: logic.map_excel_employee_frame(df).to_dict("records"))
+        identical = _same_records(per_row, frame)
+        print(f"excel_mapping: {n:>5}  {t_row:9.4f}  {t_frame:7.4f}  {t_row / t_frame:6.1f}x  {identical}")
+        assert identical, f"map_excel_employee_frame differs from map_excel_employee_data on {n} rows"
+
+def bench_dates(sizes=(1_000, 10_000, 100_000)):
+    """Scalar robust_parse_date_str over a column vs robust_parse_dates."""
+    print("dates: rows  column  scalar_s  series_s  speedup  identical")
+    for n in sizes:
+        df = make_employee_table(n, seed=n)
+        for column in ("Date Of Birth", "Hire Date"):
+            values = df[column]
+            scalar = values.map(logic.robust_parse_date_str)
+            series = logic.robust_parse_dates(values)
+            identical = bool(((scalar == series) | (scalar.isna() & series.isna())).all())
+            t_scalar = _timeit(lambda: values.map(logic.robust_parse_date_str), repeat=1)
+            t_series = _timeit(lambda: logic.robust_parse_dates(values))
+            print(f"dates: {n:>6}  {column:<13}  {t_scalar:8.4f}  {t_series:8.4f}  {t_scalar / t_series:6.1f}x  {identical}")
+            assert identical, f"robust_parse_dates differs from robust_parse_date_str on {column} ({n} rows)"
+
+def bench_ingest(n_files=(8, 32), latency=0.2):
+    """Sequential per-file parsing vs ingest_employee_files, with a stubbed GPT latency."""
+    print("ingest: files  use_ai  sequential_s  concurrent_s  speedup")
+    rows = make_employee_rows(max(n_files))
+    for n in n_files:
+        files = []
+        for i in range(n):
+            lines = employee_form_lines(rows[i])
+            if i % 2:
+                files.append((f"starter_{i}.pdf", make_pdf_bytes([lines] + [[f"Page filler {p}"] * 40 for p in range(5)])))
+            else:
+                files.append((f"starter_{i}.docx", make_docx_bytes(lines, filler_paragraphs=200)))
+        for use_ai in (False, True):
+            with FakeOpenAIServer(latency=latency):
+                logic.MAPPING_CACHE.maxsize = 0
+                t_seq = _timeit(lambda: [logic.parse_employee_file(name, data, use_ai=use_ai) for name, data in files], repeat=1)
+                t_conc = _timeit(lambda: logic.ingest_employee_files(files, use_ai=use_ai, max_workers=8, use_cache=False), repeat=1)
+                logic.MAPPING_CACHE.maxsize = 256
+            print(f"ingest: {n:>5}  {str(use_ai):>6}  {t_seq:12.3f}  {t_conc:12.3f}  {t_seq / t_conc:6.1f}x")
+
+def _legacy_extract(lines):
+    # The nested line x label loop parse_docx/parse_pdf used before the compiled matcher.
+    data = {}
+    for i, line in enumerate(lines):
+        for key in logic.FIELD_MAP:
+            if line.lower().startswith(key.lower()):
+                potential_value = line[len(key):].strip(" :")
+                if potential_value:
+                    data[logic.FIELD_MAP[key]] = potential_value
+                    break
+                elif line.strip().lower() == key.lower() and (i + 1) < len(lines):
+                    data[logic.FIELD_MAP[key]] = lines[i + 1].strip()
+                    break
+    return data
+
+def bench_labels(line_counts=(100, 1_000, 10_000, 100_000)):
+    """Nested label loop vs extract_fields_from_lines on long documents."""
+    print("labels: lines  legacy_s  compiled_s  speedup")
+    form = employee_form_lines(make_employee_rows(1)[0])
+    for n in line_counts:
+        filler = [f"Clause {i}: the employee agrees to the terms set out above." for i in range(n - len(form))]
+        lines = form + filler
+        t_legacy = _timeit(lambda: _legacy_extract(lines), repeat=1)
+        t_compiled = _timeit(lambda: logic.extract_fields_from_lines(lines))
+        print(f"labels: {n:>6}  {t_legacy:8.4f}  {t_compiled:10.4f}  {t_legacy / t_compiled:6.1f}x")
+
+def bench_rerun(n_files=20):
+    """First ingest of n files vs a Streamlit-style rerun served from PARSE_CACHE."""
+    rows = make_employee_rows(n_files)
+    files = [(f"starter_{i}.docx", make_docx_bytes(employee_form_lines(rows[i]), filler_paragraphs=200)) for i in range(n_files)]
+    files.append(("starters.csv", make_employee_table(5_000).to_csv(index=False).encode("utf-8")))
+    logic.PARSE_CACHE.clear()
+    t_cold = _timeit(lambda: logic.ingest_employee_files(files), repeat=1)
+    t_warm = _timeit(lambda: logic.ingest_employee_files(files))
+    print(f"rerun: files={len(files)}  cold_s={t_cold:.4f}  warm_s={t_warm:.4f}  speedup={t_cold / t_warm:.0f}x")
+
+def _peak_rss_mb():
+    import resource
+    # ru_maxrss is in KiB on Linux and bytes on macOS.
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+def _in_child(func, *args):
+    """Run func(*args) in a fresh process and return its result (for clean peak-RSS readings)."""
+    import multiprocessing
+    ctx = multiprocessing.get_context("fork")
+    with ctx.Pool(1) as pool:
+        return pool.apply(func, args)
+
+def _export_child(rows, fmt, compress, legacy):
+    df = make_master(rows)
+    before = _peak_rss_mb()
+    start = time.perf_counter()
+    if legacy:
+        output = df.to_csv(index=False).encode("utf-8")
+    else:
+        output = logic.export_master_file(df, "master.csv", fmt=fmt, compress=compress)[0]
+    elapsed = time.perf_counter() - start
+    return elapsed, _peak_rss_mb() - before, len(output)
+
+def bench_export(rows=100_000):
+    """Time and extra peak RSS of exporting an n-row master, per format."""
+    print(f"export: rows={rows}")
+    print("export: format         time_s  extra_peak_rss_mb  size_mb")
+    cases = [("csv (legacy)", "csv", False, True), ("csv", "csv", False, False), ("csv.gz", "csv", True, False),
+             ("xlsx", "xlsx", False, False), ("parquet", "parquet", False, False), ("parquet+gzip", "parquet", True, False)]
+    for label, fmt, compress, legacy in cases:
+        try:
+            elapsed, extra_rss, size = _in_child(_export_child, rows, fmt, compress, legacy)
+        except ImportError as e:
+            print(f"export: {label:<13}  skipped ({e})")
+            continue
+        print(f"export: {label:<13} {elapsed:7.2f}  {extra_rss:17.1f}  {size / 1e6:7.1f}")
+
+def _master_child(path, file_name, lazy, n_new):
+    new = [logic.map_employee_data(row) for row in make_employee_rows(n_new, seed=1)]
+    before = _peak_rss_mb()
+    start = time.perf_counter()
+    master = logic.load_master_file(path, file_name, lazy=lazy)
+    if lazy:
+        master.append(new)
+    else:
+        master = logic.append_employee_records(master, new)
+    load_rss = _peak_rss_mb() - before
+    with tempfile.TemporaryFile() as out:
+        logic.write_master_file(master, out, fmt=logic.master_export_format(file_name))
+    return time.perf_counter() - start, load_rss, _peak_rss_mb() - before
+
+def bench_master(rows=200_000, n_new=20):
+    """Eager vs lazy master: load + append n_new hires + export in the same format."""
+    print(f"master: rows={rows} new_hires={n_new}")
+    print("master: format  mode    total_s  load_extra_rss_mb  total_extra_rss_mb")
+    df = make_master(rows)
+    with tempfile.TemporaryDirectory() as tmp:
+        for ext in ("csv", "xlsx"):
+            if ext == "xlsx" and rows > 50_000:
+                df = df.iloc[:50_000]
+            path = os.path.join(tmp, f"master.{ext}")
+            logic.write_master_file(df, path, fmt=ext)
+            for lazy in (False, True):
+                elapsed, load_rss, total_rss = _in_child(_master_child, path, f"master.{ext}", lazy, n_new)
+                mode = "lazy" if lazy else "eager"
+                print(f"master: {ext:<6}  {mode:<6}  {elapsed:7.2f}  {load_rss:17.1f}  {total_rss:18.1f}  ({len(df)} rows)")
+
+def bench_upsert(master_sizes=(10_000, 100_000), batch_sizes=(100, 5_000)):
+    """upsert_employee_records on a master where half of each batch is already present."""
+    print("upsert: master_rows  batch  time_s  us_per_record  inserted  updated  conflicts")
+    for m in master_sizes:
+        master = make_master(m)
+        # make_master repeats 500 people; give every row its own NI number.
+        master["NINumber"] = [f"QQ{i:06d}C" for i in range(m)]
+        for n in batch_sizes:
+            batch = [logic.map_employee_data(row) for row in make_employee_rows(n, seed=n)]
+            for i, record in enumerate(batch):
+                if i % 2:
+                    # Returning employee: same person as master row i, with a pay rise.
+                    record.update(master.iloc[i].to_dict())
+                    record["PensionableSalary"] = "50000"
+                else:
+                    record["NINumber"] = f"QQ{m + i:06d}C"
+            start = time.perf_counter()
+            _, summary = logic.upsert_employee_records(master, batch)
+            elapsed = time.perf_counter() - start
+            print(f"upsert: {m:>11}  {n:>5}  {elapsed:6.3f}  {elapsed / n * 1e6:13.1f}  "
+                  f"{summary['inserted']:>8}  {summary['updated']:>7}  {len(summary['conflicts']):>9}")
+
+def bench_gpt_batch(n_documents=(10, 50), latency=0.05):
+    """Per-document GPT mapping calls vs one gpt_map_column_sets batch (fake OpenAI server)."""
+    print("gpt_batch: docs  mode       requests  prompt_tokens  completion_tokens  time_s")
+    extra_fields = ["Pronouns", "Nationality", "Notes", "Job Title", "Marital Status", "Emergency Contact Name"]
+    for n in n_documents:
+        records = make_employee_rows(n)
+        for i, record in enumerate(records):
+            # Different forms carry different optional fields.
+            for field in extra_fields[: i % len(extra_fields)]:
+                record[field] = "x"
+        for mode in ("per-doc", "batched"):
+            for key in logic.GPT_STATS:
+                logic.GPT_STATS[key] = 0
+            with FakeOpenAIServer(latency=latency) as server:
+                start = time.perf_counter()
+                if mode == "per-doc":
+                    logic.MAPPING_CACHE.maxsize = 0
+                    for record in records:
+                        logic.apply_ai_mapping_to_dict(record, use_ai=True)
+                    logic.MAPPING_CACHE.maxsize = 256
+                else:
+                    logic.gpt_map_column_sets([list(record) for record in records], logic.EXCEL_FIELD_MAP, use_cache=False)
+                elapsed = time.perf_counter() - start
+            stats = logic.GPT_STATS
+            print(f"gpt_batch: {n:>4}  {mode:<9}  {len(server.requests):>8}  {stats['prompt_tokens']:>13}  "
+                  f"{stats['completion_tokens']:>17}  {elapsed:6.2f}")
+
+def bench_gpt_latency(n_uploads=6, latency=2.0, timeout=0.25):
+    """Upload latency against a hung OpenAI endpoint, with the circuit breaker cutting over to local matching."""
+    print("gpt_latency: upload  requests_sent  retries  short_circuits  time_s")
+    client = logic.GPT_CLIENT
+    saved = (client.timeout, client.deadline, client.backoff_base)
+    client.timeout, client.deadline, client.backoff_base = timeout, 4 * timeout, 0.05
+    client.reset()
+    try:
+        with FakeOpenAIServer(latency=latency) as server:
+            for i in range(n_uploads):
+                start = time.perf_counter()
+                logic.gpt_map_columns(["Surname", "Forename", f"Extra {i}"], logic.EXCEL_FIELD_MAP)
+                elapsed = time.perf_counter() - start
+                print(f"gpt_latency: {i + 1:>6}  {len(server.requests):>13}  {client.stats['retries']:>7}  "
+                      f"{client.stats['short_circuits']:>14}  {elapsed:6.2f}")
+    finally:
+        client.timeout, client.deadline, client.backoff_base = saved
+        client.reset()
+    print(f"gpt_latency: server latency {latency:.1f}s; without a timeout each upload would wait at least that long")
+
+class StubChatCompletion:
+    """
+    Stands in for openai.ChatCompletion.acreate in-process: answers like
+    FakeOpenAIServer and counts the calls.
+    """
+    def __init__(self):
+        self.calls = 0
+
+    def __enter__(self):
+        self._saved = logic.openai.ChatCompletion.acreate
+        logic.openai.ChatCompletion.acreate = self.acreate
+        return self
+
+    def __exit__(self, *exc):
+        logic.openai.ChatCompletion.acreate = self._saved
+
+    async def acreate(self, messages, **kwargs):
+        self.calls += 1
+        content = _fake_mapping_reply(messages[-1]["content"])
+        return logic.openai.openai_object.OpenAIObject.construct_from(
+            {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]}
+        )
+
+def bench_mapping_cache():
+    """MappingCache tiers against a stubbed ChatCompletion: memory hit, disk hit, TTL expiry, field-map change."""
+    columns = ["Pronouns", "Employee ID", "Department"]  # nothing ColumnMatcher resolves locally
+    field_map = dict(logic.EXCEL_FIELD_MAP)
+    saved_cache = logic.MAPPING_CACHE
+    with tempfile.TemporaryDirectory() as tmp, StubChatCompletion() as stub:
+        path = os.path.join(tmp, "mappings.sqlite3")
+        logic.GPT_CLIENT.reset()
+
+        def check(label, cache, mapped_columns, expect_calls, expect_stat):
+            logic.MAPPING_CACHE = cache
+            before_calls, before = stub.calls, dict(cache.stats)
+            logic.gpt_map_columns(columns, mapped_columns)
+            calls = stub.calls - before_calls
+            hit = next((key for key in cache.stats if cache.stats[key] != before[key]), None)
+            ok = calls == expect_calls and hit == expect_stat
+            print(f"mapping_cache: {label:<22} api_calls={calls}  {hit:<12}  {'ok' if ok else 'FAILED'}")
+            assert ok, f"{label}: {calls} API call(s), {hit}"
+
+        try:
+            cache = logic.MappingCache(path=path)
+            check("first lookup", cache, field_map, 1, "misses")
+            check("repeat", cache, field_map, 0, "memory_hits")
+            check("new process", logic.MappingCache(path=path), field_map, 0, "disk_hits")
+            check("field map changed", cache, dict(field_map, Pronouns="Pronouns"), 1, "misses")
+            memory_only = logic.MappingCache(path=None, ttl=0.2)
+            check("memory, fresh", memory_only, field_map, 1, "misses")
+            check("memory, within ttl", memory_only, field_map, 0, "memory_hits")
+            time.sleep(0.3)
+            check("memory, expired", memory_only, field_map, 1, "misses")
+            renamed = dict(field_map, Extra="Extra")
+            check("disk, fresh", logic.MappingCache(path=path, ttl=0.2), renamed, 1, "misses")
+            check("disk, within ttl", logic.MappingCache(path=path, ttl=0.2), renamed, 0, "disk_hits")
+            time.sleep(0.3)
+            check("disk, expired", logic.MappingCache(path=path, ttl=0.2), renamed, 1, "misses")
+        finally:
+            logic.MAPPING_CACHE = saved_cache
+            logic.GPT_CLIENT.reset()
+
+# Headers seen on real starter spreadsheets, with the field a person would map them to
+# (None: nothing in EXCEL_FIELD_MAP fits, so GPT or a human has to decide).
+SAMPLE_HEADERS = [
+    ("Surname", "Surname"), ("Employee Surname", "Surname"), ("Last Name", "Surname"), ("Family name", "Surname"),
+    ("Firstname", "First Name"), ("First name", "First Name"), ("Forename", "First Name"), ("Given Name", "First Name"),
+    ("Title", "Title"), ("NI Number", "National Insurance Number"), ("NI No", "National Insurance Number"),
+    ("National Insurance No.", "National Insurance Number"), ("NINO", "National Insurance Number"),
+    ("Date Of Birth", "Date of Birth"), ("Date of birth (dd/mm/yyyy)", "Date of Birth"), ("DOB", "Date of Birth"),
+    ("Birth Date", "Date of Birth"), ("Sex", "Gender"), ("Gender", "Gender"), ("Marital status", "Marital Status"),
+    ("Address Line1", "Address 1"), ("Address line 2", "Address 2"), ("Address 3", "Address 3"),
+    ("Adress Line4", "Address 4"), ("Home Address", "Home Address"), ("Town", "City"), ("City", "City"),
+    ("County", "County"), ("Country", "Country of Residence"), ("Postcode", "Post Code"),
+    ("Post Code", "Post Code"), ("Home Post Code", "Post Code"), ("Hire Date", "Start Date"),
+    ("Start date", "Start Date"), ("Position", "Job Title"), ("Job Title", "Job Title"),
+    ("Email", "Personal Email Address"), ("E-mail address", "Personal Email Address"),
+    ("Mobile No.", "Mobile Telephone Number"), ("Mobile Telephone Number", "Mobile Telephone Number"),
+    ("Salary", "Basic Salary"), ("Basic Annual Salary", "Basic Salary"), ("Salary (GBP)", "Basic Salary"),
+    ("Annual salary", "Basic Salary"), ("CategoryName", "Category Name"),
+    ("Employee ID", None), ("Department", None), ("Line Manager", None), ("Notes", None),
+    ("Emergency Contact Telephone Number", None), ("Date Joined", "Start Date"), ("Ref", "National Insurance Number"),
+]
+SAMPLE_VALUES = {"Ref": ["AB123456C", "JK 65 43 21 A", "ZX112233B"]}
+# Master column each field of SAMPLE_HEADERS should end up in (None: the master has no column for it).
+FIELD_MASTER_COLUMNS = {
+    "Surname": "Surname*", "First Name": "FirstName*", "Title": "Title", "National Insurance Number": "NINumber",
+    "Date of Birth": "DateofBirth*", "Gender": "Gender", "Marital Status": None, "Address 1": "AddressLine1",
+    "Address 2": "AddressLine2", "Address 3": "AddressLine3", "Address 4": "AddressLine4",
+    "Home Address": "AddressLine1", "City": "CityTown", "County": "County", "Country of Residence": "Country",
+    "Post Code": "PostCode", "Start Date": "DateJoinedScheme", "Job Title": None,
+    "Personal Email Address": "EmailAddress", "Mobile Telephone Number": "MobileNumber",
+    "Basic Salary": "PensionableSalary", "Category Name": "CategoryName",
+}
+
+def _master_column_for(name):
+    # The master column a spreadsheet column called name is read into, if any.
+    filled = set()
+    for marker in ("12345", "01/02/1934"):
+        row = logic.map_excel_employee_frame(pd.DataFrame({name: [marker]})).iloc[0]
+        filled.update(col for col, value in row.items() if not pd.isna(value))
+    filled.discard("PensionableSalaryStartDate")  # a copy of DateJoinedScheme
+    return next(iter(filled), None)
+
+def _legacy_exact_match(df_columns, mapped_columns):
+    # The case-insensitive exact comparison gpt_map_columns fell back to before ColumnMatcher.
+    mapping = {}
+    for col in df_columns:
+        mapped_field = None
+        for key, value in mapped_columns.items():
+            if col.lower() == key.lower() or col.lower() == value.lower():
+                mapped_field = value
+                break
+        mapping[col] = mapped_field
+    return mapping
+
+def bench_column_matcher(repeat=200):
+    """Exact fallback vs ColumnMatcher on SAMPLE_HEADERS: columns resolved without GPT, accuracy, time per column."""
+    headers = [header for header, _ in SAMPLE_HEADERS]
+    expected = dict(SAMPLE_HEADERS)
+    matcher = logic.column_matcher(logic.EXCEL_FIELD_MAP)
+    runs = {
+        "exact": lambda: ({col: field for col, field in _legacy_exact_match(headers, logic.EXCEL_FIELD_MAP).items() if field},
+                          None),
+        "matcher": lambda: matcher.map_columns(headers, SAMPLE_VALUES),
+    }
+    print("column_matcher: mode     local  to_gpt  correct  wrong  us_per_column")
+    for mode, run in runs.items():
+        mapping, _ = run()
+        elapsed = _timeit(lambda: [run() for _ in range(repeat)], repeat=1) / repeat
+        correct = sum(1 for col, field in mapping.items() if expected[col] == field)
+        print(f"column_matcher: {mode:<7}  {len(mapping):>5}  {len(headers) - len(mapping):>6}  {correct:>7}  "
+              f"{len(mapping) - correct:>5}  {elapsed / len(headers) * 1e6:13.1f}")
+    for col, field in matcher.map_columns(headers, SAMPLE_VALUES)[0].items():
+        if expected[col] != field:
+            print(f"column_matcher: mismatch {col!r} -> {field!r} (expected {expected[col]!r})")
+    # A mapped column is only useful if the spreadsheet reader picks it up: the matcher
+    # answers with EXCEL_FIELD_MAP values, GPT with its keys, and both must reach the master.
+    reached, lost = 0, []
+    for col, field in matcher.map_columns(headers, SAMPLE_VALUES)[0].items():
+        target = FIELD_MASTER_COLUMNS.get(expected[col])
+        if _master_column_for(field) == target:
+            reached += target is not None
+        else:
+            lost.append((col, field, target))
+    print(f"column_matcher: {reached} mapped columns reach their master column, {len(lost)} do not")
+    for col, field, target in lost:
+        print(f"column_matcher: {col!r} -> {field!r} does not reach {target!r}")
+    for key, value in logic.EXCEL_FIELD_MAP.items():
+        assert _master_column_for(key) == _master_column_for(value) == FIELD_MASTER_COLUMNS[value], (key, value)
+    assert not lost
+
+def make_docx_table_form(fields, filler_rows=0, header="Title: Employee Onboarding Form"):
+    """
+    A two-column DOCX form (label cell, value cell) with a page header. A list
+    value becomes a multi-paragraph cell; filler_rows adds unlabelled
+    terms-and-conditions rows after the form.
+    """
+    import docx
+    document = docx.Document()
+    document.sections[0].header.paragraphs[0].text = header
+    table = document.add_table(rows=0, cols=2)
+    for label, value in list(fields.items()) + [(f"Clause {i}", "The employee agrees to the terms. " * 4) for i in range(filler_rows)]:
+        cells = table.add_row().cells
+        cells[0].text = label
+        values = value if isinstance(value, list) else [value]
+        cells[1].text = values[0]
+        for extra in values[1:]:
+            cells[1].add_paragraph(extra)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+def _legacy_parse_docx(file_bytes):
+    # parse_docx before the structured reader: docx2txt text dump, split into lines.
+    import docx2txt
+    text = docx2txt.process(io.BytesIO(file_bytes))
+    return logic.extract_fields_from_lines([line.strip() for line in text.split("\n") if line.strip()])
+
+def bench_docx(filler_rows=(0, 500, 5_000), n_forms=20):
+    """docx2txt text dump vs the structured DOCX reader: time on large table forms, accuracy on awkward ones."""
+    print("docx: filler_rows  legacy_s  structured_s  speedup")
+    row = make_employee_rows(1)[0]
+    for n in filler_rows:
+        form = make_docx_table_form(row, filler_rows=n)
+        t_legacy = _timeit(lambda: _legacy_parse_docx(form))
+        t_new = _timeit(lambda: logic.parse_docx(form))
+        print(f"docx: {n:>11}  {t_legacy:8.3f}  {t_new:12.3f}  {t_legacy / t_new:6.1f}x")
+    # Forms as people fill them in: multi-line addresses and some fields left blank.
+    print("docx: reader      fields_correct  fields_wrong  fields_expected")
+    forms = []
+    for i, record in enumerate(make_employee_rows(n_forms)):
+        fields = dict(record)
+        fields["Home Address"] = [part.strip() for part in fields["Home Address"].split(",")]
+        blank = list(fields)[i % len(fields)]
+        fields[blank] = ""
+        expected = {
+            logic.FIELD_MAP[label]: ", ".join(value) if isinstance(value, list) else value
+            for label, value in fields.items() if value
+        }
+        forms.append((make_docx_table_form(fields), expected))
+    for name, reader in (("legacy", _legacy_parse_docx), ("structured", logic.parse_docx)):
+        correct = wrong = total = 0
+        for form, expected in forms:
+            data = reader(form)
+            total += len(expected)
+            correct += sum(1 for field, value in expected.items() if data.get(field) == value)
+            wrong += sum(1 for field, value in data.items() if expected.get(field) != value)
+        print(f"docx: {name:<10}  {correct:>14}  {wrong:>12}  {total:>15}")
+
+def _legacy_parse_pdf(file_bytes):
+    # parse_pdf before page streaming: every page extracted, text built with +=.
+    import PyPDF2
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_bytes))
+    text = ""
+    for page in pdf_reader.pages:
+        page_text = page.extract_text()
+        if page_text:
+            text += page_text + "\n"
+    lines = [line.strip() for line in text.split("\n") if line.strip()]
+    return logic.extract_fields_from_lines(lines)
+
+def make_starter_pack_pdf(n_pages, lines_per_page=45):
+    """A complete starter form over the first two pages, followed by n_pages - 2 pages of terms."""
+    labels = {}
+    for label, field in logic.FIELD_MAP.items():
+        if field in logic.FORM_FIELDS:
+            labels.setdefault(field, label)
+    form = [f"{label}: value {i}" for i, label in enumerate(labels.values())]
+    pages = [form[: len(form) // 2], form[len(form) // 2:]]
+    for p in range(n_pages - 2):
+        pages.append([f"Clause {p}.{i}: the employee agrees to the terms set out above." for i in range(lines_per_page)])
+    return make_pdf_bytes(pages)
+
+def bench_pdf(page_counts=(2, 30, 120), processes=4):
+    """Whole-document parse_pdf vs page streaming with early stop, and page-parallel extraction without it."""
+    print("pdf: pages  legacy_s  stream_s  early_stop_s  parallel_s  speedup_early  speedup_parallel")
+    for n in page_counts:
+        pdf = make_starter_pack_pdf(n)
+        expected = _legacy_parse_pdf(pdf)
+        assert logic.parse_pdf(pdf) == expected
+        assert logic.parse_pdf(pdf, stop_fields=None, processes=processes) == expected
+        t_legacy = _timeit(lambda: _legacy_parse_pdf(pdf), repeat=1)
+        t_stream = _timeit(lambda: logic.parse_pdf(pdf, stop_fields=None), repeat=1)
+        t_early = _timeit(lambda: logic.parse_pdf(pdf))
+        t_parallel = _timeit(lambda: logic.parse_pdf(pdf, stop_fields=None, processes=processes), repeat=1)
+        print(f"pdf: {n:>5}  {t_legacy:8.3f}  {t_stream:8.3f}  {t_early:12.4f}  {t_parallel:10.3f}  "
+              f"{t_legacy / t_early:12.1f}x  {t_legacy / t_parallel:15.1f}x")
+
+def bench_cli(n_files=400, master_rows=50_000, batch_size=50):
+    """End-to-end onboarding.merge over a directory: cold run, and a run resumed after an interruption halfway."""
+    import onboarding
+    rows = make_employee_rows(n_files)
+    with tempfile.TemporaryDirectory() as tmp:
+        inputs = os.path.join(tmp, "inputs")
+        os.mkdir(inputs)
+        for i, row in enumerate(rows):
+            lines = employee_form_lines(row)
+            if i % 2:
+                with open(os.path.join(inputs, f"starter_{i}.pdf"), "wb") as f:
+                    f.write(make_pdf_bytes([lines, [f"Clause {j}" for j in range(40)]]))
+            else:
+                with open(os.path.join(inputs, f"starter_{i}.docx"), "wb") as f:
+                    f.write(make_docx_bytes(lines, filler_paragraphs=20))
+        make_employee_table(2_000).to_csv(os.path.join(inputs, "bulk_starters.csv"), index=False)
+        master = os.path.join(tmp, "master.csv")
+        make_master(master_rows).to_csv(master, index=False)
+
+        start = time.perf_counter()
+        summary = onboarding.merge(master, [inputs], batch_size=batch_size, progress=None)
+        t_cold = time.perf_counter() - start
+
+        def interrupt(done, total, parsed, failed, rate):
+            if done >= total // 2:
+                raise KeyboardInterrupt
+        try:
+            onboarding.merge(master, [inputs], batch_size=batch_size, progress=interrupt, resume=False)
+        except KeyboardInterrupt:
+            pass
+        start = time.perf_counter()
+        resumed = onboarding.merge(master, [inputs], batch_size=batch_size, progress=None)
+        t_resume = time.perf_counter() - start
+    print(f"cli: files={summary['files']}  records={summary['records']}  master_rows={master_rows}  "
+          f"cold_s={t_cold:.2f} ({summary['files'] / t_cold:.0f} files/s)  "
+          f"resumed_s={t_resume:.2f} (skipped {resumed['resumed']} parsed files)")
+
+IMPORT_PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import logic
+elapsed = time.perf_counter() - start
+if sys.argv[1] == "eager":
+    # What importing logic used to load up front.
+    import streamlit
+    logic.openai.ChatCompletion, logic.PyPDF2.PdfReader, logic.etree.fromstring
+    import docx, docx2txt
+    elapsed = time.perf_counter() - start
+scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+print(json.dumps({"seconds": elapsed, "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+                  "modules": len(sys.modules)}))
+"""
+
+def bench_import(repeat=3):
+    """Cold-start cost of importing logic in a fresh interpreter, lazy vs everything loaded up front."""
+    import subprocess
+    env = dict(os.environ)
+    env.pop("OPENAI_API_KEY", None)  # importing must not need a key
+    here = os.path.dirname(os.path.abspath(__file__))
+    print("import: mode   seconds  rss_mb  modules")
+    for mode in ("lazy", "eager"):
+        runs = []
+        for _ in range(repeat):
+            out = subprocess.run([sys.executable, "-W", "ignore", "-c", IMPORT_PROBE, mode], cwd=here, env=env,
+                                 capture_output=True, text=True, check=True).stdout
+            runs.append(json.loads(out.strip().splitlines()[-1]))
+        best = min(runs, key=lambda run: run["seconds"])
+        print(f"import: {mode:<5}  {best['seconds']:7.3f}  {best['rss_mb']:6.1f}  {best['modules']:7d}")
+
+def _untyped_append(df, records):
+    # append_employee_records before MASTER_SCHEMA: one concat, dtypes left to inference.
+    columns = list(dict.fromkeys(list(df.columns) + logic.MASTER_COLUMNS))
+    new_rows = pd.DataFrame([{col: record.get(col, np.nan) for col in columns} for record in records], columns=columns)
+    return pd.concat([df.reindex(columns=columns), new_rows], ignore_index=True)
+
+def bench_schema(master_rows=100_000, batch_size=1_000):
+    """Untyped vs MASTER_SCHEMA master: memory, load from CSV, append and upsert time."""
+    master = make_master(master_rows)
+    master["NINumber"] = [f"QQ{i:06d}C" for i in range(master_rows)]
+    master["Gender"] = np.where(np.arange(master_rows) % 3, "M", "F")
+    master["Country"] = "United Kingdom"
+    csv_bytes = master.to_csv(index=False).encode("utf-8")
+    batch = [logic.map_employee_data(row) for row in make_employee_rows(batch_size, seed=1)]
+
+    t_load_raw = _timeit(lambda: pd.read_csv(io.BytesIO(csv_bytes)), repeat=1)
+    untyped = pd.read_csv(io.BytesIO(csv_bytes))
+    t_load_typed = _timeit(lambda: logic.load_master_file(io.BytesIO(csv_bytes), "master.csv"), repeat=1)
+    typed = logic.load_master_file(io.BytesIO(csv_bytes), "master.csv")
+    mem_untyped = untyped.memory_usage(deep=True).sum() / 2**20
+    mem_typed = typed.memory_usage(deep=True).sum() / 2**20
+    t_append_untyped = _timeit(lambda: _untyped_append(untyped, batch))
+    t_append_typed = _timeit(lambda: logic.append_employee_records(typed, batch))
+    t_upsert = _timeit(lambda: logic.upsert_employee_records(typed, batch), repeat=1)
+    print(f"schema: master_rows={master_rows}  batch={batch_size}")
+    print("schema: master   memory_mb  load_s  append_s  upsert_s")
+    print(f"schema: untyped  {mem_untyped:9.1f}  {t_load_raw:6.2f}  {t_append_untyped:8.3f}  {'-':>8}")
+    print(f"schema: typed    {mem_typed:9.1f}  {t_load_typed:6.2f}  {t_append_typed:8.3f}  {t_upsert:8.3f}")
+    print("schema: typed dtypes:", dict(typed.dtypes.astype(str).value_counts()))
+
+def _instrumented_run(files, master, debug):
+    results = logic.ingest_employee_files(files, max_processes=0, use_cache=False, debug=debug)
+    records = [record for result in results for record in result.records]
+    logic.append_employee_records(master, records, debug=debug)
+
+def bench_instrumentation(n_documents=20, csv_rows=5_000, master_rows=10_000):
+    """Cost of debug logging and of stage timers/cProfile on an ingest + append run."""
+    import logging
+    rows = make_employee_rows(n_documents)
+    files = [(f"starter_{i}.docx", make_docx_bytes(employee_form_lines(rows[i]), filler_paragraphs=200))
+             for i in range(n_documents)]
+    files.append(("starters.csv", make_employee_table(csv_rows).to_csv(index=False).encode("utf-8")))
+    master = logic.apply_master_schema(make_master(master_rows))
+    sink = logging.StreamHandler(open(os.devnull, "w"))
+    level = logic.LOGGER.level
+    logic.LOGGER.addHandler(sink)
+    try:
+        _instrumented_run(files, master, debug=False)  # warm-up
+        logic.LOGGER.setLevel(logging.DEBUG)
+        t_debug = _timeit(lambda: _instrumented_run(files, master, debug=True), repeat=5)
+        logic.LOGGER.setLevel(logging.WARNING)
+        t_off = _timeit(lambda: _instrumented_run(files, master, debug=True), repeat=5)
+        with logic.instrumented():
+            t_timers = _timeit(lambda: _instrumented_run(files, master, debug=True), repeat=5)
+        with logic.instrumented() as instruments:
+            _instrumented_run(files, master, debug=True)
+        report = instruments.report()
+        with logic.instrumented(profile=True):
+            t_profile = _timeit(lambda: _instrumented_run(files, master, debug=True), repeat=1)
+    finally:
+        logic.LOGGER.removeHandler(sink)
+        logic.LOGGER.setLevel(level)
+        sink.stream.close()
+    print(f"instrumentation: files={len(files)}  master_rows={master_rows}")
+    print("instrumentation: mode                 seconds  overhead")
+    for mode, t in (("debug logged", t_debug), ("logging off", t_off), ("stage timers", t_timers), ("timers + cProfile", t_profile)):
+        print(f"instrumentation: {mode:<18}  {t:8.3f}  {t / t_off - 1:+8.1%}")
+    for name, stage in report["stages"].items():
+        print(f"instrumentation: stage {name:<16} {stage['calls']:4d} call(s)  {stage['total_s']:7.3f} s")
+    print("instrumentation: counters", report["counters"])
+
+PAYROLL_COLUMNS = ["Employee ID", "Department", "Cost Centre", "Grade", "Manager", "Location", "Contract Type",
+                   "Hours Per Week", "Payroll Frequency", "Tax Code", "Bank Sort Code", "Bank Account",
+                   "Holiday Entitlement", "Notes"]
+
+def make_workbook(n_sheets=10, rows_per_sheet=5_000):
+    """A workbook of n_sheets employee sheets, each with the usual columns plus payroll columns the mapper ignores."""
+    tables = []
+    for s in range(n_sheets):
+        table = make_employee_table(rows_per_sheet, seed=s)
+        table["NI Number"] = [f"Q{s}{i:06d}C" for i in range(rows_per_sheet)]
+        for j, col in enumerate(PAYROLL_COLUMNS):
+            table[col] = [f"{col} {i % (j + 7)}" for i in range(rows_per_sheet)]
+        tables.append(table)
+    return write_workbook(tables)
+
+def write_workbook(tables):
+    """XLSX bytes with one sheet ("Site 1", "Site 2", ...) per DataFrame."""
+    import openpyxl
+    workbook = openpyxl.Workbook(write_only=True)
+    for s, table in enumerate(tables):
+        sheet = workbook.create_sheet(f"Site {s + 1}")
+        sheet.append(list(table.columns))
+        for row in table.itertuples(index=False):
+            sheet.append([value.item() if isinstance(value, np.generic) else value for value in row])
+    buf = io.BytesIO()
+    workbook.save(buf)
+    return buf.getvalue()
+
+def _legacy_parse_workbook(file_bytes):
+    # Before: sheets listed with pd.ExcelFile, then every sheet read in full by its own pd.read_excel.
+    records = []
+    for sheet in pd.ExcelFile(io.BytesIO(file_bytes)).sheet_names:
+        df = pd.read_excel(io.BytesIO(file_bytes), sheet_name=sheet)
+        df.columns = df.columns.str.strip()
+        records.extend(logic.map_excel_employee_frame(df).to_dict("records"))
+    return records
+
+def bench_workbook(n_sheets=10, rows=50_000, processes=4):
+    """Per-sheet re-reads of a multi-sheet workbook vs parse_excel_employee over all sheets in one pass."""
+    file_bytes = make_workbook(n_sheets, rows // n_sheets)
+    t_legacy = _timeit(lambda: _legacy_parse_workbook(file_bytes), repeat=1)
+    t_names_legacy = _timeit(lambda: pd.ExcelFile(io.BytesIO(file_bytes)).sheet_names)
+    t_names = _timeit(lambda: logic.excel_sheet_names(file_bytes))
+    t_single = _timeit(lambda: logic.parse_excel_employee(file_bytes), repeat=1)
+    t_parallel = _timeit(lambda: logic.parse_excel_employee(file_bytes, processes=processes), repeat=1)
+    expected = pd.DataFrame(_legacy_parse_workbook(file_bytes))
+    actual = pd.DataFrame(logic.parse_excel_employee(file_bytes))
+    same = expected.astype(str).equals(actual.astype(str))
+    n_columns = len(logic.read_tabular_sample("workbook.xlsx", file_bytes, 0, nrows=0).columns)
+    print(f"workbook: sheets={n_sheets}  rows={rows}  columns={n_columns}  "
+          f"size_mb={len(file_bytes) / 2**20:.1f}  same_records={same}")
+    print(f"workbook: list sheets        legacy {t_names_legacy:7.3f} s   directory {t_names:7.4f} s")
+    print(f"workbook: parse all sheets   legacy {t_legacy:7.3f} s   one pass {t_single:7.3f} s ({t_legacy / t_single:.1f}x)"
+          f"   {processes} processes {t_parallel:7.3f} s")
+    assert same, "parse_excel_employee differs from per-sheet pd.read_excel"
+
+def bench_store(cases=(("csv", 500_000), ("xlsx", 50_000)), n_new=5):
+    """Adding n_new hires: streaming rewrite of the master vs logging them to a MasterStore, plus the store's one-off costs."""
+    print(f"store: new_hires={n_new}")
+    print("store: format     rows  rewrite_s  logged_s  speedup  create_s  compact_s  export_s")
+    new = [logic.map_employee_data(row) for row in make_employee_rows(n_new, seed=1)]
+    for ext, rows in cases:
+        master = make_master(rows)
+        master["NINumber"] = [f"QQ{i:06d}C" for i in range(rows)]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, f"master.{ext}")
+            logic.write_master_file(master, path, fmt=ext)
+            output = os.path.join(tmp, f"updated.{ext}")
+            t_rewrite = _timeit(lambda: logic.write_master_file(
+                logic.LazyMaster(path, f"master.{ext}").append(new), output, fmt=ext), repeat=1)
+            start = time.perf_counter()
+            store = logic.MasterStore.open(os.path.join(tmp, "master.store"), path)
+            t_create = time.perf_counter() - start
+            t_logged = _timeit(lambda: store.append(new), repeat=5)
+            t_compact = _timeit(store.compact, repeat=1)
+            t_export = _timeit(lambda: logic.write_master_file(store, output, fmt=ext), repeat=1)
+            store.close()
+        print(f"store: {ext:<6} {rows:>8}  {t_rewrite:9.3f}  {t_logged:8.4f}  {t_rewrite / t_logged:6.0f}x  "
+              f"{t_create:8.2f}  {t_compact:9.2f}  {t_export:8.2f}")
+
+def _rss_mb():
+    # Current (not peak) RSS; Linux only, like the peak readings it is compared with.
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+def _legacy_parse_csv(file_bytes):
+    # parse_csv_employee before chunked reading: whole-file str, StringIO, every column.
+    df = pd.read_csv(io.StringIO(file_bytes.decode("utf-8")))
+    df.columns = df.columns.str.strip()
+    return logic.map_excel_employee_frame(df).to_dict("records")
+
+def _upload_child(path, mode):
+    source = open(path, "rb") if mode == "file" else open(path, "rb").read()
+    if mode == "memoryview":
+        source = memoryview(source)
+    before_peak, before = _peak_rss_mb(), _rss_mb()
+    start = time.perf_counter()
+    records = _legacy_parse_csv(source) if mode == "legacy" else logic.parse_csv_employee(source)
+    elapsed = time.perf_counter() - start
+    retained = _rss_mb() - before
+    # Peak memory the parse needed on top of the input and the records it returns.
+    return elapsed, _peak_rss_mb() - before_peak - retained, retained, len(records)
+
+def bench_upload_memory(row_counts=(20_000, 80_000, 320_000)):
+    """Peak RSS of parsing a large employee CSV upload beyond the records kept: whole-file decode vs chunked reads."""
+    print("upload_memory: rows    file_mb  source      time_s  overhead_mb  records_mb")
+    for n in row_counts:
+        table = make_employee_table(n)
+        for j, col in enumerate(PAYROLL_COLUMNS):
+            table[col] = [f"{col} {i % (j + 7)}" for i in range(n)]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "starters.csv")
+            table.to_csv(path, index=False)
+            del table
+            size = os.path.getsize(path) / 2**20
+            for mode in ("legacy", "bytes", "memoryview", "file"):
+                elapsed, overhead, retained, n_records = _in_child(_upload_child, path, mode)
+                assert n_records == n
+                print(f"upload_memory: {n:>7}  {size:7.1f}  {mode:<10}  {elapsed:6.2f}  {overhead:11.1f}  {retained:10.1f}")
+
+
+# =========================
+# Synthetic corpus
+# =========================
+MONTH_NAMES = ["January", "February", "March", "April", "May", "June", "July", "August", "September",
+               "October", "November", "December"]
+
+def _ordinal(day):
+    suffix = "th" if 10 < day % 100 < 14 else {1: "st", 2: "nd", 3: "rd"}.get(day % 10, "th")
+    return f"{day}{suffix}"
+
+def make_messy_dates(n, seed=0, years=(1960, 2004), typo_rate=0.15):
+    """
+    n date strings in the shapes people type on starter forms: dd/mm/yyyy,
+    ordinal days ("3rd/4/1985", "21st March 1985"), ISO, dotted, a missing
+    slash before the year, and (typo_rate of them) an O for a 0 or an l for a 1.
+    """
+    rng = np.random.default_rng(seed)
+    days = rng.integers(1, 29, n)
+    months = rng.integers(1, 13, n)
+    year_values = rng.integers(years[0], years[1] + 1, n)
+    styles = rng.integers(0, 6, n)
+    typos = rng.random(n) < typo_rate
+    dates = []
+    for d, m, y, style, typo in zip(days, months, year_values, styles, typos):
+        d, m, y = int(d), int(m), int(y)
+        if style == 0:
+            text = f"{d:02d}/{m:02d}/{y}"
+        elif style == 1:
+            text = f"{_ordinal(d)}/{m}/{y}"
+        elif style == 2:
+            text = f"{_ordinal(d)} {MONTH_NAMES[m - 1]} {y}"
+        elif style == 3:
+            text = f"{y}-{m:02d}-{d:02d}"
+        elif style == 4:
+            text = f"{d:02d}.{m:02d}.{y}"
+        else:
+            text = f"{d:02d}/{m:02d}{y}"
+        if typo:
+            text = text.replace("0", "O", 1) if "0" in text else text.replace("1", "l", 1)
+        dates.append(text)
+    return dates
+
+def make_corpus(n_docx=20, n_pdf=20, n_csv=1, n_xlsx=1, rows_per_table=5_000, sheets_per_workbook=2,
+                master_rows=50_000, seed=0, typo_rate=0.15):
+    """
+    A synthetic onboarding corpus: {"files": {name: bytes}, "master": DataFrame}.
+
+    Starter forms are DOCX (alternately paragraph and two-column table forms)
+    and two-page PDFs; CSV and XLSX files hold rows_per_table employees each,
+    split over sheets_per_workbook sheets for XLSX. Dates of birth and start
+    dates go through make_messy_dates. Every master row has its own NI number.
+    """
+    forms = make_employee_rows(n_docx + n_pdf, seed=seed)
+    dobs = make_messy_dates(len(forms), seed=seed, typo_rate=typo_rate)
+    starts = make_messy_dates(len(forms), seed=seed + 1, years=(2020, 2025), typo_rate=typo_rate)
+    files = {}
+    for i, (row, dob, start) in enumerate(zip(forms, dobs, starts)):
+        row.update({"Date of Birth": dob, "Start Date": start})
+        if i < n_docx:
+            if i % 2:
+                files[f"starter_{i:04d}.docx"] = make_docx_table_form(row, filler_rows=20)
+            else:
+                files[f"starter_{i:04d}.docx"] = make_docx_bytes(employee_form_lines(row), filler_paragraphs=40)
+        else:
+            terms = [f"Clause {j}: the employee agrees to the terms set out above." for j in range(40)]
+            files[f"starter_{i:04d}.pdf"] = make_pdf_bytes([employee_form_lines(row), terms])
+
+    def table(k, n):
+        df = make_employee_table(n, seed=seed + k)
+        df["NI Number"] = [f"T{k % 10}{i:06d}C" for i in range(n)]
+        df["Date Of Birth"] = make_messy_dates(n, seed=seed + k, typo_rate=typo_rate)
+        df["Hire Date"] = make_messy_dates(n, seed=seed + k + 1, years=(2020, 2025), typo_rate=typo_rate)
+        return df
+
+    for k in range(n_csv):
+        files[f"starters_{k}.csv"] = table(k, rows_per_table).to_csv(index=False).encode("utf-8")
+    per_sheet = -(-rows_per_table // max(sheets_per_workbook, 1))
+    for k in range(n_xlsx):
+        tables = [table(n_csv + k * sheets_per_workbook + s, per_sheet) for s in range(sheets_per_workbook)]
+        files[f"starters_{k}.xlsx"] = write_workbook(tables)
+    master = make_master(master_rows)
+    master["NINumber"] = [f"QQ{i:06d}C" for i in range(master_rows)]
+    return {"files": files, "master": master}
+
+def write_corpus(directory, **kwargs):
+    """Write make_corpus(**kwargs) to directory: master.csv and an inputs/ folder. Returns (master_path, inputs_dir)."""
+    corpus = make_corpus(**kwargs)
+    inputs = os.path.join(directory, "inputs")
+    os.makedirs(inputs, exist_ok=True)
+    for name, data in corpus["files"].items():
+        with open(os.path.join(inputs, name), "wb") as f:
+            f.write(data)
+    master_path = os.path.join(directory, "master.csv")
+    corpus["master"].to_csv(master_path, index=False)
+    return master_path, inputs
+
+
+# =========================
+# Regression suite
+# =========================
+# Fixed-size workloads timed one stage at a time, so runs on different commits
+# are comparable. Each stage's setup takes the suite inputs and returns the
+# callable to time; stages whose API a commit lacks are recorded as missing.
+SUITE = {}
+SUITE_SIZES = {"n_docx": 20, "n_pdf": 20, "rows_per_table": 5_000, "master_rows": 50_000, "records": 1_000}
+
+def suite_stage(name):
+    def register(setup):
+        SUITE[name] = setup
+        return setup
+    return register
+
+def suite_inputs(scale=1.0, seed=0):
+    """The corpus and derived inputs every suite stage draws on, sized by SUITE_SIZES * scale."""
+    sizes = {key: max(1, int(value * scale)) for key, value in SUITE_SIZES.items()}
+    corpus = make_corpus(n_docx=sizes["n_docx"], n_pdf=sizes["n_pdf"], rows_per_table=sizes["rows_per_table"],
+                         master_rows=sizes["master_rows"], seed=seed)
+    corpus["sizes"] = sizes
+    corpus["dates"] = make_messy_dates(sizes["rows_per_table"], seed=seed)
+    corpus["raw_records"] = make_employee_rows(sizes["records"], seed=seed + 1)
+    for row, dob in zip(corpus["raw_records"], make_messy_dates(sizes["records"], seed=seed + 1)):
+        row["Date of Birth"] = dob
+    corpus["master_csv"] = corpus["master"].to_csv(index=False).encode("utf-8")
+    return corpus
+
+def _corpus_files(corpus, ext):
+    return [data for name, data in corpus["files"].items() if name.endswith(ext)]
+
+def _suite_master(corpus):
+    # The master as the app holds it: loaded from its file, with whatever dtypes this commit gives it.
+    if "loaded_master" not in corpus:
+        corpus["loaded_master"] = logic.load_master_file(io.BytesIO(corpus["master_csv"]), "master.csv")
+    return corpus["loaded_master"]
+
+def _suite_records(corpus):
+    # Half new starters, half people already in the master (for upsert).
+    if "records" not in corpus:
+        records = [logic.map_employee_data(row) for row in corpus["raw_records"]]
+        master = corpus["master"]
+        for i, record in enumerate(records):
+            record["NINumber"] = master["NINumber"].iat[i] if i % 2 else f"NEW{i:06d}"
+        corpus["records"] = records
+    return corpus["records"]
+
+@suite_stage("parse_docx")
+def _suite_parse_docx(corpus):
+    documents = _corpus_files(corpus, ".docx")
+    return lambda: [logic.parse_docx(data) for data in documents]
+
+@suite_stage("parse_pdf")
+def _suite_parse_pdf(corpus):
+    documents = _corpus_files(corpus, ".pdf")
+    return lambda: [logic.parse_pdf(data) for data in documents]
+
+@suite_stage("parse_csv")
+def _suite_parse_csv(corpus):
+    tables = _corpus_files(corpus, ".csv")
+    return lambda: [logic.parse_csv_employee(data) for data in tables]
+
+@suite_stage("parse_excel")
+def _suite_parse_excel(corpus):
+    # First sheet only: what every commit's parse_excel_employee understands.
+    workbooks = _corpus_files(corpus, ".xlsx")
+    return lambda: [logic.parse_excel_employee(data, sheet_name=0) for data in workbooks]
+
+@suite_stage("dates")
+def _suite_dates(corpus):
+    values = corpus["dates"]
+    return lambda: [logic.robust_parse_date_str(value) for value in values]
+
+@suite_stage("dates_column")
+def _suite_dates_column(corpus):
+    values = pd.Series(corpus["dates"])
+    parse = logic.robust_parse_dates
+    return lambda: parse(values)
+
+@suite_stage("map_records")
+def _suite_map_records(corpus):
+    rows = corpus["raw_records"]
+    return lambda: [logic.map_employee_data(row) for row in rows]
+
+@suite_stage("load_master")
+def _suite_load_master(corpus):
+    data = corpus["master_csv"]
+    return lambda: logic.load_master_file(io.BytesIO(data), "master.csv")
+
+@suite_stage("append")
+def _suite_append(corpus):
+    master, records = _suite_master(corpus), _suite_records(corpus)
+    if hasattr(logic, "append_employee_records"):
+        return lambda: logic.append_employee_records(master, records)
+    return lambda: logic.append_employee_record(master, records)
+
+@suite_stage("upsert")
+def _suite_upsert(corpus):
+    master, records = _suite_master(corpus), _suite_records(corpus)
+    upsert = logic.upsert_employee_records
+    return lambda: upsert(master, records)
+
+@suite_stage("export_csv")
+def _suite_export_csv(corpus):
+    master = _suite_master(corpus)
+    return lambda: logic.export_master_file(master, "master.csv")
+
+@suite_stage("store_append")
+def _suite_store_append(corpus):
+    # A handful of hires logged to a MasterStore over the suite's master.
+    tmp = tempfile.mkdtemp(prefix="bench_suite_")
+    corpus.setdefault("cleanup", []).append(tmp)
+    master = os.path.join(tmp, "master.csv")
+    with open(master, "wb") as f:
+        f.write(corpus["master_csv"])
+    store = logic.MasterStore.open(os.path.join(tmp, "master.store"), master)
+    hires = _suite_records(corpus)[:5]
+    return lambda: store.append(hires)
+
+@suite_stage("gpt_mapping")
+def _suite_gpt_mapping(corpus):
+    # One mapping per upload with a few unusual headers each; the fake server clears the mapping cache.
+    headers = [header for header, _ in SAMPLE_HEADERS]
+    uploads = [headers[i % 7::3] for i in range(10)]
+
+    def run():
+        with FakeOpenAIServer():
+            return [logic.gpt_map_columns(columns, logic.EXCEL_FIELD_MAP) for columns in uploads]
+    return run
+
+@suite_stage("ingest")
+def _suite_ingest(corpus):
+    files = list(corpus["files"].items())
+
+    def run():
+        with FakeOpenAIServer():
+            return logic.ingest_employee_files(files, use_ai=True, use_cache=False)
+    return run
+
+@suite_stage("merge")
+def _suite_merge(corpus):
+    # End to end: onboarding.merge over the corpus on disk, AI mapping against the fake server.
+    import onboarding
+    tmp = tempfile.mkdtemp(prefix="bench_suite_")
+    corpus.setdefault("cleanup", []).append(tmp)
+    inputs = os.path.join(tmp, "inputs")
+    os.mkdir(inputs)
+    for name, data in corpus["files"].items():
+        with open(os.path.join(inputs, name), "wb") as f:
+            f.write(data)
+    master = os.path.join(tmp, "master.csv")
+    with open(master, "wb") as f:
+        f.write(corpus["master_csv"])
+
+    def run():
+        with FakeOpenAIServer():
+            return onboarding.merge(master, [inputs], use_ai=True, resume=False, progress=None)
+    return run
+
+def _git(*args, cwd=None):
+    import subprocess
+    try:
+        return subprocess.run(["git", *args], cwd=cwd or os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _best_time(func, repeat, budget=5.0):
+    # Best of repeat runs after an untimed warm-up (lazy imports, first-use caches);
+    # a stage slower than budget seconds is only timed once.
+    func()
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+        if best > budget:
+            break
+    return best
+
+def run_suite(scale=1.0, repeat=3, stages=None, seed=0, verbose=True):
+    """
+    Time every SUITE stage (or only those named in stages) and return a run
+    record: commit, date, scale, {stage: seconds or None} results and
+    {stage: error} for stages that failed or do not exist at this commit.
+    """
+    import shutil
+    unknown = set(stages or ()) - set(SUITE)
+    if unknown:
+        raise SystemExit(f"Unknown suite stage(s) {', '.join(sorted(unknown))}. Choose from: {', '.join(SUITE)}")
+    if hasattr(logic, "LOGGER"):
+        logic.LOGGER.setLevel("ERROR")  # parse failures are recorded, not logged
+    corpus = suite_inputs(scale, seed=seed)
+    results, errors = {}, {}
+    try:
+        for name, setup in SUITE.items():
+            if stages and name not in stages:
+                continue
+            try:
+                results[name] = _best_time(setup(corpus), repeat)
+            except Exception as e:
+                results[name], errors[name] = None, f"{type(e).__name__}: {e}"
+            if verbose:
+                shown = f"{results[name]:9.4f} s" if results[name] is not None else f"      n/a  ({errors[name]})"
+                print(f"suite: {name:<13} {shown}", file=sys.stderr, flush=True)
+    finally:
+        for path in corpus.get("cleanup", []):
+            shutil.rmtree(path, ignore_errors=True)
+    commit = _git("rev-parse", "--short", "HEAD")
+    return {
+        "commit": commit, "subject": _git("log", "-1", "--format=%s") if commit else None,
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": sys.version.split()[0],
+        "scale": scale, "repeat": repeat, "sizes": corpus["sizes"], "results": results, "errors": errors,
+    }
+
+def run_suite_at(commit, scale=1.0, repeat=3, stages=None):
+    """
+    run_suite against another commit's code: the commit is checked out in a
+    temporary git worktree and this bench.py is run there, so every commit is
+    measured with the same suite.
+    """
+    import shutil
+    import subprocess
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory(prefix="bench_worktree_") as tmp:
+        tree = os.path.join(tmp, "tree")
+        subprocess.run(["git", "worktree", "add", "--detach", tree, commit], cwd=here, capture_output=True, check=True)
+        try:
+            shutil.copy(os.path.abspath(__file__), os.path.join(tree, "bench.py"))
+            command = [sys.executable, "-W", "ignore", "bench.py", "--suite", "--json", "--scale", str(scale),
+                       "--repeat", str(repeat)] + (["--stages", *stages] if stages else [])
+            out = subprocess.run(command, cwd=tree, capture_output=True, text=True)
+            if out.returncode:
+                raise RuntimeError(f"suite failed at {commit}:\n{out.stderr[-2000:]}")
+        finally:
+            subprocess.run(["git", "worktree", "remove", "--force", tree], cwd=here, capture_output=True)
+    run = json.loads(out.stdout.strip().splitlines()[-1])
+    run["dirty"] = False  # the copied bench.py is the only change
+    return run
+
+BENCH_HISTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".bench_history.jsonl")
+
+def save_run(run, path=BENCH_HISTORY):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(run) + "\n")
+
+def load_history(path=BENCH_HISTORY):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def regression_report(history, last=5, threshold=0.10, min_delta=0.005):
+    """
+    Compare the latest run of each of the last `last` commits (runs at the
+    scale of the newest one) stage by stage. Returns (text, regressions),
+    regressions being (stage, before_s, after_s) for stages where the newest
+    commit is more than threshold slower (and min_delta seconds) than the one before.
+    """
+    if not history:
+        return "No benchmark runs recorded yet: run `python bench.py --suite --save` first.", []
+    scale = history[-1]["scale"]
+    latest = {}
+    for run in history:
+        if run["scale"] == scale:
+            key = (run["commit"] or "unknown") + ("+" if run["dirty"] else "")
+            latest.pop(key, None)
+            latest[key] = run  # re-inserted, so commits are ordered by their latest run
+    keys = list(latest)[-last:]
+    runs = [latest[key] for key in keys]
+    stages = list(dict.fromkeys(name for run in runs for name in run["results"]))
+    lines = [f"scale={scale}; '+' marks a run with uncommitted changes; times in seconds (best of each run)."]
+    for key, run in zip(keys, runs):
+        lines.append(f"  {key:<9} {run['date']}  {run.get('subject') or ''}")
+    lines.append(f"{'stage':<13}" + "".join(f"{key:>10}" for key in keys) + "    change")
+    regressions = []
+    for name in stages:
+        times = [run["results"].get(name) for run in runs]
+        row = f"{name:<13}" + "".join(f"{t:10.4f}" if t is not None else f"{'n/a':>10}" for t in times)
+        before, after = (times[-2], times[-1]) if len(times) > 1 else (None, times[-1])
+        if before is None or after is None:
+            row += "         -"
+        else:
+            change = after / before - 1
+            row += f"  {change:+8.1%}"
+            if change > threshold and after - before > min_delta:
+                row += "  REGRESSION"
+                regressions.append((name, before, after))
+        lines.append(row)
+    if regressions:
+        lines.append(f"{len(regressions)} stage(s) more than {threshold:.0%} slower than at {keys[-2]}.")
+    return "\n".join(lines), regressions
+
+
+BENCHMARKS = {
+    "append": bench_append,
+    "excel_mapping": bench_excel_mapping,
+    "dates": bench_dates,
+    "ingest": bench_ingest,
+    "labels": bench_labels,
+    "rerun": bench_rerun,
+    "export": bench_export,
+    "master": bench_master,
+    "upsert": bench_upsert,
+    "gpt_batch": bench_gpt_batch,
+    "gpt_latency": bench_gpt_latency,
+    "column_matcher": bench_column_matcher,
+    "pdf": bench_pdf,
+    "docx": bench_docx,
+    "cli": bench_cli,
+    "import": bench_import,
+    "schema": bench_schema,
+    "instrumentation": bench_instrumentation,
+    "workbook": bench_workbook,
+    "store": bench_store,
+    "upload_memory": bench_upload_memory,
+    "mapping_cache": bench_mapping_cache,
+}
+
+def build_parser():
+    import argparse
+    parser = argparse.ArgumentParser(prog="python bench.py", description="Offline benchmarks for the onboarding pipeline.")
+    parser.add_argument("names", nargs="*", help=f"Benchmarks to run (default: all): {', '.join(BENCHMARKS)}.")
+    suite = parser.add_argument_group("regression suite")
+    suite.add_argument("--suite", action="store_true", help="Time each pipeline stage and the end-to-end merge.")
+    suite.add_argument("--stages", nargs="+", metavar="STAGE", help=f"Only these stages: {', '.join(SUITE)}.")
+    suite.add_argument("--scale", type=float, default=1.0, help="Multiply the suite's input sizes (default 1.0).")
+    suite.add_argument("--repeat", type=int, default=3, help="Runs per stage; the best is kept (default 3).")
+    suite.add_argument("--commits", nargs="+", metavar="REV", help="Run the suite at each of these commits (implies --save).")
+    suite.add_argument("--save", action="store_true", help="Append the run to the history file.")
+    suite.add_argument("--history", default=BENCH_HISTORY, help="History file (default .bench_history.jsonl).")
+    suite.add_argument("--report", action="store_true", help="Compare the latest commits in the history.")
+    suite.add_argument("--last", type=int, default=5, help="Commits shown in the report (default 5).")
+    suite.add_argument("--threshold", type=float, default=0.10, help="Slowdown flagged as a regression (default 0.10).")
+    suite.add_argument("--check", action="store_true", help="Exit with status 1 if the report flags a regression.")
+    suite.add_argument("--json", action="store_true", help="Print the suite run as one JSON line.")
+    suite.add_argument("--corpus", metavar="DIR", help="Write the synthetic corpus (master.csv, inputs/) to DIR and exit.")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.corpus:
+        sizes = {key: max(1, int(value * args.scale)) for key, value in SUITE_SIZES.items() if key != "records"}
+        master_path, inputs = write_corpus(args.corpus, **sizes)
+        print(f"corpus: {len(os.listdir(inputs))} input files in {inputs}, master {master_path}")
+        return 0
+    if args.suite or args.commits or args.report:
+        runs = []
+        if args.commits:
+            runs = [run_suite_at(rev, args.scale, args.repeat, args.stages) for rev in args.commits]
+        elif args.suite:
+            runs = [run_suite(args.scale, args.repeat, args.stages)]
+        for run in runs:
+            if args.json:
+                print(json.dumps(run))
+            if args.save or args.commits:
+                save_run(run, args.history)
+        if args.report or args.commits:
+            text, regressions = regression_report(load_history(args.history), args.last, args.threshold)
+            print(text)
+            if args.check and regressions:
+                return 1
+        return 0
+    names = args.names or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            raise SystemExit(f"Unknown benchmark '{name}'. Choose from: {', '.join(BENCHMARKS)}")
+    failed = []
+    for name in names:
+        try:
+            BENCHMARKS[name]()
+        except AssertionError as e:
+            # A parity check failed: report it, finish the other benchmarks, exit 1.
+            print(f"{name}: FAILED {e}", file=sys.stderr)
+            failed.append(name)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,268 @@
 import io
 import re
+import asyncio
+import gzip
+import codecs
+import tempfile
+import zipfile
+import itertools
+import contextlib
+import contextvars
+import importlib.util
 import json
 import pandas as pd
 import numpy as np
-import docx2txt
-import docx
-import PyPDF2
 import datetime
-import openai
-import streamlit as st
 import os
+import time
+import hashlib
+import sqlite3
+import threading
+import random
+import logging
+import warnings
+import functools
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
-# Set the OpenAI API key from Streamlit secrets or environment variables.
-openai.api_key = os.getenv("OPENAI_API_KEY") or st.secrets.get("OPENAI_API_KEY")
-if not openai.api_key:
-    raise ValueError("OpenAI API key not found in environment variables or Streamlit secrets")
+class _LazyModule:
+    """
+    Stand-in for a module that is imported on first attribute access, so the
+    heavy optional dependencies below cost nothing at import time and are only
+    loaded by the parser or mapper that needs them. Attribute assignments (e.g.
+    openai.api_key) go to the real module. A missing package raises ImportError
+    when it is first used, naming what it is needed for.
+    """
+    def __init__(self, name, needed_for):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_needed_for", needed_for)
+        object.__setattr__(self, "_module", None)
+
+    def _load(self):
+        if self._module is None:
+            try:
+                module = importlib.import_module(self._name)
+            except ImportError as e:
+                raise ImportError(f"{self._name} is required for {self._needed_for}") from e
+            object.__setattr__(self, "_module", module)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+openai = _LazyModule("openai", "AI column mapping")
+PyPDF2 = _LazyModule("PyPDF2", "PDF files")
+etree = _LazyModule("lxml.etree", "DOCX files")
+
+def load_openai_key():
+    """
+    Set the OpenAI API key from environment variables or Streamlit secrets the
+    first time GPT is needed, so importing this module needs neither a key nor
+    Streamlit (command-line runs without AI mapping never look for one).
+    """
+    if not openai.api_key:
+        openai.api_key = os.getenv("OPENAI_API_KEY") or _streamlit_secret("OPENAI_API_KEY")
+    if not openai.api_key:
+        raise ValueError("OpenAI API key not found in environment variables or Streamlit secrets")
+    return openai.api_key
+
+def _streamlit_secret(name):
+    try:
+        import streamlit as st
+        return st.secrets.get(name)
+    except Exception:
+        # No Streamlit installed, or no secrets file outside a Streamlit app.
+        return None
+
+# =========================
+# Instrumentation
+# =========================
+# Messages go to the "onboarding" logger. A debug=True argument asks for debug
+# output, and the logger's level decides whether it is produced, so nothing is
+# formatted (or dumped) unless logging.getLogger("onboarding") is at DEBUG.
+LOGGER = logging.getLogger("onboarding")
+
+def _debugging(debug):
+    return debug and LOGGER.isEnabledFor(logging.DEBUG)
+
+_NO_STAGE = contextlib.nullcontext()
+
+class Instrumentation:
+    """
+    Stage timers and counters for the ingestion pipeline (master load, parsing,
+    GPT requests, date parsing, merging, export). Off by default: stage() and
+    count() then return at once. start()/stop(), or the instrumented() context
+    manager, collect one run; report() returns it as a JSON-ready dict.
+    instrumented() gives each run its own instance (see INSTRUMENTS).
+
+    Counters include the GPT, mapping cache and parse cache statistics kept
+    elsewhere in this module, as deltas since start(). Work done in worker
+    processes (DOCX/PDF extraction) is only seen through the "ingest.extract"
+    stage around it. With profile=True, cProfile also runs on the calling
+    thread and the report lists the most expensive functions.
+    """
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._profiler = None
+        self._baseline = {}
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.timings = {}
+            self.counters = {}
+            self.profile = []
+            self._started = time.perf_counter()
+            self._elapsed = None
+
+    def start(self, profile=False):
+        self.reset()
+        self._baseline = _external_counters()
+        self.enabled = True
+        if profile:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def stop(self, top=25):
+        """Stop collecting and return the report."""
+        self.enabled = False
+        self._elapsed = time.perf_counter() - self._started
+        if self._profiler is not None:
+            self._profiler.disable()
+            self.profile = _profile_rows(self._profiler, top)
+            self._profiler = None
+        return self.report()
+
+    def stage(self, name):
+        """Context manager timing one pass through stage name."""
+        return self._timer(name) if self.enabled else _NO_STAGE
+
+    @contextlib.contextmanager
+    def _timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                calls, total, longest = self.timings.get(name, (0, 0.0, 0.0))
+                self.timings[name] = (calls + 1, total + elapsed, max(longest, elapsed))
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def report(self):
+        with self._lock:
+            timings = dict(self.timings)
+            counters = dict(self.counters)
+        for name, value in _external_counters().items():
+            delta = value - self._baseline.get(name, 0)
+            if delta:
+                counters[name] = delta
+        elapsed = self._elapsed if self._elapsed is not None else time.perf_counter() - self._started
+        stages = {
+            name: {"calls": calls, "total_s": round(total, 6), "mean_ms": round(1000 * total / calls, 3),
+                   "max_ms": round(1000 * longest, 3)}
+            for name, (calls, total, longest) in sorted(timings.items(), key=lambda item: -item[1][1])
+        }
+        return {"elapsed_s": round(elapsed, 6), "stages": stages, "counters": dict(sorted(counters.items())),
+                "profile": list(self.profile)}
+
+    def write_report(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def log_report(self, level=logging.INFO):
+        if not LOGGER.isEnabledFor(level):
+            return
+        report = self.report()
+        for name, stage in report["stages"].items():
+            LOGGER.log(level, "%-20s %5d call(s) %9.3f s total %9.3f ms max",
+                       name, stage["calls"], stage["total_s"], stage["max_ms"])
+        LOGGER.log(level, "counters: %s", report["counters"])
+        for row in report["profile"][:10]:
+            LOGGER.log(level, "%-50s %8d call(s) %9.3f s cumulative", row["function"], row["calls"], row["cumtime_s"])
+
+# The Instrumentation of the enclosing instrumented() block, per thread/context.
+_ACTIVE_INSTRUMENTS = contextvars.ContextVar("active_instruments", default=None)
+_PROCESS_INSTRUMENTS = Instrumentation()
+
+def current_instruments():
+    """The Instrumentation collecting for this context: the innermost instrumented() block, or the process-wide one."""
+    return _ACTIVE_INSTRUMENTS.get() or _PROCESS_INSTRUMENTS
+
+class _CurrentInstrumentation:
+    # INSTRUMENTS: forwards to current_instruments(), so concurrent runs (e.g. two
+    # Streamlit sessions) each time and count into their own instrumented() block.
+    def __getattr__(self, attr):
+        return getattr(current_instruments(), attr)
+
+INSTRUMENTS = _CurrentInstrumentation()
+
+def timed(stage):
+    """Decorator: time every call of the function as stage (when instrumentation is on)."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            instruments = current_instruments()
+            if not instruments.enabled:
+                return func(*args, **kwargs)
+            with instruments._timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def _submit_in_context(pool, fn, *args, **kwargs):
+    """pool.submit, running fn in a copy of the caller's context so it reports to the caller's instrumented() block."""
+    return pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+@contextlib.contextmanager
+def instrumented(report_path=None, profile=False):
+    """
+    Collect timings and counters for the enclosed block into a fresh
+    Instrumentation, then log them at INFO and, with report_path, write the
+    report there as JSON. Yields that Instrumentation; the block only sees its
+    own stages and counters, also when other threads are instrumented at the
+    same time. Counters kept outside it (GPT and cache statistics) are
+    process-wide, so concurrent runs see each other's there.
+    """
+    instruments = Instrumentation()
+    token = _ACTIVE_INSTRUMENTS.set(instruments)
+    instruments.start(profile=profile)
+    try:
+        yield instruments
+    finally:
+        instruments.stop()
+        _ACTIVE_INSTRUMENTS.reset(token)
+        instruments.log_report()
+        if report_path:
+            instruments.write_report(report_path)
+
+def _external_counters():
+    # Statistics kept by the GPT client and caches, flattened into counter names.
+    counters = {f"gpt.{name}": value for name, value in GPT_STATS.items()}
+    counters.update((f"gpt.client.{name}", value) for name, value in GPT_CLIENT.stats.items())
+    counters.update((f"mapping_cache.{name}", value) for name, value in MAPPING_CACHE.stats.items())
+    counters.update((f"parse_cache.{name}", value) for name, value in PARSE_CACHE.stats.items())
+    return counters
+
+def _profile_rows(profiler, top):
+    import pstats
+    stats = pstats.Stats(profiler).stats
+    rows = sorted(stats.items(), key=lambda item: -item[1][3])[:top]
+    return [
+        {"function": f"{os.path.basename(filename)}:{line}({func})", "calls": calls,
+         "tottime_s": round(tottime, 6), "cumtime_s": round(cumtime, 6)}
+        for (filename, line, func), (_, calls, tottime, cumtime, _) in rows
+    ]
 
 # =========================
 # 1) Field Map (for non-Excel employee files)
@@ -80,168 +328,1138 @@ EXCEL_FIELD_MAP = {
     "Salary": "Basic Salary"   # New mapping for files that use "Salary"
 }
 
+# Fields of the starter form itself; parse_pdf can stop reading once it has all of them.
+FORM_FIELDS = frozenset(FIELD_MAP.values())
+
 # Merge the additional mapping into the existing FIELD_MAP.
 FIELD_MAP.update(EXCEL_FIELD_MAP)
 
 # =========================
 # Helper: Apply AI Mapping to a Dictionary
 # =========================
-def apply_ai_mapping_to_dict(data, use_ai=False, debug=False):
+def apply_ai_mapping_to_dict(data, use_ai=False, debug=False, mapping=None):
     """
-    If use_ai is True, convert a dictionary (one employee record)
-    into a DataFrame and apply GPT-based column mapping.
+    If use_ai is True, rename the keys of a dictionary (one employee record)
+    using GPT-based column mapping (or the given, already computed mapping).
     """
     if not use_ai:
         return data
-    df = pd.DataFrame([data])
-    mapping = gpt_map_columns(df.columns, EXCEL_FIELD_MAP)
-    if debug:
-        print("DEBUG: GPT mapping for document:", mapping)
-    df = df.rename(columns=lambda col: mapping.get(col, col))
-    return df.iloc[0].to_dict()
+    if mapping is None:
+        mapping = gpt_map_columns(list(data.keys()), EXCEL_FIELD_MAP, samples=data)
+    if _debugging(debug):
+        LOGGER.debug("GPT mapping for document: %s", mapping)
+    # A key is never renamed onto another key of the record, so no value is overwritten.
+    mapping = _without_collisions(list(data), mapping)
+    return {mapping.get(key, key): value for key, value in data.items()}
 
 # =========================
 # 2) GPT-powered Column Mapping Function
 # =========================
-def gpt_map_columns(df_columns, mapped_columns):
+GPT_MAPPING_MODEL = "gpt-4"
+
+class MappingCache:
     """
-    Uses OpenAI GPT-4 to intelligently map the Excel sheet's columns (or dictionary keys)
-    to the internal field names. Constructs a detailed prompt instructing the model to understand
-    the meaning and content of each column.
+    Two-tier cache for GPT column mappings: an in-memory LRU in front of a
+    SQLite table on disk. Entries are keyed on a fingerprint of the column set,
+    the target field map and the model, so editing EXCEL_FIELD_MAP (or switching
+    model) naturally invalidates old entries. Entries expire ttl seconds after
+    they were created, in memory as on disk.
     """
+    def __init__(self, path=None, ttl=7 * 24 * 3600, maxsize=256):
+        # path may be a callable, resolved on first use (see MAPPING_CACHE).
+        self._path = path
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._memory = OrderedDict()
+        # Mappings are looked up from ingestion worker threads.
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    @property
+    def path(self):
+        if callable(self._path):
+            self._path = self._path()
+        return self._path
+
+    @path.setter
+    def path(self, value):
+        self._path = value
+
+    @staticmethod
+    def fingerprint(df_columns, mapped_columns, model=GPT_MAPPING_MODEL):
+        payload = json.dumps({
+            "columns": sorted(str(col) for col in df_columns),
+            "fields": sorted((str(k), str(v)) for k, v in mapped_columns.items()),
+            "model": model,
+        })
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS gpt_mappings (key TEXT PRIMARY KEY, mapping TEXT, created REAL)"
+        )
+        return conn
+
+    def _remember(self, key, mapping, created=None):
+        with self._lock:
+            self._memory[key] = (mapping, time.time() if created is None else created)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.maxsize:
+                self._memory.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                mapping, created = self._memory[key]
+                if time.time() - created <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return dict(mapping)
+                del self._memory[key]
+        if self.path:
+            try:
+                with self._connect() as conn:
+                    row = conn.execute(
+                        "SELECT mapping, created FROM gpt_mappings WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row and time.time() - row[1] > self.ttl:
+                        conn.execute("DELETE FROM gpt_mappings WHERE key = ?", (key,))
+                        row = None
+            except sqlite3.Error:
+                row = None
+            if row:
+                mapping = json.loads(row[0])
+                self._remember(key, mapping, created=row[1])
+                self.stats["disk_hits"] += 1
+                return dict(mapping)
+        self.stats["misses"] += 1
+        return None
+
+    def set(self, key, mapping):
+        created = time.time()
+        self._remember(key, dict(mapping), created)
+        if self.path:
+            try:
+                with self._connect() as conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO gpt_mappings (key, mapping, created) VALUES (?, ?, ?)",
+                        (key, json.dumps(mapping), created),
+                    )
+            except sqlite3.Error:
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.path:
+            try:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM gpt_mappings")
+            except sqlite3.Error:
+                pass
+
+def _mapping_cache_path():
+    return os.getenv("GPT_MAPPING_CACHE_PATH", ".gpt_mapping_cache.sqlite3") or None
+
+# Shared cache used by gpt_map_columns. Set GPT_MAPPING_CACHE_PATH to "" to keep it in memory only;
+# the variable is read when the cache is first used, not at import.
+MAPPING_CACHE = MappingCache(path=_mapping_cache_path)
+
+# Running totals of GPT traffic, for benchmarks and diagnostics.
+GPT_STATS = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0}
+_GPT_STATS_LOCK = threading.Lock()
+
+def _gpt_max_tokens(n_columns):
+    # Room for '"column": "field", ' per column; a fixed 150 truncated wide sheets.
+    return min(4000, 60 + 30 * n_columns)
+
+def _mapping_messages(df_columns, mapped_columns):
     prompt = (
         f"Given the following columns: {list(df_columns)} and the internal mapped fields: {list(mapped_columns.keys())}, "
         "please map each column to the most appropriate internal field based on the meaning and nature of its data. "
         "Return your answer as a JSON dictionary with the original column names as keys and internal field names as values. "
         "If no appropriate match exists for a column, return null for that column."
     )
-    try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that maps file columns to internal field names."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.2,
-            max_tokens=150
+    return [
+        {"role": "system", "content": "You are a helpful assistant that maps file columns to internal field names."},
+        {"role": "user", "content": prompt}
+    ]
+
+def _parse_mapping_response(response):
+    usage = getattr(response, "usage", None) or {}
+    with _GPT_STATS_LOCK:
+        GPT_STATS["requests"] += 1
+        GPT_STATS["prompt_tokens"] += usage.get("prompt_tokens", 0)
+        GPT_STATS["completion_tokens"] += usage.get("completion_tokens", 0)
+    mapping_text = response.choices[0].message['content'].strip()
+    mapping = json.loads(mapping_text)
+    if not isinstance(mapping, dict):
+        raise ValueError("GPT mapping is not a JSON object")
+    return mapping
+
+class GPTUnavailableError(Exception):
+    """Raised without calling the API while the mapping client's circuit breaker is open."""
+
+class GPTMappingClient:
+    """
+    asyncio-based client for GPT column mapping with bounded latency.
+
+    Each attempt is cut off after timeout seconds and a whole mapping (retries
+    included) after deadline seconds. Timeouts, connection errors, rate limits
+    and 5xx responses are retried up to max_retries times with full-jitter
+    exponential backoff. At most max_concurrency requests are in flight per
+    map_many call. After failure_threshold consecutive failures the circuit
+    opens: for cooldown seconds every call raises GPTUnavailableError at once,
+    so callers drop to the local matcher instead of waiting on a sick API. Then
+    a single call probes the API while the others still see the circuit open;
+    it closes the circuit if it succeeds and reopens it if it fails.
+    """
+    def __init__(self, timeout=20.0, deadline=45.0, max_retries=2, backoff_base=0.5, backoff_max=8.0,
+                 max_concurrency=4, failure_threshold=3, cooldown=60.0):
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_concurrency = max_concurrency
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._probing = False
+        self.stats = {"calls": 0, "retries": 0, "failures": 0, "short_circuits": 0}
+
+    def reset(self):
+        """Close the circuit and zero the stats."""
+        with self._lock:
+            self._consecutive_failures = 0
+            self._opened_at = None
+            self._probing = False
+            for key in self.stats:
+                self.stats[key] = 0
+
+    def circuit_open(self):
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if not self._probing and time.monotonic() - self._opened_at >= self.cooldown:
+                # Half-open: let this call alone through to probe the API.
+                self._probing = True
+                return False
+            return True
+
+    def _record(self, success):
+        with self._lock:
+            if success:
+                self._consecutive_failures = 0
+                self._opened_at = None
+                self._probing = False
+                return
+            self.stats["failures"] += 1
+            self._consecutive_failures += 1
+            if self._probing or self._consecutive_failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    @staticmethod
+    def _retryable(error):
+        return isinstance(error, (
+            asyncio.TimeoutError, openai.error.Timeout, openai.error.APIError, openai.error.APIConnectionError,
+            openai.error.RateLimitError, openai.error.ServiceUnavailableError, openai.error.TryAgain,
+        ))
+
+    async def _attempts(self, df_columns, mapped_columns):
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await asyncio.wait_for(
+                    openai.ChatCompletion.acreate(
+                        model=GPT_MAPPING_MODEL,
+                        messages=_mapping_messages(df_columns, mapped_columns),
+                        temperature=0.2,
+                        max_tokens=_gpt_max_tokens(len(df_columns)),
+                        request_timeout=self.timeout,
+                    ),
+                    self.timeout,
+                )
+                return _parse_mapping_response(response)
+            except Exception as e:
+                if attempt == self.max_retries or not self._retryable(e):
+                    raise
+                with self._lock:
+                    self.stats["retries"] += 1
+                delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+                await asyncio.sleep(random.uniform(0, delay))
+
+    async def amap_columns(self, df_columns, mapped_columns, semaphore=None):
+        """Map one column list. Raises on failure; callers fall back to local matching."""
+        load_openai_key()
+        if self.circuit_open():
+            with self._lock:
+                self.stats["short_circuits"] += 1
+            raise GPTUnavailableError("GPT mapping disabled after repeated failures")
+        with self._lock:
+            self.stats["calls"] += 1
+        try:
+            if semaphore is None:
+                mapping = await asyncio.wait_for(self._attempts(df_columns, mapped_columns), self.deadline)
+            else:
+                async with semaphore:
+                    mapping = await asyncio.wait_for(self._attempts(df_columns, mapped_columns), self.deadline)
+        except BaseException:
+            # BaseException too: a cancelled probe must not leave the circuit half-open for good.
+            self._record(False)
+            raise
+        self._record(True)
+        return mapping
+
+    async def amap_many(self, column_lists, mapped_columns):
+        semaphore = asyncio.Semaphore(max(1, self.max_concurrency))
+        return await asyncio.gather(
+            *(self.amap_columns(columns, mapped_columns, semaphore) for columns in column_lists),
+            return_exceptions=True,
         )
-        mapping_text = response.choices[0].message['content'].strip()
-        mapping = json.loads(mapping_text)
+
+    def map_columns(self, df_columns, mapped_columns):
+        """Blocking wrapper around amap_columns for synchronous callers."""
+        return asyncio.run(self.amap_columns(list(df_columns), mapped_columns))
+
+    def map_many(self, column_lists, mapped_columns):
+        """Map several column lists concurrently; failed entries come back as exceptions."""
+        return asyncio.run(self.amap_many([list(columns) for columns in column_lists], mapped_columns))
+
+GPT_CLIENT = GPTMappingClient()
+
+@timed("gpt.request")
+def _request_gpt_mapping(df_columns, mapped_columns):
+    """Ask GPT to map df_columns onto mapped_columns. Raises if the reply is unusable."""
+    return GPT_CLIENT.map_columns(df_columns, mapped_columns)
+
+# Local column matching: a fast first tier in front of GPT. Headers are reduced to
+# canonical tokens ("Date of birth (dd/mm/yyyy)" -> "dob", "NI No" -> "ni number")
+# and scored against the keys and values of the field map.
+HEADER_PHRASES = [
+    (r'\bdate\s*of\s*birth\b|\bbirth\s*date\b|\bd\.?o\.?b\b', 'dob'),
+    (r'\bfirst\s*name\b|\bfore\s*names?\b|\bgiven\s*names?\b|\bchristian\s*name\b', 'firstname'),
+    (r'\blast\s*name\b|\bfamily\s*name\b|\bsur\s*name\b', 'surname'),
+    (r'\bpost\s*code\b|\bpostal\s*code\b|\bzip\s*code\b|\bzip\b', 'postcode'),
+    (r'\bnational\s*insurance\b|\bn\.i\.', 'ni'),
+    (r'\bnino\b', 'ni number'),
+    (r'\be-?mail\b', 'email'),
+]
+HEADER_SYNONYMS = {
+    "no": "number", "num": "number", "nbr": "number", "nr": "number",
+    "tel": "telephone", "phone": "telephone", "mob": "mobile", "cell": "mobile",
+    "addr": "address", "town": "city", "sal": "salary", "pay": "salary",
+}
+HEADER_STOPWORDS = {"of", "the", "employee", "emp", "staff", "dd", "mm", "yy", "yyyy", "please", "enter"}
+
+NI_NUMBER_PATTERN = r'^[A-CEGHJ-PR-TW-Z]{2}\s?\d{2}\s?\d{2}\s?\d{2}\s?[A-D]$'
+POSTCODE_PATTERN = r'^[A-Z]{1,2}\d[A-Z\d]?\s*\d[A-Z]{2}$'
+EMAIL_PATTERN = r'^[^@\s]+@[^@\s]+\.[^@\s]+$'
+DATE_VALUE_PATTERN = r'^\d{1,4}[-/. ]\d{1,2}[-/. ]\d{1,4}(?:[ T]\d{1,2}:\d{2}(?::\d{2})?)?$'
+# Values that identify a field by their shape, whatever the header says.
+VALUE_PATTERNS = [
+    (NI_NUMBER_PATTERN, "National Insurance Number"),
+    (POSTCODE_PATTERN, "Post Code"),
+    (EMAIL_PATTERN, "Personal Email Address"),
+]
+
+def normalize_header(header):
+    """Canonical token tuple for a column header or field name."""
+    text = re.sub(r'\.\d+$', '', str(header).strip())  # pandas suffix for repeated headers
+    text = re.sub(r'\(.*?\)|\[.*?\]', ' ', text)  # format hints such as "(dd/mm/yyyy)"
+    text = re.sub(r'(?<=[a-z])(?=[A-Z])', ' ', text).lower()  # camelCase
+    for pattern, replacement in HEADER_PHRASES:
+        text = re.sub(pattern, f' {replacement} ', text)
+    tokens = (HEADER_SYNONYMS.get(token, token) for token in re.findall(r'[a-z]+|\d+', text))
+    return tuple(token for token in tokens if token not in HEADER_STOPWORDS)
+
+def _trigrams(text):
+    text = f"  {text} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def _dice(a, b):
+    return 2 * len(a & b) / (len(a) + len(b)) if a and b else 0.0
+
+@functools.lru_cache(maxsize=4096)
+def _word_trigrams(word):
+    return frozenset(_trigrams(word))
+
+def _extra_words(a, b):
+    # Whether either token set has a word with no equal or near-equal (typo) word in the other.
+    def missing(tokens, others):
+        return any(token not in others and not any(_dice(_word_trigrams(token), _word_trigrams(other)) >= 0.6
+                                                   for other in others)
+                   for token in tokens)
+    return missing(a, b) or missing(b, a)
+
+def _sample_values(samples, col, limit=20):
+    # samples maps a column to its values: a DataFrame, or a dict of lists or scalars.
+    if samples is None:
+        return []
+    try:
+        values = samples[col]
+    except (KeyError, IndexError, TypeError):
+        return []
+    if isinstance(values, pd.DataFrame):
+        values = values.iloc[:, -1]
+    if isinstance(values, str) or not hasattr(values, "__iter__"):
+        values = [values]
+    out = []
+    for value in values:
+        if _is_blank(value):
+            continue
+        out.append(str(value).strip())
+        if len(out) == limit:
+            break
+    return out
+
+class ColumnMatcher:
+    """
+    Offline column matcher built once per field map. Every key and value of the
+    map becomes a candidate phrase, indexed by token and by character trigram, so
+    a header is only scored against candidates it shares something with.
+
+    match() returns {column: (field or None, confidence)}. A confidence of 1.0
+    means the normalized header equals a known phrase. A header that only
+    shares some words with a phrase ("Telephone Number" and "Mobile Telephone
+    Number") scores at most partial_score, below threshold, and a field without
+    a lead of min_lead over the runner-up is marked down, so both are escalated
+    rather than guessed.
+    Sample values, if given, can confirm or supply a field: NI numbers,
+    postcodes and email addresses are recognised by shape, and date-like values
+    favour date fields.
+    """
+    def __init__(self, mapped_columns, threshold=0.8, min_score=0.6, partial_score=0.75, min_lead=0.1):
+        self.threshold = threshold
+        self.min_score = min_score
+        self.partial_score = partial_score
+        self.min_lead = min_lead
+        self.fields = set(mapped_columns.values())
+        self._exact = {}
+        self._candidates = []
+        self._token_index = {}
+        self._trigram_index = {}
+        for phrase, field in itertools.chain(((v, v) for v in mapped_columns.values()), mapped_columns.items()):
+            tokens = normalize_header(phrase)
+            if not tokens:
+                continue
+            # A phrase that is itself a field name wins over a key pointing elsewhere.
+            self._exact.setdefault(tokens, field)
+            compact = "".join(tokens)
+            idx = len(self._candidates)
+            self._candidates.append((field, frozenset(tokens), _trigrams(compact)))
+            for token in tokens:
+                self._token_index.setdefault(token, set()).add(idx)
+            for gram in _trigrams(compact):
+                self._trigram_index.setdefault(gram, set()).add(idx)
+        # Tokens shared by many fields ("address", "number") say little on their own.
+        token_fields = {}
+        for field, tokens, _ in self._candidates:
+            for token in tokens:
+                token_fields.setdefault(token, set()).add(field)
+        self._token_weight = {token: 1.0 / len(fields) for token, fields in token_fields.items()}
+        self._value_patterns = [(re.compile(p, re.IGNORECASE), f) for p, f in VALUE_PATTERNS if f in self.fields]
+        self._date_fields = {field for field in self.fields if "date" in normalize_header(field) or "dob" in normalize_header(field)}
+
+    def _header_scores(self, tokens):
+        # Best score per field for one normalized header.
+        if tokens in self._exact:
+            return {self._exact[tokens]: 1.0}
+        token_set = frozenset(tokens)
+        grams = _trigrams("".join(tokens))
+        digits = {t for t in token_set if t.isdigit()}
+        ids = set()
+        for token in token_set:
+            ids |= self._token_index.get(token, set())
+        for gram in grams:
+            ids |= self._trigram_index.get(gram, set())
+        scores = {}
+        for idx in ids:
+            field, cand_tokens, cand_grams = self._candidates[idx]
+            score = max(_dice(token_set, cand_tokens), 0.95 * _dice(grams, cand_grams))
+            if cand_tokens < token_set:
+                # The header is the phrase plus extra words, e.g. "Home Post Code". The
+                # more the extra words weigh, the less it is that field ("Emergency
+                # Contact Address" is not the home address).
+                covered = sum(self._token_weight.get(t, 1.0) for t in cand_tokens)
+                total = sum(self._token_weight.get(t, 1.0) for t in token_set)
+                score = max(score, 0.5 + (self.partial_score - 0.5) * covered / total)
+            if token_set & cand_tokens and _extra_words(token_set, cand_tokens):
+                # Some words in common, others missing on one side: never a confident
+                # match on its own. Misspelt words ("Adress") are not missing.
+                score = min(score, self.partial_score)
+            cand_digits = {t for t in cand_tokens if t.isdigit()}
+            if digits != cand_digits and (digits or cand_digits):
+                score *= 0.5  # "Address Line 3" is not "Address Line 1"
+            if score > scores.get(field, 0.0):
+                scores[field] = score
+        return scores
+
+    def _sniff(self, values):
+        # Field suggested by the shape of the sample values, and whether they look like dates.
+        if not values:
+            return None, False
+        need = 0.8 * len(values)
+        for pattern, field in self._value_patterns:
+            if sum(1 for value in values if pattern.match(value)) >= need:
+                return field, False
+        return None, sum(1 for value in values if re.match(DATE_VALUE_PATTERN, value)) >= need
+
+    def match(self, columns, samples=None):
+        result = {}
+        for col in columns:
+            scores = self._header_scores(normalize_header(col))
+            sniffed, dates = self._sniff(_sample_values(samples, col))
+            if sniffed is not None:
+                scores[sniffed] = max(scores.get(sniffed, 0.0), 0.85)
+            if dates:
+                for field in self._date_fields.intersection(scores):
+                    scores[field] = min(1.0, scores[field] + 0.2)
+            if not scores:
+                result[col] = (None, 0.0)
+                continue
+            ranked = sorted(scores.items(), key=lambda item: -item[1])
+            field, confidence = ranked[0]
+            if len(ranked) > 1 and confidence < 1.0 and ranked[1][1] > confidence - self.min_lead:
+                confidence *= 0.75
+            result[col] = (field, confidence)
+        return result
+
+    def map_columns(self, columns, samples=None, threshold=None):
+        """
+        Split columns into (mapping, unresolved): mapping holds every column
+        matched with at least threshold confidence, unresolved lists the rest.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        mapping, unresolved = {}, []
+        for col, (field, confidence) in self.match(columns, samples).items():
+            if field is not None and confidence >= threshold:
+                mapping[col] = field
+            else:
+                unresolved.append(col)
+        return mapping, unresolved
+
+_COLUMN_MATCHERS = {}
+
+def column_matcher(mapped_columns):
+    """Shared ColumnMatcher for mapped_columns, built on first use."""
+    key = tuple(mapped_columns.items())
+    matcher = _COLUMN_MATCHERS.get(key)
+    if matcher is None:
+        matcher = _COLUMN_MATCHERS[key] = ColumnMatcher(mapped_columns)
+    return matcher
+
+def _fallback_map_columns(df_columns, mapped_columns, samples=None):
+    # Best local guess for every column, used when GPT is unavailable.
+    matcher = column_matcher(mapped_columns)
+    mapping, _ = matcher.map_columns(df_columns, samples, threshold=matcher.min_score)
+    return {col: mapping.get(col, col) for col in df_columns}
+
+def _without_collisions(columns, mapping):
+    """
+    mapping without the renames that would lose a column: onto the name of
+    another column, or onto a field an earlier column already took (the later
+    one would silently win). Those columns keep their own name.
+    """
+    taken = set(columns)
+    safe = {}
+    for col in columns:
+        field = mapping.get(col)
+        if field is None or field == col or field in taken:
+            continue
+        safe[col] = field
+        taken.add(field)
+    return safe
+
+@timed("columns.map")
+def gpt_map_columns(df_columns, mapped_columns, use_cache=True, samples=None):
+    """
+    Uses OpenAI GPT-4 to intelligently map the Excel sheet's columns (or dictionary keys)
+    to the internal field names. Constructs a detailed prompt instructing the model to understand
+    the meaning and content of each column.
+    Columns the local ColumnMatcher maps confidently (optionally helped by sample
+    values, see ColumnMatcher.match) never reach GPT; only the rest are sent.
+    Successful GPT answers are stored in MAPPING_CACHE, so a repeated column set costs no API call.
+    A column is never mapped onto the name of another column, or onto a field an
+    earlier column already took; it keeps its own name instead.
+    """
+    df_columns = list(df_columns)
+    local, unresolved = column_matcher(mapped_columns).map_columns(df_columns, samples)
+    INSTRUMENTS.count("columns.local", len(local))
+    if not unresolved:
+        return _without_collisions(df_columns, local)
+    cache_key = MappingCache.fingerprint(unresolved, mapped_columns)
+    answer = MAPPING_CACHE.get(cache_key) if use_cache else None
+    if answer is None:
+        INSTRUMENTS.count("columns.gpt", len(unresolved))
+        try:
+            answer = _request_gpt_mapping(unresolved, mapped_columns)
+            if use_cache:
+                MAPPING_CACHE.set(cache_key, answer)
+        except Exception as e:
+            # Fallback: the matcher's best guess if the GPT call fails.
+            answer = _fallback_map_columns(unresolved, mapped_columns, samples)
+    mapping = {col: local[col] for col in df_columns if col in local}
+    mapping.update(answer)
+    return _without_collisions(df_columns, mapping)
+
+@timed("columns.map_sets")
+def gpt_map_column_sets(column_sets, mapped_columns, max_columns_per_request=80, use_cache=True, debug=False,
+                        samples=None, fallbacks=None):
+    """
+    Map several column sets (one per uploaded file) with as few GPT requests as
+    possible. Columns the local ColumnMatcher resolves and cached sets are
+    answered locally; the remaining distinct column names of all other sets are
+    sent together, max_columns_per_request at a time, and the answers are fanned
+    back out to each set (and stored in MAPPING_CACHE, so the per-file
+    gpt_map_columns calls that follow are cache hits). samples, if given, holds
+    the sample values of each set for ColumnMatcher.match. If fallbacks (a set)
+    is given, the indices of the sets mapped by the local fallback because GPT
+    failed are added to it.
+    Returns one mapping per entry of column_sets, in order.
+    """
+    column_sets = [[str(col) for col in columns] for columns in column_sets]
+    samples = samples if samples is not None else [None] * len(column_sets)
+    matcher = column_matcher(mapped_columns)
+    local = [matcher.map_columns(columns, set_samples) for columns, set_samples in zip(column_sets, samples)]
+    INSTRUMENTS.count("columns.local", sum(len(mapping) for mapping, _ in local))
+    keys = [MappingCache.fingerprint(unresolved, mapped_columns) for _, unresolved in local]
+    results = [None] * len(column_sets)
+    pending = {}
+    for i, (key, (mapping, unresolved)) in enumerate(zip(keys, local)):
+        cached = MAPPING_CACHE.get(key) if use_cache and unresolved else None
+        if not unresolved:
+            results[i] = mapping
+        elif cached is not None:
+            results[i] = {**mapping, **cached}
+        else:
+            pending.setdefault(key, (unresolved, samples[i]))
+
+    distinct = list(dict.fromkeys(col for unresolved, _ in pending.values() for col in unresolved))
+    batches = [distinct[start:start + max_columns_per_request] for start in range(0, len(distinct), max_columns_per_request)]
+    INSTRUMENTS.count("columns.gpt", len(distinct))
+    answers, failed = {}, set()
+    try:
+        with INSTRUMENTS.stage("gpt.request"):
+            replies = GPT_CLIENT.map_many(batches, mapped_columns) if batches else []
     except Exception as e:
-        # Fallback: simple case-insensitive matching if GPT call fails.
-        mapping = {}
-        for col in df_columns:
-            mapped_field = None
-            for key, value in mapped_columns.items():
-                if col.lower() == key.lower() or col.lower() == value.lower():
-                    mapped_field = value
-                    break
-            mapping[col] = mapped_field
-    return mapping
+        replies = [e] * len(batches)
+    for batch, answer in zip(batches, replies):
+        if isinstance(answer, Exception):
+            if _debugging(debug):
+                LOGGER.debug("Batched GPT mapping failed, falling back: %s", answer)
+            failed.update(batch)
+        else:
+            answers.update({col: answer[col] for col in batch if col in answer})
+    if _debugging(debug):
+        n_local = sum(len(mapping) for mapping, _ in local)
+        LOGGER.debug("Matched %d columns locally; mapped %d distinct columns from %d column sets in %d GPT request(s)",
+                     n_local, len(distinct), len(pending), -(-len(distinct) // max_columns_per_request))
+
+    mappings = {}
+    for key, (unresolved, set_samples) in pending.items():
+        if failed.intersection(unresolved):
+            mappings[key] = _fallback_map_columns(unresolved, mapped_columns, set_samples)
+            continue
+        # Columns GPT left out keep their name, as with a single-file mapping.
+        mappings[key] = {col: answers[col] for col in unresolved if col in answers}
+        if use_cache:
+            MAPPING_CACHE.set(key, mappings[key])
+    for i, key in enumerate(keys):
+        if results[i] is None:
+            results[i] = {**local[i][0], **mappings[key]}
+            if fallbacks is not None and failed.intersection(pending[key][0]):
+                fallbacks.add(i)
+    return [_without_collisions(columns, mapping) for columns, mapping in zip(column_sets, results)]
 
 # =========================
 # 3) Parsing Employee Files (DOCX, PDF, CSV/TXT, Excel) with optional AI mapping
 # =========================
+# An uploaded file reaches the parsers as a "source": bytes, any other buffer
+# (bytearray, memoryview such as UploadedFile.getbuffer(), mmap) or a seekable
+# binary file object. open_source reads each of them in place, never copying it.
+class BufferReader(io.RawIOBase):
+    """A read-only, seekable binary file over a buffer, read in place (BytesIO would copy it)."""
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast("B")
+        self._pos = 0
 
-def parse_docx(file_bytes, use_ai=False, debug=False):
-    text = docx2txt.process(io.BytesIO(file_bytes))
-    lines = [line.strip() for line in text.split("\n") if line.strip()]
-    if debug:
-        print("DEBUG: Raw DOCX lines:", lines)
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        start = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, start + offset)
+        return self._pos
+
+    def readinto(self, buffer):
+        chunk = self._view[self._pos:self._pos + len(buffer)]
+        memoryview(buffer).cast("B")[:len(chunk)] = chunk
+        self._pos += len(chunk)
+        return len(chunk)
+
+def _is_file(source):
+    return hasattr(source, "read")
+
+def open_source(source):
+    """
+    A binary file object at the start of source. bytes go into a BytesIO (which
+    shares them), other buffers into a BufferReader; file objects are rewound
+    and returned as they are, still owned by the caller.
+    """
+    if isinstance(source, bytes):
+        return io.BytesIO(source)
+    if _is_file(source):
+        source.seek(0)
+        return source
+    return BufferReader(source)
+
+def source_size(source):
+    if _is_file(source):
+        return source.seek(0, io.SEEK_END)
+    return memoryview(source).nbytes
+
+def source_bytes(source):
+    """source as bytes, e.g. to send it to a worker process (a copy unless it already is bytes)."""
+    if isinstance(source, bytes):
+        return source
+    if _is_file(source):
+        return open_source(source).read()
+    return memoryview(source).tobytes()
+
+def _iter_blocks(source, block_size=1024 * 1024):
+    fileobj = open_source(source)
+    return iter(lambda: fileobj.read(block_size), b"")
+
+
+def build_label_matcher(field_map):
+    """
+    Compile the labels of field_map into one case-insensitive regex that matches a
+    label at the start of a line. Alternatives are ordered longest first, so e.g.
+    "Telephone Number of Emergency Contact" wins over "Telephone Number".
+    Returns (pattern, lookup) where lookup maps a lowercased label to its field.
+    """
+    lookup = {}
+    for key, value in field_map.items():
+        lookup.setdefault(key.lower(), value)
+    labels = sorted(lookup, key=lambda label: (-len(label), label))
+    # A label must end at a word boundary: "Sex" should not match "Sexual orientation".
+    pattern = re.compile(
+        r"^(?:" + "|".join(re.escape(label) for label in labels) + r")(?![a-z0-9])",
+        re.IGNORECASE,
+    )
+    return pattern, lookup
+
+LABEL_PATTERN, LABEL_LOOKUP = build_label_matcher(FIELD_MAP)
+
+def iter_line_fields(lines, debug=False):
+    """
+    Yield (field, value) for each label found in lines, in document order. A
+    value either follows its label on the same line ("Label: value") or, when
+    the line holds only the label, is taken from the next line. lines may be
+    any iterable, so a document can be scanned as it is extracted.
+    """
+    pending = None
+    for line in lines:
+        if pending is not None:
+            field, key = pending
+            pending = None
+            fallback_value = line.strip()
+            if _debugging(debug):
+                LOGGER.debug("Found '%s' on separate line -> %s", key, fallback_value)
+            yield field, fallback_value
+        match = LABEL_PATTERN.match(line)
+        if not match:
+            continue
+        key = match.group(0)
+        field = LABEL_LOOKUP[key.lower()]
+        potential_value = line[match.end():].strip(" :")
+        if potential_value:
+            if _debugging(debug):
+                LOGGER.debug("Found '%s' on same line -> %s", key, potential_value)
+            yield field, potential_value
+        else:
+            pending = (field, key)
+
+def extract_fields_from_lines(lines, debug=False, stop_fields=None):
+    """
+    Single pass over the non-empty, stripped lines of a document; a later value
+    for a field overwrites an earlier one. With stop_fields, scanning stops as
+    soon as every one of those fields has a value.
+    """
     data = {}
-    for i, line in enumerate(lines):
-        for key in FIELD_MAP:
-            if line.lower().startswith(key.lower()):
-                potential_value = line[len(key):].strip(" :")
-                if potential_value:
-                    data[FIELD_MAP[key]] = potential_value
-                    if debug:
-                        print(f"DEBUG: Found '{key}' on same line -> {potential_value}")
-                    break
-                else:
-                    if line.strip().lower() == key.lower() and (i + 1) < len(lines):
-                        fallback_value = lines[i + 1].strip()
-                        data[FIELD_MAP[key]] = fallback_value
-                        if debug:
-                            print(f"DEBUG: Found '{key}' on separate line -> {fallback_value}")
-                        break
+    remaining = set(stop_fields) if stop_fields else None
+    for field, value in iter_line_fields(lines, debug=debug):
+        data[field] = value
+        if remaining is not None:
+            remaining.discard(field)
+            if not remaining:
+                break
+    return data
+
+WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+# Run content that is not body text: images, legacy shapes, tracked deletions and
+# the duplicate fallback copy of drawings in markup-compatibility blocks.
+DOCX_SKIP_TAGS = {
+    WORD_NS + "drawing", WORD_NS + "pict", WORD_NS + "del", WORD_NS + "rPr", WORD_NS + "pPr",
+    "{http://schemas.openxmlformats.org/markup-compatibility/2006}AlternateContent",
+}
+
+def _docx_text(element, parts):
+    for child in element:
+        tag = child.tag
+        if tag == WORD_NS + "t":
+            parts.append(child.text or "")
+        elif tag == WORD_NS + "tab":
+            parts.append("\t")
+        elif tag in (WORD_NS + "br", WORD_NS + "cr"):
+            parts.append("\n")
+        elif tag not in DOCX_SKIP_TAGS:
+            _docx_text(child, parts)
+    return parts
+
+def _docx_paragraph_lines(paragraph):
+    for line in "".join(_docx_text(paragraph, [])).split("\n"):
+        line = line.strip()
+        if line:
+            yield line
+
+def _docx_block_lines(element):
+    # Lines of the paragraphs and tables directly under element (the body, a cell
+    # or a content control), in document order.
+    for child in element:
+        if child.tag == WORD_NS + "p":
+            yield from _docx_paragraph_lines(child)
+        elif child.tag == WORD_NS + "tbl":
+            yield from _docx_table_lines(child)
+        elif child.tag == WORD_NS + "sdt":
+            content = child.find(WORD_NS + "sdtContent")
+            if content is not None:
+                yield from _docx_block_lines(content)
+
+def _docx_children(element, tag):
+    # Direct children with the given tag, looking through content controls.
+    for child in element:
+        if child.tag == tag:
+            yield child
+        elif child.tag == WORD_NS + "sdt":
+            content = child.find(WORD_NS + "sdtContent")
+            if content is not None:
+                yield from _docx_children(content, tag)
+
+def _docx_table_lines(table):
+    """
+    Lines of a table, row by row. A cell holding nothing but a form label and
+    followed by another cell becomes one "Label: value" line, with the value
+    cell's lines joined by ", ", so two-column forms never depend on the
+    next-line fallback (and an empty value cell yields nothing rather than the
+    next row's label). Other cells contribute their lines unchanged.
+    """
+    for row in _docx_children(table, WORD_NS + "tr"):
+        cells = [list(_docx_block_lines(cell)) for cell in _docx_children(row, WORD_NS + "tc")]
+        i = 0
+        while i < len(cells):
+            lines = cells[i]
+            if i + 1 < len(cells) and len(lines) == 1:
+                match = LABEL_PATTERN.match(lines[0])
+                if match and not lines[0][match.end():].strip(" :"):
+                    if cells[i + 1]:
+                        yield f"{match.group(0)}: {', '.join(cells[i + 1])}"
+                    i += 2
+                    continue
+            yield from lines
+            i += 1
+
+def _xml_parser():
+    # Uploaded DOCX/XLSX XML: never expand entities or fetch anything (python-docx does the same).
+    return etree.XMLParser(resolve_entities=False, no_network=True)
+
+def _docx_main_part(archive):
+    # Name of the main document part, from the package relationships.
+    try:
+        rels = etree.fromstring(archive.read("_rels/.rels"), _xml_parser())
+    except KeyError:
+        return "word/document.xml"
+    for rel in rels:
+        if rel.get("Type", "").endswith("/officeDocument"):
+            return rel.get("Target", "").lstrip("/")
+    return "word/document.xml"
+
+def iter_docx_lines(file_bytes):
+    """
+    Non-empty, stripped lines of a DOCX body: paragraphs and tables in order,
+    label/value table cells paired up (see _docx_table_lines). Page headers,
+    footers and images are skipped. Only the main document part is parsed (with
+    lxml, as python-docx does); opening the whole package with docx.Document
+    costs ~10 ms per file before any text is read.
+    """
+    with zipfile.ZipFile(open_source(file_bytes)) as archive:
+        root = etree.fromstring(archive.read(_docx_main_part(archive)), _xml_parser())
+    body = root.find(WORD_NS + "body")
+    return _docx_block_lines(body if body is not None else root)
+
+@timed("parse.docx")
+def parse_docx(file_bytes, use_ai=False, debug=False):
+    lines = iter_docx_lines(file_bytes)
+    if _debugging(debug):
+        lines = list(lines)
+        LOGGER.debug("Raw DOCX lines: %s", lines)
+    data = extract_fields_from_lines(lines, debug=debug)
     # Apply AI mapping if enabled.
     return apply_ai_mapping_to_dict(data, use_ai=use_ai, debug=debug)
 
-def parse_pdf(file_bytes, use_ai=False, debug=False):
-    pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_bytes))
-    text = ""
-    for page in pdf_reader.pages:
-        page_text = page.extract_text()
-        if page_text:
-            text += page_text + "\n"
-    lines = [line.strip() for line in text.split("\n") if line.strip()]
-    if debug:
-        print("DEBUG: Raw PDF lines:", lines)
-    data = {}
-    for i, line in enumerate(lines):
-        for key in FIELD_MAP:
-            if line.lower().startswith(key.lower()):
-                potential_value = line[len(key):].strip(" :")
-                if potential_value:
-                    data[FIELD_MAP[key]] = potential_value
-                    if debug:
-                        print(f"DEBUG: Found '{key}' on same line -> {potential_value}")
-                    break
-                else:
-                    if line.strip().lower() == key.lower() and (i + 1) < len(lines):
-                        fallback_value = lines[i + 1].strip()
-                        data[FIELD_MAP[key]] = fallback_value
-                        if debug:
-                            print(f"DEBUG: Found '{key}' on separate line -> {fallback_value}")
-                        break
+def _pdf_page_texts(file_bytes, start, stop):
+    # Text of pages start..stop-1; also the unit of work for page-parallel extraction.
+    pdf_reader = PyPDF2.PdfReader(open_source(file_bytes))
+    return [pdf_reader.pages[i].extract_text() or "" for i in range(start, min(stop, len(pdf_reader.pages)))]
+
+def iter_pdf_pages(file_bytes, max_pages=None, processes=0, pages_per_task=8):
+    """
+    Yield the text of each page of a PDF in order, extracting lazily so a caller
+    that stops early skips the remaining pages. max_pages caps how many pages
+    are read. With processes > 0, documents longer than one task are extracted
+    pages_per_task pages at a time in a process pool, a few tasks ahead of the
+    caller.
+    """
+    pdf_reader = PyPDF2.PdfReader(open_source(file_bytes))
+    n_pages = len(pdf_reader.pages) if max_pages is None else min(max_pages, len(pdf_reader.pages))
+    if not processes or n_pages <= pages_per_task:
+        for i in range(n_pages):
+            yield pdf_reader.pages[i].extract_text() or ""
+        return
+    starts = iter(range(0, n_pages, pages_per_task))
+    file_bytes = source_bytes(file_bytes)  # workers get their own copy
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        window = []
+        try:
+            for start in itertools.islice(starts, processes * 2):
+                window.append(pool.submit(_pdf_page_texts, file_bytes, start, min(start + pages_per_task, n_pages)))
+            while window:
+                texts = window.pop(0).result()
+                start = next(starts, None)
+                if start is not None:
+                    window.append(pool.submit(_pdf_page_texts, file_bytes, start, min(start + pages_per_task, n_pages)))
+                yield from texts
+        finally:
+            for future in window:
+                future.cancel()
+
+def _page_lines(pages):
+    for page_text in pages:
+        for line in page_text.split("\n"):
+            line = line.strip()
+            if line:
+                yield line
+
+@timed("parse.pdf")
+def parse_pdf(file_bytes, use_ai=False, debug=False, max_pages=None, stop_fields=FORM_FIELDS, processes=0):
+    """
+    Pages are extracted and scanned as a stream: reading stops once every field
+    in stop_fields has been found (pass None to always read the whole document)
+    or after max_pages pages. processes > 0 extracts long documents in parallel
+    (see iter_pdf_pages).
+    """
+    pages = iter_pdf_pages(file_bytes, max_pages=max_pages, processes=processes)
+    with contextlib.closing(pages):
+        lines = _page_lines(pages)
+        if _debugging(debug):
+            lines = list(lines)
+            LOGGER.debug("Raw PDF lines: %s", lines)
+        data = extract_fields_from_lines(lines, debug=debug, stop_fields=stop_fields)
     # Apply AI mapping if enabled.
     return apply_ai_mapping_to_dict(data, use_ai=use_ai, debug=debug)
 
-def parse_csv_employee(file_bytes, use_ai=False, debug=False):
-    text = file_bytes.decode('utf-8')
-    try:
-        df = pd.read_csv(io.StringIO(text))
-        df.columns = df.columns.str.strip()
-    except Exception as e:
-        if debug:
-            print("DEBUG: Error parsing CSV/TXT employee file:", e)
-        return []
-    
+# Tried in order on text uploads without a byte order mark; latin-1 decodes anything.
+TEXT_ENCODINGS = ("utf-8", "cp1252")
+TEXT_BOMS = [
+    (codecs.BOM_UTF32_LE, "utf-32"), (codecs.BOM_UTF32_BE, "utf-32"), (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"),
+]
+CSV_CHUNK_ROWS = 50_000
+
+def detect_text_encoding(source):
+    """
+    Encoding of a CSV/TXT upload: from its byte order mark, otherwise the first
+    of TEXT_ENCODINGS that decodes the whole file, else latin-1. The file is
+    run through incremental decoders a block at a time, so no decoded copy of
+    it is ever held.
+    """
+    head = open_source(source).read(4)
+    for bom, encoding in TEXT_BOMS:
+        if head.startswith(bom):
+            return encoding
+    for encoding in TEXT_ENCODINGS:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            for block in _iter_blocks(source):
+                decoder.decode(block)
+            decoder.decode(b"", final=True)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return "latin-1"
+
+def _read_csv_head(source, encoding, nrows=0):
+    df = pd.read_csv(open_source(source), encoding=encoding, nrows=nrows)
+    df.columns = df.columns.str.strip()
+    return df
+
+def _iter_csv_chunks(source, encoding, usecols=None, chunksize=CSV_CHUNK_ROWS):
+    with pd.read_csv(open_source(source), encoding=encoding, usecols=usecols, chunksize=chunksize) as reader:
+        for chunk in reader:
+            chunk.columns = chunk.columns.str.strip()
+            yield chunk
+
+@timed("parse.csv")
+def parse_csv_employee(file_bytes, use_ai=False, debug=False, column_mapping=None, chunksize=CSV_CHUNK_ROWS):
+    """
+    Employee records from a CSV/TXT upload (bytes, a buffer or a binary file;
+    see open_source), in its detected encoding. The header (plus sample rows
+    for the column matcher) is read first; then only the columns the row
+    mapping reads are parsed, chunksize rows at a time, so beyond the records
+    returned memory stays at about one chunk whatever the file's size. A file
+    with none of those columns gives no records; one that cannot be read raises.
+    """
+    encoding = detect_text_encoding(file_bytes)
+    head = _read_csv_head(file_bytes, encoding, nrows=20 if use_ai and column_mapping is None else 0)
+
+    mapping = None
     if use_ai:
-        mapping = gpt_map_columns(df.columns, EXCEL_FIELD_MAP)
-        if debug:
-            print("DEBUG: GPT mapping for CSV:", mapping)
-        df = df.rename(columns=lambda col: mapping.get(col, col))
-    
-    emp_data_list = []
-    for index, row in df.iterrows():
-        row_dict = row.to_dict()
-        mapped = map_excel_employee_data(row_dict, debug=debug)
-        emp_data_list.append(mapped)
-    return emp_data_list
-
-def parse_excel_employee(file_bytes, sheet_name=None, use_ai=False, debug=False):
-    try:
-        df = pd.read_excel(io.BytesIO(file_bytes), sheet_name=sheet_name)
-        df.columns = df.columns.str.strip()  # Remove extra spaces from column names
-    except Exception as e:
-        if debug:
-            print("DEBUG: Error parsing Excel employee file:", e)
+        mapping = column_mapping
+        if mapping is None:
+            mapping = gpt_map_columns(head.columns, EXCEL_FIELD_MAP, samples=head)
+        if _debugging(debug):
+            LOGGER.debug("GPT mapping for CSV: %s", mapping)
+    usecols = _excel_usecols(head.columns, mapping)
+    if not usecols:
+        if _debugging(debug):
+            LOGGER.debug("CSV/TXT file has no employee columns; skipped")
         return []
-    
+
+    records = []
+    for chunk in _iter_csv_chunks(file_bytes, encoding, usecols=usecols, chunksize=chunksize):
+        if mapping:
+            chunk = chunk.rename(columns=lambda col: mapping.get(col, col))
+        records.extend(map_excel_employee_frame(chunk, debug=debug).to_dict("records"))
+    INSTRUMENTS.count("csv.chunks", -(-len(records) // chunksize))
+    return records
+
+def _is_workbook(obj):
+    return isinstance(obj, pd.ExcelFile)
+
+def open_workbook(file_bytes):
+    """
+    Open an Excel workbook once. The handle can be passed to
+    parse_excel_employee and read_tabular_sample in place of the bytes, so the
+    workbook is not decompressed and parsed again for each of them. .xlsx files
+    are read with openpyxl in read-only mode; other formats (.xls) with the
+    engine pandas picks for them.
+    """
+    if _is_workbook(file_bytes):
+        return file_bytes
+    source = open_source(file_bytes)
+    engine = "openpyxl" if zipfile.is_zipfile(source) else None
+    source.seek(0)
+    return pd.ExcelFile(source, engine=engine)
+
+def excel_sheet_names(file_bytes):
+    """Sheet names of a workbook, in order, read from its directory without opening the sheets."""
+    if _is_workbook(file_bytes):
+        return list(file_bytes.sheet_names)
+    try:
+        with zipfile.ZipFile(open_source(file_bytes)) as archive:
+            root = etree.fromstring(archive.read("xl/workbook.xml"), _xml_parser())
+    except (zipfile.BadZipFile, KeyError):
+        return list(open_workbook(file_bytes).sheet_names)  # .xls
+    return [sheet.get("name") for sheet in root.iter("{*}sheet")]
+
+def _excel_sheets(book, sheet_name):
+    # sheet_name: None for every sheet, one sheet name or index, or a list of them.
+    if sheet_name is None:
+        return list(book.sheet_names)
+    if isinstance(sheet_name, (list, tuple)):
+        return list(sheet_name)
+    return [sheet_name]
+
+def _read_excel_sheet(book, sheet, nrows=None, usecols=None):
+    df = book.parse(sheet, nrows=nrows, usecols=usecols)
+    df.columns = df.columns.str.strip()  # Remove extra spaces from column names
+    return df
+
+def _excel_usecols(columns, mapping=None):
+    # Positions of the columns map_excel_employee_frame reads (after renaming by
+    # mapping). Positions rather than names, so "X", "X.1" duplicates stay apart.
+    mapping = mapping or {}
+    return [i for i, col in enumerate(columns) if mapping.get(col, col) in EXCEL_SOURCE_NAMES]
+
+def _parse_excel_sheet(book, sheet, use_ai=False, debug=False, column_mapping=None):
+    # Header (plus sample rows for the column matcher) first, then only the needed columns.
+    head = _read_excel_sheet(book, sheet, nrows=20 if use_ai and column_mapping is None else 0)
+    mapping = None
     if use_ai:
-        mapping = gpt_map_columns(df.columns, EXCEL_FIELD_MAP)
-        if debug:
-            print("DEBUG: GPT mapping for Excel:", mapping)
+        mapping = column_mapping
+        if mapping is None:
+            mapping = gpt_map_columns(head.columns, EXCEL_FIELD_MAP, samples=head)
+        if _debugging(debug):
+            LOGGER.debug("GPT mapping for Excel sheet %s: %s", sheet, mapping)
+    usecols = _excel_usecols(head.columns, mapping)
+    if not usecols:
+        if _debugging(debug):
+            LOGGER.debug("Excel sheet %s has no employee columns; skipped", sheet)
+        return []
+    df = _read_excel_sheet(book, sheet, usecols=usecols)
+    if mapping:
         df = df.rename(columns=lambda col: mapping.get(col, col))
-    
-    emp_data_list = []
-    for index, row in df.iterrows():
-        row_dict = row.to_dict()
-        mapped = map_excel_employee_data(row_dict, debug=debug)
-        emp_data_list.append(mapped)
-    return emp_data_list
+    INSTRUMENTS.count("excel.sheets")
+    return map_excel_employee_frame(df, debug=debug).to_dict("records")
+
+def _parse_excel_sheets(workbook, sheets, use_ai=False, debug=False, column_mapping=None):
+    # One list of records per sheet. In a worker process workbook is the file's
+    # bytes, opened here.
+    book = open_workbook(workbook)
+    return [_parse_excel_sheet(book, sheet, use_ai, debug, column_mapping) for sheet in sheets]
+
+@timed("parse.excel")
+def parse_excel_employee(file_bytes, sheet_name=None, use_ai=False, debug=False, column_mapping=None, processes=0):
+    """
+    Employee records from a workbook (bytes, or a handle from open_workbook).
+    sheet_name selects the sheets: None for all of them, a name or index, or a
+    list; records come back in sheet order. The workbook is opened once, and of
+    each sheet only the columns the row mapping reads are parsed; a sheet with
+    none of them gives no records. A workbook or sheet that cannot be read
+    raises, so the file is reported as failed. With processes > 1,
+    several sheets are parsed in a process pool, each worker opening the
+    workbook itself, which only pays off for large sheets on several CPUs.
+    """
+    book = open_workbook(file_bytes)
+    sheets = _excel_sheets(book, sheet_name)
+    per_sheet = None
+    if processes > 1 and len(sheets) > 1 and not _is_workbook(file_bytes):
+        n_workers = min(processes, len(sheets))
+        groups = [list(range(len(sheets)))[i::n_workers] for i in range(n_workers)]
+        try:
+            with ProcessPoolExecutor(max_workers=n_workers) as pool:
+                payload = source_bytes(file_bytes)
+                futures = [pool.submit(_parse_excel_sheets, payload, [sheets[i] for i in group],
+                                       use_ai, debug, column_mapping) for group in groups]
+                per_sheet = [None] * len(sheets)
+                for group, future in zip(groups, futures):
+                    for i, records in zip(group, future.result()):
+                        per_sheet[i] = records
+        except BrokenProcessPool:
+            per_sheet = None  # no process pool on this platform; parse in-process
+    if per_sheet is None:
+        per_sheet = _parse_excel_sheets(book, sheets, use_ai, debug, column_mapping)
+    return [record for records in per_sheet for record in records]
 
 # =========================
 # 4) Updated: Map Excel Employee Row
@@ -252,10 +1470,10 @@ def map_excel_employee_data(row, debug=False):
     mapped["Surname*"] = row.get("Surname", np.nan)
     mapped["FirstName*"] = row.get("First Name", row.get("Firstname", np.nan))
     mapped["SchemeRef*"] = np.nan
-    mapped["CategoryName"] = row.get("CategoryName", np.nan)
+    mapped["CategoryName"] = row.get("CategoryName", row.get("Category Name", np.nan))
     mapped["Title"] = row.get("Title", np.nan)
     # Map address: try split parts first; fallback to a combined "Address" field
-    mapped["AddressLine1"] = row.get("Address 1", row.get("Address Line1", row.get("Address", np.nan)))
+    mapped["AddressLine1"] = row.get("Address 1", row.get("Address Line1", row.get("Address", row.get("Home Address", np.nan))))
     mapped["AddressLine2"] = row.get("Address 2", row.get("Address Line2", np.nan))
     mapped["AddressLine3"] = row.get("Address 3", row.get("Address Line3", np.nan))
     mapped["AddressLine4"] = row.get("Address 4", row.get("Address Line4", np.nan))
@@ -266,11 +1484,11 @@ def map_excel_employee_data(row, debug=False):
     mapped["AdviceType*"] = row.get("AdviceType", np.nan)
     mapped["DateJoinedScheme"] = robust_parse_date_str(str(row.get("Start Date", row.get("Hire Date", ""))))
     mapped["DateofBirth*"] = robust_parse_date_str(str(row.get("Date of Birth", row.get("Date Of Birth", ""))))
-    mapped["EmailAddress"] = row.get("Email Address", row.get("Email", np.nan))
-    mapped["Gender"] = row.get("Legal Gender", row.get("Sex", np.nan))
+    mapped["EmailAddress"] = row.get("Email Address", row.get("Email", row.get("Personal Email Address", np.nan)))
+    mapped["Gender"] = row.get("Legal Gender", row.get("Sex", row.get("Gender", np.nan)))
     mapped["HomeNumber"] = row.get("Home Telephone Number", row.get("Telephone Number", np.nan))
     mapped["MobileNumber"] = row.get("Mobile Telephone Number", row.get("Telephone.1", np.nan))
-    mapped["NINumber"] = row.get("NI Number", np.nan)
+    mapped["NINumber"] = row.get("NI Number", row.get("National Insurance Number", np.nan))
     # Updated salary mapping: check for "Basic Annual Salary", "Basic Salary", then "Salary"
     mapped["PensionableSalary"] = row.get("Basic Annual Salary", row.get("Basic Salary", row.get("Salary", np.nan)))
     mapped["PensionableSalaryStartDate"] = mapped["DateJoinedScheme"]
@@ -281,40 +1499,252 @@ def map_excel_employee_data(row, debug=False):
     mapped["SplitTemplateGroupSource"] = np.nan
     mapped["ServiceStatus"] = np.nan
     mapped["ClientCategory"] = np.nan
-    if debug:
-        print("DEBUG: Mapped Excel row:", mapped)
+    if _debugging(debug):
+        LOGGER.debug("Mapped Excel row: %s", mapped)
     return mapped
 
+# Source columns for each master column, in fallback order. This mirrors the
+# nested row.get() chains in map_excel_employee_data: the first column that is
+# present in the file wins, even if its value is blank for a given row. Columns
+# are read under the EXCEL_FIELD_MAP keys (what GPT answers) as well as its
+# values (what ColumnMatcher answers).
+EXCEL_SOURCE_COLUMNS = {
+    "Surname*": ["Surname"],
+    "FirstName*": ["First Name", "Firstname"],
+    "SchemeRef*": [],
+    "CategoryName": ["CategoryName", "Category Name"],
+    "Title": ["Title"],
+    "AddressLine1": ["Address 1", "Address Line1", "Address", "Home Address"],
+    "AddressLine2": ["Address 2", "Address Line2"],
+    "AddressLine3": ["Address 3", "Address Line3"],
+    "AddressLine4": ["Address 4", "Address Line4"],
+    "CityTown": ["City"],
+    "County": ["County", "county"],
+    "Country": ["Country of Residence", "Country"],
+    "PostCode": ["Postcode", "Post Code"],
+    "AdviceType*": ["AdviceType"],
+    "DateJoinedScheme": ["Start Date", "Hire Date"],
+    "DateofBirth*": ["Date of Birth", "Date Of Birth"],
+    "EmailAddress": ["Email Address", "Email", "Personal Email Address"],
+    "Gender": ["Legal Gender", "Sex", "Gender"],
+    "HomeNumber": ["Home Telephone Number", "Telephone Number"],
+    "MobileNumber": ["Mobile Telephone Number", "Telephone.1"],
+    "NINumber": ["NI Number", "National Insurance Number"],
+    "PensionableSalary": ["Basic Annual Salary", "Basic Salary", "Salary"],
+    "PensionableSalaryStartDate": [],
+    "SalaryPostSacrifice": [],
+    "PolicyNumber": [],
+    "SellingAdviserId*": [],
+    "SplitTemplateGroupName": [],
+    "SplitTemplateGroupSource": [],
+    "ServiceStatus": [],
+    "ClientCategory": [],
+}
+
+# Every header map_excel_employee_frame can read; parse_excel_employee parses only these.
+EXCEL_SOURCE_NAMES = frozenset(col for candidates in EXCEL_SOURCE_COLUMNS.values() for col in candidates)
+
+EXCEL_DATE_COLUMNS = ["DateJoinedScheme", "DateofBirth*"]
+
+@timed("map.excel_rows")
+def map_excel_employee_frame(df, debug=False):
+    """
+    Column-wise equivalent of calling map_excel_employee_data on every row of df.
+    Each master column's fallback chain is resolved once for the whole file and
+    the output frame is built from whole columns.
+    """
+    # Like row.to_dict(), a duplicated header keeps its last column.
+    if df.columns.duplicated().any():
+        df = df.loc[:, ~df.columns.duplicated(keep="last")]
+    present = set(df.columns)
+    out = {}
+    for target, candidates in EXCEL_SOURCE_COLUMNS.items():
+        source = next((col for col in candidates if col in present), None)
+        if candidates and _debugging(debug):
+            LOGGER.debug("Excel column for '%s' -> %s", target, source)
+        if target in EXCEL_DATE_COLUMNS:
+            if source is None:
+                out[target] = pd.Series(pd.NaT, index=df.index)
+            elif pd.api.types.is_datetime64_dtype(df[source].dtype):
+                out[target] = robust_parse_dates(df[source])
+            else:
+                out[target] = robust_parse_dates(df[source].astype(str))
+        elif source is None:
+            out[target] = pd.Series(np.nan, index=df.index, dtype=object)
+        else:
+            out[target] = df[source].astype(object)
+    out["PensionableSalaryStartDate"] = out["DateJoinedScheme"]
+    frame = pd.DataFrame(out, index=df.index, columns=MASTER_COLUMNS).reset_index(drop=True)
+    return apply_master_schema(frame, debug=debug)
+
 # =========================
 # 5) Load Master File (Excel, CSV, or TXT)
 # =========================
-def load_master_file(file_obj, file_name):
+@timed("master.load")
+def load_master_file(file_obj, file_name, lazy=False):
+    """
+    Read the master file into a DataFrame. With lazy=True a LazyMaster is
+    returned instead, which streams the existing rows rather than loading them;
+    .xls masters cannot be streamed and are always loaded whole.
+    """
+    if lazy and not file_name.lower().endswith(".xls"):
+        return LazyMaster(file_obj, file_name)
+    # Text columns are read as text, so phone and NI numbers keep their leading
+    # zeros, and only empty cells are missing ("NA" stays), as in LazyMaster.
     if file_name.lower().endswith((".xlsx", ".xls")):
-        df = pd.read_excel(file_obj)
+        book = pd.ExcelFile(file_obj)
+        header = book.parse(0, nrows=0).columns
+        df = book.parse(0, dtype=_master_text_dtypes(header), keep_default_na=False, na_values=[""])
     elif file_name.lower().endswith((".csv", ".txt")):
-        df = pd.read_csv(file_obj)
+        header = pd.read_csv(file_obj, nrows=0).columns
+        if _is_file(file_obj):
+            file_obj.seek(0)
+        df = pd.read_csv(file_obj, dtype=_master_text_dtypes(header), keep_default_na=False, na_values=[""])
     else:
         raise ValueError("Unsupported master file type. Please upload an Excel, CSV, or TXT file.")
     df.columns = df.columns.str.strip()
-    return df
+    return apply_master_schema(df)
+
+def _master_text_dtypes(header):
+    # read_csv/read_excel dtype for the columns (as named in the file) MASTER_SCHEMA keeps as text.
+    return {col: str for col in header if MASTER_SCHEMA.get(str(col).strip()) in (STRING_DTYPE, "category")}
+
+def _fit_row(row, width):
+    # Read-only sheets may drop trailing empty cells or carry extra ones.
+    row = tuple(row[:width])
+    return row + (None,) * (width - len(row))
+
+class LazyMaster:
+    """
+    A master file that is never loaded whole. Only the header is read up front;
+    new employee records are kept in a small frame and the existing rows are
+    streamed from the source again at export time, in chunks of chunk_size.
+    CSV masters are read with every column as text, so values such as phone
+    numbers and NI numbers pass through exactly as they were.
+
+    source is a path, bytes, or a seekable binary file object. Legacy .xls
+    workbooks cannot be streamed; load_master_file(..., lazy=True) loads those whole.
+    """
+    def __init__(self, source, file_name, chunk_size=50_000):
+        if file_name.lower().endswith(".xls"):
+            raise ValueError("LazyMaster cannot stream .xls masters; load them with load_master_file.")
+        if not file_name.lower().endswith((".xlsx", ".csv", ".txt")):
+            raise ValueError("Unsupported master file type. Please upload an Excel, CSV, or TXT file.")
+        self.source = source if isinstance(source, (str, os.PathLike)) or _is_file(source) else open_source(source)
+        self.file_name = file_name
+        self.chunk_size = chunk_size
+        self.is_excel = file_name.lower().endswith(".xlsx")
+        self.columns = self._read_header()
+        self.new_rows = pd.DataFrame(columns=self.columns)
+
+    def _open(self):
+        if isinstance(self.source, (str, os.PathLike)):
+            return open(self.source, "rb")
+        self.source.seek(0)
+        # Readers below never close a file object they were handed.
+        return contextlib.nullcontext(self.source)
+
+    def _excel_rows(self):
+        from openpyxl import load_workbook
+        with self._open() as fileobj:
+            workbook = load_workbook(fileobj, read_only=True, data_only=True)
+            try:
+                yield from workbook.worksheets[0].iter_rows(values_only=True)
+            finally:
+                workbook.close()
+
+    def _read_header(self):
+        if self.is_excel:
+            header = next(self._excel_rows(), ())
+            return [str(col).strip() for col in header if col is not None]
+        with self._open() as fileobj:
+            return list(pd.read_csv(fileobj, nrows=0).columns.str.strip())
+
+    @property
+    def all_columns(self):
+        return self.columns + [col for col in self.new_rows.columns if col not in self.columns]
+
+    def __len__(self):
+        return self.row_count() + len(self.new_rows)
+
+    def row_count(self):
+        """Number of existing master rows (streams the source once)."""
+        return sum(len(chunk) for chunk in self.iter_chunks())
+
+    def iter_chunks(self):
+        """Yield the existing master rows as DataFrames of at most chunk_size rows."""
+        if self.is_excel:
+            rows = self._excel_rows()
+            next(rows, None)
+            width = len(self.columns)
+            buffer = []
+            for row in rows:
+                buffer.append(_fit_row(row, width))
+                if len(buffer) >= self.chunk_size:
+                    yield pd.DataFrame(buffer, columns=self.columns)
+                    buffer = []
+            if buffer:
+                yield pd.DataFrame(buffer, columns=self.columns)
+            return
+        with self._open() as fileobj:
+            reader = pd.read_csv(fileobj, dtype=str, keep_default_na=False, na_values=[""], chunksize=self.chunk_size)
+            for chunk in reader:
+                chunk.columns = self.columns
+                yield chunk
+
+    def append(self, emp_data_list, debug=False):
+        """Add new employee records; only these are held in memory."""
+        self.new_rows = append_employee_records(self.new_rows, emp_data_list, debug=debug)
+        return self
+
+    def to_frame(self):
+        """Materialize the whole master (existing rows plus new ones) as one DataFrame."""
+        frames = list(self.iter_chunks()) + [self.new_rows]
+        return apply_master_schema(pd.concat(frames, ignore_index=True).reindex(columns=self.all_columns))
+
+    def write(self, fileobj, fmt="csv", compress=False):
+        columns = self.all_columns
+        same_columns = columns == self.columns
+        new_chunks = [self.new_rows] if len(self.new_rows) else []
+        if fmt == "csv" and not self.is_excel and same_columns:
+            with self._open() as source:
+                _write_csv(columns, new_chunks, fileobj, compress, raw_prefix=source)
+        elif fmt == "xlsx" and self.is_excel:
+            rows = self._excel_rows()
+            next(rows, None)
+            width = len(self.columns)
+            _write_xlsx(columns, new_chunks, fileobj, raw_rows=(_fit_row(row, width) for row in rows))
+        else:
+            chunks = itertools.chain(self.iter_chunks(), [self.new_rows])
+            if fmt == "csv":
+                _write_csv(columns, chunks, fileobj, compress)
+            elif fmt == "xlsx":
+                _write_xlsx(columns, chunks, fileobj)
+            else:
+                _write_parquet(columns, chunks, fileobj, compress)
 
 # =========================
 # 6) Updated: Robust Date Parsing
 # =========================
+ORDINAL_SUFFIX_PATTERN = r'(\d+)(st|nd|rd|th)\b'
+TYPO_ZERO_PATTERN = r'(?<=[0-9./\- ])o(?=[0-9./\- ])'
+TYPO_ONE_PATTERN = r'(?<=[0-9./\- ])[li](?=[0-9./\- ])'
+MISSING_SLASH_PATTERN = r'^(\d{1,2})/(\d{1,2})(\d{4})$'
+YEAR_FIRST_PATTERN = r'^\d{4}\D|^\d{8}'
+ISO_DATE_PATTERN = r'^\d{4}-\d{2}-\d{2}(?:[ Tt]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?$'
+
 def remove_ordinal_suffixes(s: str) -> str:
-    pattern = r'(\d+)(st|nd|rd|th)\b'
-    return re.sub(pattern, r'\1', s, flags=re.IGNORECASE)
+    return re.sub(ORDINAL_SUFFIX_PATTERN, r'\1', s, flags=re.IGNORECASE)
 
 def fix_common_numeric_typos(s: str) -> str:
     text = s.lower()
-    text = re.sub(r'(?<=[0-9./\- ])o(?=[0-9./\- ])', '0', text)
-    text = re.sub(r'(?<=[0-9./\- ])[li](?=[0-9./\- ])', '1', text)
+    text = re.sub(TYPO_ZERO_PATTERN, '0', text)
+    text = re.sub(TYPO_ONE_PATTERN, '1', text)
     return text
 
 def fix_missing_slash_between_month_and_year(s: str) -> str:
-    pattern = r'^(\d{1,2})/(\d{1,2})(\d{4})$'
     replacement = r'\1/\2/\3'
-    return re.sub(pattern, replacement, s)
+    return re.sub(MISSING_SLASH_PATTERN, replacement, s)
 
 def robust_parse_date_str(date_str) -> object:
     if not isinstance(date_str, str):
@@ -337,9 +1767,69 @@ def robust_parse_date_str(date_str) -> object:
     s = remove_ordinal_suffixes(s)
     s = fix_common_numeric_typos(s)
     s = fix_missing_slash_between_month_and_year(s)
-    parsed = pd.to_datetime(s, errors='coerce', dayfirst=True)
+    if re.match(ISO_DATE_PATTERN, s):
+        # ISO dates (e.g. str() of an Excel date) are year-month-day; dayfirst would swap them.
+        # The typo fixes above lowercase the "T" before a time, which ISO8601 parsing needs back.
+        parsed = pd.to_datetime(s.upper(), errors='coerce', format="ISO8601")
+    else:
+        parsed = pd.to_datetime(s, errors='coerce', dayfirst=True)
     return parsed if not pd.isnull(parsed) else pd.NaT
 
+@timed("dates.parse")
+def robust_parse_dates(values) -> pd.Series:
+    """
+    Series-level robust_parse_date_str. Each distinct value is cleaned once with
+    vectorized string operations and the cleaned values go through a single
+    to_datetime call, so heavily repeated dates (e.g. start dates) cost nothing extra.
+    Returns a datetime64 Series aligned with the input.
+    """
+    values = values if isinstance(values, pd.Series) else pd.Series(values, dtype=object)
+    if pd.api.types.is_datetime64_dtype(values.dtype):
+        # Already dates (e.g. a native Excel date column): nothing to parse.
+        return values.astype("datetime64[ns]")
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    uniques = pd.Series(uniques, dtype=object)
+    parsed = pd.Series(pd.NaT, index=uniques.index, dtype="datetime64[ns]")
+
+    is_str = uniques.map(lambda v: isinstance(v, str)).astype(bool)
+    for i in uniques.index[~is_str]:
+        parsed.loc[i] = robust_parse_date_str(uniques.loc[i])
+
+    s = uniques[is_str].str.strip()
+    blank = s.str.lower().isin(["", "nat"])
+    is_repr = s.str.startswith("Timestamp(") & ~blank
+    try:
+        if is_repr.any():
+            inner = s[is_repr].str[len("Timestamp("):].str.rstrip(")")
+            inner = inner.str.replace("'", "", regex=False).str.replace('"', "", regex=False)
+            parsed.loc[inner.index] = pd.to_datetime(inner, errors="coerce", format="mixed")
+        rest = s[~blank & ~is_repr]
+        if len(rest):
+            rest = rest.str.replace(ORDINAL_SUFFIX_PATTERN, r'\1', regex=True, flags=re.IGNORECASE)
+            rest = rest.str.lower()
+            rest = rest.str.replace(TYPO_ZERO_PATTERN, '0', regex=True)
+            rest = rest.str.replace(TYPO_ONE_PATTERN, '1', regex=True)
+            rest = rest.str.replace(MISSING_SLASH_PATTERN, r'\1/\2/\3', regex=True)
+            iso = rest.str.match(ISO_DATE_PATTERN)
+            parsed.loc[rest.index[iso]] = pd.to_datetime(rest[iso].str.upper(), errors="coerce", format="ISO8601")
+            # Other year-first strings take pandas' ISO fast path in a vectorized parse but
+            # honour dayfirst in the scalar one, so those keep the scalar semantics.
+            year_first = rest.str.match(YEAR_FIRST_PATTERN) & ~iso
+            dayfirst = ~iso & ~year_first
+            parsed.loc[rest.index[dayfirst]] = pd.to_datetime(rest[dayfirst], errors="coerce", dayfirst=True, format="mixed")
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", UserWarning)
+                for i in rest.index[year_first]:
+                    parsed.loc[i] = pd.to_datetime(rest.loc[i], errors="coerce", dayfirst=True)
+    except (ValueError, TypeError):
+        # e.g. mixed timezone offsets: fall back to parsing value by value.
+        for i in s.index:
+            parsed.loc[i] = robust_parse_date_str(s.loc[i])
+
+    result = parsed.take(codes)
+    result.index = values.index
+    return result
+
 # =========================
 # 7) Map Employee Data (for non-Excel files) – Legacy Function
 # =========================
@@ -352,8 +1842,8 @@ def safe_str(val):
         return str(val)
 
 def map_employee_data(emp_data, debug=False):
-    if debug:
-        print("DEBUG: Mapping employee data:", emp_data)
+    if _debugging(debug):
+        LOGGER.debug("Mapping employee data: %s", emp_data)
     mapped = {}
     full_name = safe_str(emp_data.get("Full Name", "") or emp_data.get("Name", "")).strip()
     if full_name:
@@ -398,47 +1888,1124 @@ def map_employee_data(emp_data, debug=False):
     mapped["SplitTemplateGroupSource"] = np.nan
     mapped["ServiceStatus"] = np.nan
     mapped["ClientCategory"] = np.nan
-    if debug:
-        print("DEBUG: Mapped data:", mapped)
+    if _debugging(debug):
+        LOGGER.debug("Mapped data: %s", mapped)
     return mapped
 
 # =========================
 # 8) Append Employee Record to Master DataFrame
 # =========================
-def append_employee_record(df, emp_data, debug=False):
-    # emp_data is expected to be a dictionary
+# Declarative master schema: every master column in file order, with its dtype.
+# Free text uses a nullable string dtype (Arrow-backed when pyarrow is installed,
+# which stores text far more compactly than Python objects), short repeated values
+# are categoricals, dates are datetime64 and money is a nullable float.
+STRING_DTYPE = pd.StringDtype("pyarrow") if importlib.util.find_spec("pyarrow") else pd.StringDtype()
+MASTER_SCHEMA = {
+    "Surname*": STRING_DTYPE,
+    "FirstName*": STRING_DTYPE,
+    "SchemeRef*": STRING_DTYPE,
+    "CategoryName": "category",
+    "Title": "category",
+    "AddressLine1": STRING_DTYPE,
+    "AddressLine2": STRING_DTYPE,
+    "AddressLine3": STRING_DTYPE,
+    "AddressLine4": STRING_DTYPE,
+    "CityTown": STRING_DTYPE,
+    "County": STRING_DTYPE,
+    "Country": "category",
+    "PostCode": STRING_DTYPE,
+    "AdviceType*": STRING_DTYPE,
+    "DateJoinedScheme": "datetime64[ns]",
+    "DateofBirth*": "datetime64[ns]",
+    "EmailAddress": STRING_DTYPE,
+    "Gender": "category",
+    "HomeNumber": STRING_DTYPE,
+    "MobileNumber": STRING_DTYPE,
+    "NINumber": STRING_DTYPE,
+    "PensionableSalary": "Float64",
+    "PensionableSalaryStartDate": "datetime64[ns]",
+    "SalaryPostSacrifice": "Float64",
+    "PolicyNumber": STRING_DTYPE,
+    "SellingAdviserId*": STRING_DTYPE,
+    "SplitTemplateGroupName": STRING_DTYPE,
+    "SplitTemplateGroupSource": STRING_DTYPE,
+    "ServiceStatus": STRING_DTYPE,
+    "ClientCategory": STRING_DTYPE,
+}
+MASTER_COLUMNS = list(MASTER_SCHEMA)
+
+MONEY_NOISE_PATTERN = r'[£$€,\s]|(?i:p\.?a\.?)$'
+# Schema dtypes a value can fail to convert to; a column with such values is kept as text.
+TYPED_DTYPES = ("Float64", "datetime64[ns]")
+MISSING_TEXT = ("", "nan", "nat", "none", "<na>")
+
+def _as_text(series):
+    # Whole-number floats (phone numbers read from a column with gaps) lose their ".0".
+    if pd.api.types.is_float_dtype(series.dtype) and (series.dropna() % 1 == 0).all():
+        series = series.astype("Int64")
+    return series.astype(STRING_DTYPE)
+
+def _as_number(series):
+    if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+        return series.astype("Float64")
+    text = series.astype(STRING_DTYPE).str.replace(MONEY_NOISE_PATTERN, "", regex=True)
+    return pd.to_numeric(text.astype(object), errors="coerce").astype("Float64")
+
+def _as_datetime(series):
+    if isinstance(series.dtype, pd.DatetimeTZDtype):
+        return series.dt.tz_localize(None).astype("datetime64[ns]")
+    if pd.api.types.is_datetime64_dtype(series.dtype):
+        return series.astype("datetime64[ns]")
+    # Timestamps and our own exports are ISO; anything else goes through the
+    # forgiving day-first parser used for uploaded files.
+    text = series.astype(STRING_DTYPE).str.strip()
+    out = pd.Series(pd.NaT, index=series.index, dtype="datetime64[ns]")
+    iso = text.str.match(ISO_DATE_PATTERN).fillna(False).astype(bool)
+    if iso.any():
+        out[iso] = pd.to_datetime(text[iso].str.upper().astype(object), format="ISO8601", errors="coerce")
+    rest = ~iso & text.notna() & (text != "").fillna(False).astype(bool)
+    if rest.any():
+        out[rest] = robust_parse_dates(text[rest].astype(object)).astype("datetime64[ns]")
+    return out
+
+def _unreadable(series, coerced):
+    # Values present in series that are missing from coerced (e.g. "TBC" as a salary).
+    if coerced.isna().sum() == series.isna().sum():
+        return pd.Series(False, index=series.index)
+    text = series.astype(STRING_DTYPE).str.strip()
+    present = text.notna() & ~text.str.lower().isin(MISSING_TEXT)
+    return (present & coerced.isna()).fillna(False).astype(bool)
+
+def _keep_as_text(series, coerced):
+    # Text column for a date or salary column that did not fully convert: strings
+    # stay exactly as they were, numbers and dates are written as the schema would.
+    original = series.astype(STRING_DTYPE)
+    if pd.api.types.is_string_dtype(series.dtype) and series.dtype != object:
+        return original
+    is_str = series.map(lambda value: isinstance(value, str)).astype(bool)
+    return _as_text(coerced).where(~is_str, original).fillna(original)
+
+def _coerce_column(series, dtype):
+    if not series.notna().any():
+        # Most master columns are entirely empty; skip converting their values one by one.
+        if dtype == "category":
+            codes = np.full(len(series), -1, dtype=np.int8)
+            return pd.Series(pd.Categorical.from_codes(codes, categories=pd.Index([], dtype=object)), index=series.index)
+        return pd.Series(pd.NA if dtype != "datetime64[ns]" else pd.NaT, index=series.index, dtype=dtype)
+    if dtype == "category":
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            return series
+        # Plain object categories, however the text was stored, so masters concatenate cleanly.
+        text = _as_text(series)
+        return text.astype(object).where(text.notna(), np.nan).astype("category")
+    if dtype == "datetime64[ns]":
+        return _as_datetime(series)
+    if dtype == "Float64":
+        return _as_number(series)
+    return _as_text(series)
+
+@timed("master.schema")
+def apply_master_schema(df, debug=False, text_columns=()):
+    """
+    Coerce the MASTER_SCHEMA columns of df to their dtypes, a whole column at a
+    time; columns outside the schema are left alone and columns already of the
+    right dtype are not touched. No value is ever cleared: a date or salary
+    column holding values that are not dates or numbers (e.g. "TBC") is kept as
+    text instead, as are the columns in text_columns. unreadable_master_values
+    reports such columns.
+    """
+    changes = {}
+    for col, dtype in MASTER_SCHEMA.items():
+        if col in text_columns:
+            dtype = STRING_DTYPE
+        if col not in df.columns or df[col].dtype == dtype:
+            continue
+        if isinstance(df[col], pd.DataFrame):
+            continue  # duplicated header; leave it as it is
+        coerced = _coerce_column(df[col], dtype)
+        if dtype in TYPED_DTYPES:
+            lost = int(_unreadable(df[col], coerced).sum())
+            if lost:
+                if _debugging(debug):
+                    LOGGER.debug("%d value(s) in '%s' are not %s; the column is kept as text", lost, col, dtype)
+                coerced = _keep_as_text(df[col], coerced)
+        changes[col] = coerced
+    if not changes:
+        return df
+    df = df.copy(deep=False)
+    for col, coerced in changes.items():
+        df[col] = coerced
+    return df
+
+def unreadable_master_values(df, limit=3):
+    """
+    Date and salary columns of df that apply_master_schema kept as text because
+    some of their values are not dates or numbers, as {column: (count, the first
+    few such values)}.
+    """
+    issues = {}
+    for col, dtype in MASTER_SCHEMA.items():
+        if dtype not in TYPED_DTYPES or col not in df.columns or isinstance(df[col], pd.DataFrame):
+            continue
+        if df[col].dtype == dtype:
+            continue
+        lost = _unreadable(df[col], _coerce_column(df[col], dtype))
+        if lost.any():
+            issues[col] = (int(lost.sum()), list(pd.unique(df[col][lost].astype(object)))[:limit])
+    return issues
+
+def empty_master_frame(n_rows=0):
+    """An n_rows-row master with every schema column present and missing."""
+    return pd.DataFrame({
+        col: pd.Series([None] * n_rows, dtype="object" if dtype == "category" else dtype).astype(dtype)
+        for col, dtype in MASTER_SCHEMA.items()
+    })
+
+def _iter_employee_records(emp_data):
+    # Flatten (possibly nested) lists of records in upload order.
     if isinstance(emp_data, list):
-        # In case a list is passed, iterate over it
         for item in emp_data:
-            df = append_employee_record(df, item, debug=debug)
+            yield from _iter_employee_records(item)
+    else:
+        yield emp_data
+
+def _text_columns(df):
+    # Date and salary columns apply_master_schema kept as text.
+    return {col for col, dtype in MASTER_SCHEMA.items()
+            if dtype in TYPED_DTYPES and col in df.columns and df[col].dtype == STRING_DTYPE}
+
+def _concat_masters(df, new_rows):
+    # A date or salary column kept as text on one side is made text on both.
+    text_columns = _text_columns(df) | _text_columns(new_rows)
+    if text_columns:
+        df = apply_master_schema(df, text_columns=text_columns)
+        new_rows = apply_master_schema(new_rows, text_columns=text_columns)
+    # Give shared categoricals the same categories so concat keeps them categorical.
+    for col in df.columns.intersection(new_rows.columns):
+        if isinstance(df[col].dtype, pd.CategoricalDtype) and isinstance(new_rows[col].dtype, pd.CategoricalDtype):
+            categories = df[col].cat.categories.union(new_rows[col].cat.categories)
+            if not df[col].cat.categories.equals(categories):
+                df = df.copy(deep=False)
+                df[col] = df[col].cat.set_categories(categories)
+            if not new_rows[col].cat.categories.equals(categories):
+                new_rows[col] = new_rows[col].cat.set_categories(categories)
+    return pd.concat([df, new_rows], ignore_index=True)
+
+def append_employee_record(df, emp_data, debug=False):
+    # emp_data is expected to be a dictionary (or a list of them)
+    return append_employee_records(df, emp_data, debug=debug)
+
+@timed("master.append")
+def append_employee_records(df, emp_data_list, debug=False):
+    """
+    Append employee records to the master. Every record is mapped into
+    per-column buffers first, the new rows are coerced to MASTER_SCHEMA in one
+    go and the master is concatenated exactly once, so merging N records costs
+    a single copy of the master instead of N. The master's own schema columns
+    are coerced too (a no-op for a master that already has the schema).
+    """
+    missing = [col for col in MASTER_COLUMNS if col not in df.columns]
+    columns = list(df.columns) + missing
+    buffers = {col: [] for col in columns}
+    n_rows = 0
+    for emp_data in _iter_employee_records(emp_data_list):
+        if "Surname*" in emp_data:
+            mapped_data = emp_data
+        else:
+            mapped_data = map_employee_data(emp_data, debug=debug)
+        for key, value in mapped_data.items():
+            if key not in buffers:
+                # Unknown keys become new trailing columns, back-filled with NaN
+                columns.append(key)
+                buffers[key] = [np.nan] * n_rows
+            buffers[key].append(value)
+        n_rows += 1
+        for col in columns:
+            if len(buffers[col]) < n_rows:
+                buffers[col].append(np.nan)
+    if n_rows == 0:
         return df
-    if "Surname*" in emp_data:
-        mapped_data = emp_data
+    if missing:
+        df = df.copy()
+        empty = empty_master_frame(len(df))
+        for col in missing:
+            df[col] = empty[col].set_axis(df.index)
+    df = apply_master_schema(df, debug=debug)
+    INSTRUMENTS.count("rows.appended", n_rows)
+    if _debugging(debug):
+        LOGGER.debug("Appending %d employee records to master", n_rows)
+    new_rows_df = apply_master_schema(pd.DataFrame(buffers, columns=columns), debug=debug)
+    return _concat_masters(df, new_rows_df)
+
+def normalize_ni_number(value):
+    """Canonical form of a National Insurance number: upper case, letters and digits only."""
+    if _is_blank(value):
+        return None
+    key = re.sub(r"[^A-Z0-9]", "", str(value).upper())
+    return key or None
+
+def _person_key(surname, first_name, dob):
+    # Fallback identity when there is no NI number: (surname, first name, date of birth).
+    if _is_blank(surname) or _is_blank(first_name) or _is_blank(dob):
+        return None
+    # Day first, like _master_identity_keys; a DOB that is not a date gives no key.
+    dob = robust_parse_date_str(dob)
+    if pd.isnull(dob):
+        return None
+    return (str(surname).strip().lower(), str(first_name).strip().lower(), dob.strftime("%Y-%m-%d"))
+
+def _master_identity_keys(df):
+    # Vectorized NI and (surname, first name, DOB) keys for every master row.
+    n = len(df)
+    ni = df["NINumber"] if "NINumber" in df.columns else pd.Series([None] * n, index=df.index)
+    ni_keys = _as_text(ni).fillna("").str.upper().str.replace(r"[^A-Z0-9]", "", regex=True)
+    if all(col in df.columns for col in ("Surname*", "FirstName*", "DateofBirth*")):
+        dobs = df["DateofBirth*"]
+        if not pd.api.types.is_datetime64_dtype(dobs.dtype):
+            # Masters hold ISO dates (our own exports) as well as dd/mm/yyyy ones.
+            dobs = pd.to_datetime(dobs.astype(object), errors="coerce", dayfirst=True, format="mixed")
+        surnames = _as_text(df["Surname*"]).fillna("").str.strip().str.lower()
+        first_names = _as_text(df["FirstName*"]).fillna("").str.strip().str.lower()
+        dob_strings = dobs.dt.strftime("%Y-%m-%d").where(dobs.notna(), "")
+        # Iterate plain object arrays: element access on Arrow-backed strings is slow.
+        person_keys = [
+            (s, f, d) if s and f and d else None
+            for s, f, d in zip(surnames.to_numpy(object), first_names.to_numpy(object), dob_strings.to_numpy(object))
+        ]
     else:
-        mapped_data = map_employee_data(emp_data, debug=debug)
-    master_columns = [
-        "Surname*", "FirstName*", "SchemeRef*", "CategoryName", "Title",
-        "AddressLine1", "AddressLine2", "AddressLine3", "AddressLine4",
-        "CityTown", "County", "Country", "PostCode", "AdviceType*",
-        "DateJoinedScheme", "DateofBirth*", "EmailAddress", "Gender",
-        "HomeNumber", "MobileNumber", "NINumber", "PensionableSalary",
-        "PensionableSalaryStartDate", "SalaryPostSacrifice", "PolicyNumber",
-        "SellingAdviserId*", "SplitTemplateGroupName", "SplitTemplateGroupSource",
-        "ServiceStatus", "ClientCategory"
-    ]
-    for col in master_columns:
-        if col not in df.columns:
-            df[col] = np.nan
-    new_row_df = pd.DataFrame([mapped_data])
-    df = pd.concat([df, new_row_df], ignore_index=True)
-    return df
+        person_keys = [None] * n
+    return ni_keys.to_numpy(object).tolist(), person_keys
+
+def _set_values(column, positions, values, dtype=None):
+    # Write values at positions of column, converting only the new values to the
+    # column's schema dtype. A value that does not convert turns the column into
+    # text, like apply_master_schema, rather than being dropped.
+    if dtype in TYPED_DTYPES and column.dtype == STRING_DTYPE:
+        return _set_text(column, positions, values)
+    if dtype is None or column.dtype != dtype:
+        # Outside the schema, values may not fit the inferred dtype (e.g. text into float NaN).
+        column = column.astype(object)
+        column.iloc[positions] = values
+        return column
+    new = _coerce_column(pd.Series(values, dtype=object), dtype)
+    if dtype in TYPED_DTYPES and _unreadable(pd.Series(values, dtype=object), new).any():
+        return _set_text(_as_text(column), positions, values)
+    keep = new.notna().to_numpy()
+    positions = np.asarray(positions)[keep]
+    new = new[keep]
+    column = column.copy()
+    if dtype == "category":
+        added = new.cat.categories.difference(column.cat.categories)
+        if len(added):
+            column = column.cat.add_categories(added)
+        column.iloc[positions] = new.astype(object).to_numpy()
+    else:
+        column.iloc[positions] = new.to_numpy()
+    return column
+
+def _set_text(column, positions, values):
+    # Write values into a date or salary column kept as text.
+    column = column.astype(object)
+    column.iloc[positions] = _as_text(pd.Series(list(values))).to_numpy(dtype=object)
+    return _as_text(column)
+
+@timed("master.upsert")
+def upsert_employee_records(df, emp_data_list, debug=False):
+    """
+    Merge employee records into the master, updating people who are already there
+    instead of adding them twice. A record matches a master row on its normalized
+    NINumber, or, when it has none, on (Surname*, FirstName*, DateofBirth*). The
+    hash index over the master is built once per call, so each record costs O(1).
+
+    A matched row is updated with the record's non-blank values; unmatched records
+    are inserted via append_employee_records. A record is reported as a conflict
+    (and left out) when its key matches several master rows, or when its NI number
+    and its name/date of birth point at different people in the master.
+
+    Returns (df, summary) where summary has "inserted", "updated" and "conflicts"
+    (a list of {"record": position in the batch, "reason": text}).
+    """
+    df = apply_master_schema(df, debug=debug)
+    ni_keys, person_keys = _master_identity_keys(df)
+    ni_index, person_index = {}, {}
+    for pos, key in enumerate(ni_keys):
+        if key:
+            ni_index.setdefault(key, []).append(pos)
+    for pos, key in enumerate(person_keys):
+        if key:
+            person_index.setdefault(key, []).append(pos)
+
+    updates = {}  # master row position -> {column: value}
+    inserts = []
+    summary = {"inserted": 0, "updated": 0, "conflicts": []}
+    for i, emp_data in enumerate(_iter_employee_records(emp_data_list)):
+        mapped = emp_data if "Surname*" in emp_data else map_employee_data(emp_data, debug=debug)
+        ni_key = normalize_ni_number(mapped.get("NINumber"))
+        person_key = _person_key(mapped.get("Surname*"), mapped.get("FirstName*"), mapped.get("DateofBirth*"))
+        matches = ni_index.get(ni_key, []) if ni_key else []
+        if not matches and person_key:
+            matches = person_index.get(person_key, [])
+            if ni_key and any(pos < len(ni_keys) and ni_keys[pos] for pos in matches):
+                # Same name and date of birth, but the master has another NI number on file.
+                summary["conflicts"].append({"record": i, "reason": "person is on file with a different NI number"})
+                continue
+
+        if len(matches) > 1:
+            summary["conflicts"].append({"record": i, "reason": f"matches {len(matches)} master rows"})
+            continue
+        if matches:
+            pos = matches[0]
+            if ni_key and person_key and pos < len(person_keys) and person_keys[pos] not in (None, person_key):
+                summary["conflicts"].append({"record": i, "reason": "NI number belongs to a different person"})
+                continue
+            changes = {col: value for col, value in mapped.items() if not _is_blank(value)}
+            if pos < len(df):
+                updates.setdefault(pos, {}).update(changes)
+            else:
+                # Same person twice in this batch: fold into the pending insert.
+                inserts[pos - len(df)].update(changes)
+            summary["updated"] += 1
+            continue
+
+        # New person: index the pending insert so later duplicates in the batch update it.
+        pos = len(df) + len(inserts)
+        inserts.append(dict(mapped))
+        if ni_key:
+            ni_index[ni_key] = [pos]
+        if person_key:
+            person_index.setdefault(person_key, []).append(pos)
+        summary["inserted"] += 1
+
+    if updates:
+        df = df.copy()
+        by_column = {}
+        for pos, changes in updates.items():
+            for col, value in changes.items():
+                by_column.setdefault(col, ([], []))
+                by_column[col][0].append(pos)
+                by_column[col][1].append(value)
+        for col, (positions, values) in by_column.items():
+            if col not in df.columns:
+                df[col] = np.nan
+            df[col] = _set_values(df[col], positions, values, MASTER_SCHEMA.get(col))
+    if inserts:
+        df = append_employee_records(df, inserts, debug=debug)
+    INSTRUMENTS.count("rows.updated", summary["updated"])
+    if _debugging(debug):
+        LOGGER.debug("Upsert summary: %s", summary)
+    return df, summary
 
 # =========================
 # 9) Export Master File
 # =========================
-def export_master_file(df, file_name):
-    csv_data = df.to_csv(index=False)
-    output = csv_data.encode('utf-8')
-    mime = "text/csv"
-    file_ext = "csv"
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+def master_export_format(file_name):
+    """Export in the same family as the uploaded master: Excel stays Excel, text becomes CSV."""
+    if file_name and file_name.lower().endswith((".xlsx", ".xls")):
+        return "xlsx"
+    if file_name and file_name.lower().endswith(".parquet"):
+        return "parquet"
+    return "csv"
+
+def _is_blank(value):
+    return value is None or (not isinstance(value, str) and pd.isnull(value))
+
+def _excel_value(value):
+    # openpyxl cannot store NaN/NaT or numpy scalars.
+    if _is_blank(value):
+        return None
+    if isinstance(value, (np.integer, np.floating, np.bool_)):
+        return value.item()
+    return value
+
+def _frame_chunks(df, chunk_size):
+    # Always yield at least one (possibly empty) chunk so headers get written.
+    yield df.iloc[:chunk_size]
+    for start in range(chunk_size, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+def _write_csv(columns, chunks, fileobj, compress, raw_prefix=None):
+    out = gzip.GzipFile(fileobj=fileobj, mode="wb") if compress else fileobj
+    try:
+        header = True
+        if raw_prefix is not None:
+            # Untouched master rows are copied byte for byte, header included.
+            raw_prefix.seek(0)
+            last = b"\n"
+            for block in iter(lambda: raw_prefix.read(1024 * 1024), b""):
+                out.write(block)
+                last = block[-1:]
+            if last != b"\n":
+                out.write(b"\n")
+            header = False
+        for chunk in chunks:
+            out.write(chunk.reindex(columns=columns).to_csv(index=False, header=header).encode("utf-8"))
+            header = False
+    finally:
+        if compress:
+            # Closing the gzip stream writes its trailer but leaves fileobj open.
+            out.close()
+
+def _write_xlsx(columns, chunks, fileobj, raw_rows=None):
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append([str(col) for col in columns])
+    if raw_rows is not None:
+        # Untouched master rows go straight from the source sheet to the new one.
+        for row in raw_rows:
+            sheet.append(row)
+    for chunk in chunks:
+        for row in chunk.reindex(columns=columns).itertuples(index=False, name=None):
+            sheet.append([_excel_value(value) for value in row])
+    workbook.save(fileobj)
+
+def _write_parquet(columns, chunks, fileobj, compress, metadata=None):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    writer = None
+    try:
+        for chunk in chunks:
+            chunk = chunk.reindex(columns=columns)
+            chunk.columns = [str(col) for col in columns]
+            if writer is None:
+                # Object columns often mix strings, numbers and dates; store them as text.
+                text_cols = [str(col) for col, dtype in zip(columns, chunk.dtypes) if dtype == object or len(chunk) == 0]
+                fields = []
+                for col in chunk.columns:
+                    if col in text_cols:
+                        fields.append(pa.field(col, pa.string()))
+                    elif isinstance(chunk[col].dtype, pd.CategoricalDtype):
+                        # Each chunk has its own categories (the first maybe none), so fix the value type.
+                        fields.append(pa.field(col, pa.dictionary(pa.int32(), pa.string())))
+                    else:
+                        fields.append(pa.Schema.from_pandas(chunk[[col]].iloc[:0], preserve_index=False).field(0))
+                schema = pa.schema(fields, metadata=metadata)
+                writer = pq.ParquetWriter(fileobj, schema, compression="gzip" if compress else "snappy")
+            for col in text_cols:
+                chunk[col] = [None if _is_blank(value) else str(value) for value in chunk[col]]
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+    finally:
+        if writer is not None:
+            writer.close()
+
+@timed("master.export")
+def write_master_file(df, target, fmt="csv", compress=False, chunk_size=50_000):
+    """
+    Stream df (a DataFrame, LazyMaster or MasterStore) to target (a path or a binary file
+    object) chunk by chunk, so no full text copy of the master is ever built.
+    fmt is "csv", "xlsx" or "parquet"; compress gzips CSV output and uses the
+    gzip codec for Parquet (XLSX is already compressed and ignores it).
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format '{fmt}'. Choose from: {', '.join(EXPORT_FORMATS)}")
+    if isinstance(target, (str, os.PathLike)):
+        with open(target, "wb") as fileobj:
+            return write_master_file(df, fileobj, fmt=fmt, compress=compress, chunk_size=chunk_size)
+    if isinstance(df, (LazyMaster, MasterStore)):
+        df.write(target, fmt=fmt, compress=compress)
+        return
+    chunks = _frame_chunks(df, chunk_size)
+    if fmt == "csv":
+        _write_csv(df.columns, chunks, target, compress)
+    elif fmt == "xlsx":
+        _write_xlsx(df.columns, chunks, target)
+    else:
+        _write_parquet(df.columns, chunks, target, compress)
+
+def export_master_file(df, file_name, fmt=None, compress=False, chunk_size=50_000):
+    """
+    Export the master for download. The format follows the uploaded master's
+    file_name unless fmt is given. Output is streamed through a spooled temporary
+    file, which moves to disk once it outgrows memory.
+    Returns (output_bytes, mime, file_ext).
+    """
+    fmt = fmt or master_export_format(file_name)
+    mime, file_ext = EXPORT_FORMATS[fmt]
+    if compress and fmt == "csv":
+        mime, file_ext = "application/gzip", "csv.gz"
+    with tempfile.SpooledTemporaryFile(max_size=4 * 1024 * 1024) as spool:
+        write_master_file(df, spool, fmt=fmt, compress=compress, chunk_size=chunk_size)
+        spool.seek(0)
+        output = spool.read()
     return output, mime, file_ext
+
+# =========================
+# 10) Ingest Multiple Employee Files Concurrently
+# =========================
+DOCUMENT_EXTENSIONS = (".docx", ".pdf")
+TABULAR_EXTENSIONS = (".csv", ".txt", ".xlsx", ".xls")
+
+# One entry per uploaded file, in upload order. error is None on success.
+# fallback: the columns were mapped by the local fallback because GPT failed, so
+# the records are a best guess (and are not cached).
+IngestResult = namedtuple("IngestResult", ["file_name", "records", "error", "fallback"], defaults=(False,))
+
+def file_fingerprint(file_name, file_bytes, sheet_name=None, use_ai=False):
+    """Content hash identifying one parse of one uploaded file (any source; files are hashed a block at a time)."""
+    if _is_file(file_bytes):
+        digest = hashlib.sha256()
+        for block in _iter_blocks(file_bytes):
+            digest.update(block)
+    else:
+        digest = hashlib.sha256(file_bytes)
+    ext = os.path.splitext(file_name.lower())[1]
+    if isinstance(sheet_name, tuple):
+        sheet_name = list(sheet_name)
+    digest.update(f"|{ext}|{sheet_name}|{bool(use_ai)}".encode("utf-8"))
+    return digest.hexdigest()
+
+class ParseCache:
+    """
+    In-memory LRU of parsed employee files, keyed on file_fingerprint. Streamlit
+    reruns app.py on every widget interaction, but this module stays imported, so
+    unchanged uploads are served from here instead of being parsed (and sent to
+    GPT) again. It holds at most maxsize files and max_records records in all;
+    a file with more records than that is not cached.
+    """
+    def __init__(self, maxsize=256, max_records=200_000):
+        self.maxsize = maxsize
+        self.max_records = max_records
+        self._entries = OrderedDict()
+        self._records = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return [dict(record) for record in self._entries[key]]
+
+    def set(self, key, records):
+        if len(records) > self.max_records:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._records -= len(self._entries.pop(key))
+            self._entries[key] = [dict(record) for record in records]
+            self._records += len(records)
+            while len(self._entries) > self.maxsize or self._records > self.max_records:
+                self._records -= len(self._entries.popitem(last=False)[1])
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._records = 0
+
+PARSE_CACHE = ParseCache()
+
+def parse_employee_file(file_name, file_bytes, sheet_name=None, use_ai=False, debug=False, column_mapping=None):
+    """
+    Parse one uploaded employee file according to its extension and return a list
+    of employee records (documents yield a single record). column_mapping, if
+    given, is used for AI mapping of CSV/Excel files instead of calling GPT.
+    For Excel files, file_bytes may be an open_workbook handle and sheet_name
+    selects sheets as in parse_excel_employee (None: all of them).
+    """
+    name = file_name.lower()
+    if name.endswith(".docx"):
+        return [parse_docx(file_bytes, use_ai=use_ai, debug=debug)]
+    elif name.endswith(".pdf"):
+        return [parse_pdf(file_bytes, use_ai=use_ai, debug=debug)]
+    elif name.endswith((".csv", ".txt")):
+        return parse_csv_employee(file_bytes, use_ai=use_ai, debug=debug, column_mapping=column_mapping)
+    elif name.endswith((".xlsx", ".xls")):
+        return parse_excel_employee(
+            file_bytes, sheet_name=sheet_name, use_ai=use_ai, debug=debug, column_mapping=column_mapping
+        )
+    raise ValueError(f"Unsupported employee file format: {file_name}")
+
+def read_tabular_sample(file_name, file_bytes, sheet_name=None, nrows=20):
+    """
+    First nrows rows of a CSV/Excel employee file, with headers stripped the same
+    way the parsers strip them. For a workbook (bytes or an open_workbook handle)
+    the samples of the sheets selected by sheet_name are stacked, so the columns
+    are those of all of them.
+    """
+    if file_name.lower().endswith((".csv", ".txt")):
+        return _read_csv_head(file_bytes, detect_text_encoding(file_bytes), nrows=nrows)
+    book = open_workbook(file_bytes)
+    frames = [_read_excel_sheet(book, sheet, nrows=nrows) for sheet in _excel_sheets(book, sheet_name)]
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat([df.loc[:, ~df.columns.duplicated()] for df in frames], ignore_index=True)
+
+def _sample_workbook(file_bytes, sheet_name=None):
+    # Ingest stage 1 for a workbook: keep the open handle for parsing it in stage 3.
+    book = open_workbook(file_bytes)
+    return book, read_tabular_sample(".xlsx", book, sheet_name)
+
+def read_tabular_columns(file_name, file_bytes, sheet_name=None):
+    """Header of a CSV/Excel employee file, stripped the same way the parsers strip it."""
+    return list(read_tabular_sample(file_name, file_bytes, sheet_name, nrows=0).columns)
+
+def _extract_document(file_name, file_bytes, debug=False):
+    # Runs in a worker process: text extraction only, AI mapping happens afterwards.
+    return parse_employee_file(file_name, file_bytes, use_ai=False, debug=debug)
+
+def _collect(futures, fallback):
+    # Wait for {index: future}; returns {index: result or the exception raised}.
+    outcomes = {}
+    for i, future in futures.items():
+        try:
+            try:
+                outcomes[i] = future.result()
+            except BrokenProcessPool:
+                # The platform could not run the process pool; do this one in-process.
+                outcomes[i] = fallback(i)
+        except Exception as e:
+            outcomes[i] = e
+    return outcomes
+
+def ingest_employee_files(files, use_ai=False, max_workers=4, max_processes=None, use_cache=True, debug=False):
+    """
+    Parse several employee files concurrently.
+
+    files is a list of (file_name, file_bytes) or (file_name, file_bytes, sheet_name)
+    tuples, file_bytes being any source (see open_source) and sheet_name selecting workbook sheets as in parse_excel_employee
+    (None: all of them); a workbook is opened once however many sheets it has. DOCX/PDF text extraction is CPU-bound and goes to a process pool
+    (max_processes workers, 0 to disable); CSV/Excel parsing goes to a thread pool
+    of max_workers. With use_ai, the columns of all files are mapped by one
+    batched GPT request (see gpt_map_column_sets). Returns one IngestResult
+    per file in the same order as files; a failing file does not stop the others.
+    With use_cache, files already in PARSE_CACHE are not parsed again; files whose
+    columns were mapped by the local fallback (IngestResult.fallback) are not cached.
+    """
+    jobs = [(f[0], f[1], f[2] if len(f) > 2 else None) for f in files]
+    INSTRUMENTS.count("files", len(jobs))
+    INSTRUMENTS.count("bytes", sum(source_size(file_bytes) for _, file_bytes, _ in jobs))
+    results = [None] * len(jobs)
+    if use_cache:
+        keys = [file_fingerprint(name, file_bytes, sheet_name, use_ai) for name, file_bytes, sheet_name in jobs]
+        for i, key in enumerate(keys):
+            cached = PARSE_CACHE.get(key)
+            if cached is not None:
+                results[i] = IngestResult(jobs[i][0], cached, None)
+    pending = [i for i, result in enumerate(results) if result is None]
+    if not pending:
+        return results
+    fallbacks = set()
+
+    n_documents = sum(1 for i in pending if jobs[i][0].lower().endswith(DOCUMENT_EXTENSIONS))
+    if max_processes is None:
+        max_processes = min(n_documents, os.cpu_count() or 1) if n_documents > 1 else 0
+
+    threads = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    processes = ProcessPoolExecutor(max_workers=max_processes) if max_processes else None
+    try:
+        # Stage 1: everything that needs no GPT. Documents are extracted, and with
+        # AI mapping on only the header and first rows of CSV/Excel files are read for now.
+        with INSTRUMENTS.stage("ingest.extract"):
+            futures = {}
+            for i in pending:
+                name, file_bytes, sheet_name = jobs[i]
+                if name.lower().endswith(DOCUMENT_EXTENSIONS) and processes:
+                    futures[i] = processes.submit(_extract_document, name, source_bytes(file_bytes), debug)
+                elif name.lower().endswith(DOCUMENT_EXTENSIONS):
+                    futures[i] = _submit_in_context(threads, _extract_document, name, file_bytes, debug)
+                elif use_ai and name.lower().endswith((".xlsx", ".xls")):
+                    futures[i] = _submit_in_context(threads, _sample_workbook, file_bytes, sheet_name)
+                elif use_ai and name.lower().endswith(TABULAR_EXTENSIONS):
+                    futures[i] = _submit_in_context(threads, read_tabular_sample, name, file_bytes, sheet_name)
+                else:
+                    futures[i] = _submit_in_context(threads, parse_employee_file, name, file_bytes, sheet_name=sheet_name, debug=debug)
+            outcomes = _collect(futures, lambda i: _extract_document(jobs[i][0], jobs[i][1], debug))
+
+        if use_ai:
+            # Stage 2: one batched GPT mapping for the columns of every file.
+            targets = [i for i in pending if not isinstance(outcomes[i], Exception)]
+            column_sets, samples = [], []
+            for i in targets:
+                if jobs[i][0].lower().endswith(DOCUMENT_EXTENSIONS):
+                    record = outcomes[i][0] if outcomes[i] else {}
+                    column_sets.append(list(record.keys()))
+                    samples.append(record)
+                else:
+                    sample = outcomes[i][1] if isinstance(outcomes[i], tuple) else outcomes[i]
+                    column_sets.append(list(sample.columns))
+                    samples.append(sample)
+            with INSTRUMENTS.stage("ingest.map"):
+                set_fallbacks = set()
+                mappings = dict(zip(targets, gpt_map_column_sets(
+                    column_sets, EXCEL_FIELD_MAP, debug=debug, samples=samples, fallbacks=set_fallbacks
+                )))
+                fallbacks.update(targets[j] for j in set_fallbacks)
+
+            # Stage 3: apply the mappings; CSV/Excel files are parsed now.
+            with INSTRUMENTS.stage("ingest.apply"):
+                futures = {}
+                for i in pending:
+                    name, file_bytes, sheet_name = jobs[i]
+                    if isinstance(outcomes[i], Exception):
+                        continue  # failed in stage 1: report that error, do not parse it again
+                    if name.lower().endswith(DOCUMENT_EXTENSIONS):
+                        if i in mappings:
+                            outcomes[i] = [
+                                apply_ai_mapping_to_dict(record, use_ai=True, debug=debug, mapping=mappings[i])
+                                for record in outcomes[i]
+                            ]
+                    elif name.lower().endswith(TABULAR_EXTENSIONS):
+                        if isinstance(outcomes[i], tuple):
+                            file_bytes = outcomes[i][0]  # the workbook opened in stage 1
+                        futures[i] = _submit_in_context(
+                            threads, parse_employee_file, name, file_bytes, sheet_name=sheet_name, use_ai=True,
+                            debug=debug, column_mapping=mappings.get(i)
+                        )
+                outcomes.update(_collect(futures, lambda i: None))
+
+        for i in pending:
+            name = jobs[i][0]
+            if isinstance(outcomes[i], Exception):
+                if _debugging(debug):
+                    LOGGER.debug("Error ingesting %s: %s", name, outcomes[i])
+                results[i] = IngestResult(name, [], str(outcomes[i]))
+                INSTRUMENTS.count("files.failed")
+                continue
+            INSTRUMENTS.count("records", len(outcomes[i]))
+            if use_cache and i not in fallbacks:
+                PARSE_CACHE.set(keys[i], outcomes[i])
+            results[i] = IngestResult(name, outcomes[i], None, i in fallbacks)
+        return results
+    finally:
+        threads.shutdown(wait=True)
+        if processes is not None:
+            processes.shutdown(wait=True)
+
+# =========================
+# 11) Incremental Master Store
+# =========================
+MASTER_STORE_BASE = "base.parquet"
+MASTER_STORE_LOG = "deltas.sqlite3"
+# Parquet metadata key on the base: the last logged batch it includes.
+MASTER_STORE_SEQ_KEY = b"onboarding.delta_seq"
+
+def _file_stamp(path):
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+def _json_value(value):
+    # Values json cannot write: timestamps are tagged so they load as timestamps
+    # again, numpy scalars become Python ones, anything else is kept as text.
+    if value is pd.NaT:
+        return {"$timestamp": None}
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return {"$timestamp": pd.Timestamp(value).isoformat()}
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+def _json_object(obj):
+    if len(obj) == 1 and "$timestamp" in obj:
+        return pd.NaT if obj["$timestamp"] is None else pd.Timestamp(obj["$timestamp"])
+    return obj
+
+def records_to_json(records):
+    """
+    Employee records as JSON rows, for the master store log and the merge
+    checkpoints. Strings, numbers (NaN included), None, timestamps and NaT
+    load back unchanged with records_from_json.
+    """
+    return json.dumps(records, default=_json_value, ensure_ascii=False)
+
+def records_from_json(text):
+    return json.loads(text, object_hook=_json_object)
+
+class MasterStore:
+    """
+    A master kept as a compacted base snapshot plus an append-only log of the
+    batches merged into it since, in one directory:
+
+        base.parquet     the master as of the last compaction
+        deltas.sqlite3   one row per merged batch of (mapped) employee records, as JSON
+
+    Merging a batch only writes it to the log, so it costs time in proportion to
+    the batch, not to the master. Reading the master (to_frame, iter_chunks,
+    write_master_file) overlays the log on the base. compact() folds the log
+    into a new base; append() does so by itself once the log holds more than
+    compact_ratio of the base's rows or compact_segments batches. The base
+    records the last batch it includes, so a compaction interrupted half way
+    never applies a batch twice.
+
+    Use MasterStore.open(path, master) to create a store from a master file.
+    Needs pyarrow.
+    """
+    def __init__(self, path, compact_ratio=0.2, compact_segments=50, chunk_size=50_000):
+        self.path = path
+        self.base_path = os.path.join(path, MASTER_STORE_BASE)
+        if not os.path.exists(self.base_path):
+            raise FileNotFoundError(f"No master store at {path}")
+        self.compact_ratio = compact_ratio
+        self.compact_segments = compact_segments
+        self.chunk_size = chunk_size
+        self._conn = sqlite3.connect(os.path.join(path, MASTER_STORE_LOG))
+        # Compacted batches keep their row (without records) so their key still blocks a replay.
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS segments (seq INTEGER PRIMARY KEY AUTOINCREMENT, op TEXT NOT NULL, "
+            "key TEXT UNIQUE, created REAL NOT NULL, n_records INTEGER NOT NULL, records TEXT)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+
+    @classmethod
+    def create(cls, path, master, file_name=None, **kwargs):
+        """Start a store at path from a master file, which is streamed into the base (never loaded whole)."""
+        os.makedirs(path, exist_ok=True)
+        base_path = os.path.join(path, MASTER_STORE_BASE)
+        source = load_master_file(master, file_name or os.path.basename(master), lazy=True)
+        if isinstance(source, LazyMaster):
+            text_columns = set()
+            while True:
+                try:
+                    _write_store_base(base_path, source.columns, _typed_chunks(source.iter_chunks(), text_columns), 0)
+                    break
+                except _NewTextColumns:
+                    continue  # text_columns has grown: write the base again
+        else:
+            _write_store_base(base_path, list(source.columns), [source], 0)
+        store = cls(path, **kwargs)
+        issues = store.unreadable_values()
+        if issues:
+            LOGGER.warning("Kept as text in the master store %s (values that are not dates or numbers): %s",
+                           path, ", ".join(f"{col} ({count})" for col, (count, _) in issues.items()))
+        with store._conn:
+            store._conn.execute("INSERT OR REPLACE INTO meta VALUES ('source', ?)", (_file_stamp(master),))
+        return store
+
+    @classmethod
+    def open(cls, path, master=None, **kwargs):
+        """
+        Open the store at path, first creating it from the master file if there is
+        none yet. Once created, the store holds the merged master, so a master that
+        has changed since (or a different one) is refused with ValueError.
+        """
+        if not os.path.exists(os.path.join(path, MASTER_STORE_BASE)):
+            if master is None:
+                raise FileNotFoundError(f"No master store at {path}")
+            return cls.create(path, master, **kwargs)
+        store = cls(path, **kwargs)
+        if master is not None:
+            row = store._conn.execute("SELECT value FROM meta WHERE name = 'source'").fetchone()
+            if row and row[0] != _file_stamp(master):
+                store.close()
+                raise ValueError(
+                    f"{master} is not the master the store {path} was created from, or has changed since. "
+                    "Export the store to get the merged master, or remove the store to start again from the file."
+                )
+        return store
+
+    def close(self):
+        self._conn.close()
+
+    @property
+    def columns(self):
+        import pyarrow.parquet as pq
+        return list(pq.read_schema(self.base_path).names)
+
+    @property
+    def base_seq(self):
+        import pyarrow.parquet as pq
+        metadata = pq.read_schema(self.base_path).metadata or {}
+        return int(metadata.get(MASTER_STORE_SEQ_KEY, 0))
+
+    @property
+    def text_columns(self):
+        """Date and salary columns the base keeps as text (see apply_master_schema)."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        schema = pq.read_schema(self.base_path)
+        return {field.name for field in schema if MASTER_SCHEMA.get(field.name) in TYPED_DTYPES
+                and (pa.types.is_string(field.type) or pa.types.is_large_string(field.type))}
+
+    def unreadable_values(self):
+        """unreadable_master_values for the base."""
+        import pyarrow.parquet as pq
+        columns = sorted(self.text_columns)
+        if not columns:
+            return {}
+        return unreadable_master_values(pq.read_table(self.base_path, columns=columns).to_pandas())
+
+    def base_rows(self):
+        import pyarrow.parquet as pq
+        return pq.read_metadata(self.base_path).num_rows
+
+    def pending(self):
+        """(batches, records) logged since the last compaction."""
+        return self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(n_records), 0) FROM segments WHERE seq > ?", (self.base_seq,)
+        ).fetchone()
+
+    @timed("store.append")
+    def append(self, emp_data_list, upsert=False, key=None, debug=False):
+        """
+        Log a batch of employee records and return how many were logged. With
+        upsert the batch updates people already in the master (as
+        upsert_employee_records does) when the master is read, instead of adding
+        them. A batch whose key is already in the log is not logged again (0).
+        """
+        records = [
+            emp_data if "Surname*" in emp_data else map_employee_data(emp_data, debug=debug)
+            for emp_data in _iter_employee_records(emp_data_list)
+        ]
+        if not records:
+            return 0
+        try:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT INTO segments (op, key, created, n_records, records) VALUES (?, ?, ?, ?, ?)",
+                    ("upsert" if upsert else "append", key, time.time(), len(records), records_to_json(records)),
+                )
+        except sqlite3.IntegrityError:
+            LOGGER.info("Batch %s is already in the master store %s; not logged again", key, self.path)
+            return 0
+        INSTRUMENTS.count("store.records_logged", len(records))
+        if _debugging(debug):
+            LOGGER.debug("Logged %d record(s) to the master store %s", len(records), self.path)
+        batches, pending_records = self.pending()
+        if batches >= self.compact_segments or pending_records > self.compact_ratio * self.base_rows():
+            try:
+                self.compact(debug=debug)
+            except Exception as e:
+                # The batch is safely logged; the next compaction folds it in.
+                LOGGER.warning("Compacting the master store %s failed: %s", self.path, e)
+        return len(records)
+
+    def _segments(self, upto=None):
+        query = "SELECT op, records FROM segments WHERE seq > ?"
+        params = [self.base_seq]
+        if upto is not None:
+            query += " AND seq <= ?"
+            params.append(upto)
+        for op, records in self._conn.execute(query + " ORDER BY seq", params).fetchall():
+            if not isinstance(records, str):
+                # Logged as a pickle before batches were stored as JSON; never unpickled.
+                raise ValueError(
+                    f"The master store {self.path} has batches logged by an older version. "
+                    "Compact or export it with that version, then use it with this one."
+                )
+            yield op, records_from_json(records)
+
+    def _replay(self, df, segments, debug=False):
+        # Consecutive appends are merged into one append_employee_records call.
+        batch = []
+        for op, records in segments:
+            if op == "append":
+                batch.extend(records)
+                continue
+            if batch:
+                df, batch = append_employee_records(df, batch, debug=debug), []
+            df, _ = upsert_employee_records(df, records, debug=debug)
+        if batch:
+            df = append_employee_records(df, batch, debug=debug)
+        return df
+
+    def _base_chunks(self, text_columns=(), like=None):
+        # like: columns the base lacks are added, empty, with their dtypes in this frame.
+        import pyarrow.parquet as pq
+        with pq.ParquetFile(self.base_path) as base:
+            for batch in base.iter_batches(batch_size=self.chunk_size):
+                chunk = apply_master_schema(batch.to_pandas(), text_columns=text_columns)
+                if like is not None:
+                    for col in like.columns.difference(chunk.columns, sort=False):
+                        chunk[col] = like[col].iloc[:0].reindex(chunk.index)
+                yield chunk
+
+    def _overlay(self, upto=None, debug=False):
+        # (columns, chunks) of the master with the batches logged up to seq upto.
+        segments = list(self._segments(upto))
+        text_columns = self.text_columns
+        if any(op == "upsert" for op, _ in segments):
+            # An upsert may update any row of the base, so the master is materialized.
+            base = apply_master_schema(pd.read_parquet(self.base_path), text_columns=text_columns)
+            df = self._replay(base, segments, debug=debug)
+            return list(df.columns), _frame_chunks(df, self.chunk_size)
+        new_rows = self._replay(pd.DataFrame(columns=self.columns), segments, debug=debug)
+        columns = self.columns + [col for col in new_rows.columns if col not in self.columns]
+        if not len(new_rows):
+            return columns, self._base_chunks(text_columns)
+        # Every chunk gets the same dtypes, so the Parquet writers can take them from the first.
+        text_columns |= _text_columns(new_rows)
+        new_rows = apply_master_schema(new_rows, text_columns=text_columns)
+        return columns, itertools.chain(self._base_chunks(text_columns, like=new_rows), [new_rows])
+
+    def iter_chunks(self, debug=False):
+        """Yield the master (base overlaid with the log) as DataFrames of about chunk_size rows."""
+        return self._overlay(debug=debug)[1]
+
+    def to_frame(self, debug=False):
+        """Materialize the whole master as one DataFrame."""
+        columns, chunks = self._overlay(debug=debug)
+        return apply_master_schema(pd.concat(list(chunks), ignore_index=True).reindex(columns=columns))
+
+    def write(self, fileobj, fmt="csv", compress=False):
+        columns, chunks = self._overlay()
+        chunks = _with_header_chunk(columns, chunks)
+        if fmt == "csv":
+            _write_csv(columns, chunks, fileobj, compress)
+        elif fmt == "xlsx":
+            _write_xlsx(columns, chunks, fileobj)
+        else:
+            _write_parquet(columns, chunks, fileobj, compress)
+
+    @timed("store.compact")
+    def compact(self, debug=False):
+        """Fold the logged batches into a new base snapshot. Returns the number of batches folded in."""
+        base_seq = self.base_seq
+        last = self._conn.execute("SELECT MAX(seq) FROM segments").fetchone()[0] or 0
+        if last <= base_seq:
+            return 0
+        columns, chunks = self._overlay(upto=last, debug=debug)
+        _write_store_base(self.base_path, columns, chunks, last)
+        with self._conn:
+            self._conn.execute("UPDATE segments SET records = NULL WHERE seq <= ?", (last,))
+        folded = self._conn.execute("SELECT COUNT(*) FROM segments WHERE seq > ? AND seq <= ?", (base_seq, last)).fetchone()[0]
+        if _debugging(debug):
+            LOGGER.debug("Compacted %d batch(es) into %s", folded, self.base_path)
+        return folded
+
+class _NewTextColumns(Exception):
+    """A chunk needs a column kept as text that earlier chunks were written with typed."""
+
+def _typed_chunks(chunks, text_columns):
+    # apply_master_schema on each chunk, adding any column a chunk has to keep as
+    # text to text_columns (in place); if that happens after the first chunk the
+    # write has to start again.
+    for i, chunk in enumerate(chunks):
+        chunk = apply_master_schema(chunk, text_columns=text_columns)
+        added = _text_columns(chunk) - text_columns
+        if added:
+            text_columns |= added
+            if i:
+                raise _NewTextColumns(added)
+        yield chunk
+
+def _with_header_chunk(columns, chunks):
+    # Writers take their header (and Parquet schema) from the first chunk: never leave them without one.
+    empty = True
+    for chunk in chunks:
+        empty = False
+        yield chunk
+    if empty:
+        yield pd.DataFrame(columns=columns)
+
+def _write_store_base(base_path, columns, chunks, seq):
+    # Written beside the old base and moved over it, so readers never see half a snapshot.
+    tmp_path = base_path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as fileobj:
+            _write_parquet(columns, _with_header_chunk(columns, chunks), fileobj, compress=False,
+                           metadata={MASTER_STORE_SEQ_KEY: str(seq).encode()})
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, base_path)
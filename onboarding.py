@@ -0,0 +1,333 @@
+import os
+import sys
+import time
+import hashlib
+import logging
+import sqlite3
+import argparse
+from contextlib import ExitStack, nullcontext
+
+from logic import (
+    DOCUMENT_EXTENSIONS, TABULAR_EXTENSIONS, EXPORT_FORMATS, MASTER_SCHEMA, LazyMaster, MasterStore,
+    append_employee_records, empty_master_frame, ingest_employee_files, instrumented, load_master_file,
+    master_export_format, records_from_json, records_to_json, unreadable_master_values, upsert_employee_records,
+    write_master_file
+)
+
+# Headless batch merges, for runs outside Streamlit:
+#
+#     python -m onboarding merge --master master.xlsx --inputs starters/
+#
+# merge() is the same thing as a library call. With --incremental, merges go to a
+# MasterStore next to the master and `export` writes the full master on demand.
+
+INPUT_EXTENSIONS = DOCUMENT_EXTENSIONS + TABULAR_EXTENSIONS
+
+# =========================
+# Input discovery and checkpoints
+# =========================
+def find_input_files(inputs):
+    """Employee files under inputs (files or directories, searched recursively), sorted per directory."""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+                for name in sorted(files):
+                    # Skip hidden files and Office lock files ("~$form.docx").
+                    if name.lower().endswith(INPUT_EXTENSIONS) and not name.startswith((".", "~$")):
+                        paths.append(os.path.join(root, name))
+        elif os.path.isfile(item):
+            paths.append(item)
+        else:
+            raise FileNotFoundError(f"Input not found: {item}")
+    return paths
+
+def file_stamp(path, use_ai=False):
+    # Size and mtime identify an unchanged input without reading it again.
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}:{int(bool(use_ai))}"
+
+class Checkpoint:
+    """
+    SQLite record of the input files already parsed in a merge, with their
+    records, so an interrupted run can resume without parsing them again.
+    Results are committed after every batch.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS parsed_files "
+            "(path TEXT PRIMARY KEY, stamp TEXT NOT NULL, records TEXT, error TEXT)"
+        )
+
+    def load(self):
+        """{path: (stamp, records, error)} for every file recorded so far."""
+        rows = self._conn.execute("SELECT path, stamp, records, error FROM parsed_files")
+        # Rows pickled by older versions are not loaded; those files are parsed again.
+        return {path: (stamp, records_from_json(records), error)
+                for path, stamp, records, error in rows if isinstance(records, str)}
+
+    def save(self, entries):
+        """Record (path, stamp, records, error) tuples."""
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO parsed_files VALUES (?, ?, ?, ?)",
+                [(path, stamp, records_to_json(records), error) for path, stamp, records, error in entries],
+            )
+
+    def clear(self):
+        with self._conn:
+            self._conn.execute("DELETE FROM parsed_files")
+
+    def close(self):
+        self._conn.close()
+
+def print_progress(done, total, parsed, failed, rate):
+    """Default progress reporter: one line on stderr per batch."""
+    eta = (total - done) / rate if rate > 0 else 0.0
+    print(f"[{done}/{total}] {parsed} parsed, {failed} failed, {rate:.1f} files/s, ETA {eta:.0f}s",
+          file=sys.stderr, flush=True)
+
+# =========================
+# Merge
+# =========================
+def default_output_path(master, fmt, compress=False):
+    stem = os.path.splitext(master)[0]
+    ext = "csv.gz" if compress and fmt == "csv" else EXPORT_FORMATS[fmt][1]
+    return f"{stem}_updated.{ext}"
+
+def default_store_path(master):
+    return os.path.splitext(master)[0] + ".store"
+
+def batch_key(stamps, upsert=False):
+    """Identifies a merge's inputs, so the same unchanged files are logged to a store only once."""
+    digest = hashlib.sha1(b"upsert" if upsert else b"append")
+    for path in sorted(stamps):
+        digest.update(f"\0{os.path.abspath(path)}\0{stamps[path]}".encode("utf-8"))
+    return digest.hexdigest()
+
+def merge(master, inputs, output=None, fmt=None, compress=False, use_ai=False, upsert=False,
+          batch_size=200, max_workers=4, max_processes=None, checkpoint=None, resume=True,
+          keep_checkpoint=False, progress=print_progress, store=None, debug=False):
+    """
+    Parse every employee file under inputs and merge the records into the
+    master file, writing the result to output (default "<master>_updated.<ext>").
+
+    Files are parsed batch_size at a time with ingest_employee_files (documents
+    in a process pool, CSV/Excel in a thread pool). After each batch the results
+    go to a checkpoint (default "<output>.checkpoint.sqlite3"); with resume, files
+    already in it and unchanged since are not parsed again. The checkpoint is
+    removed once the output is written unless keep_checkpoint is set.
+
+    In append mode the master is streamed (LazyMaster), so its size does not
+    matter (except .xls masters, which are loaded whole); upsert needs the whole master in memory to match people. The output
+    is written to a temporary file first and moved into place, so it may be the
+    master itself. progress, if given, is called after every batch with
+    (done, total, parsed, failed, files_per_second); resumed files count as
+    done but not towards the rate.
+
+    With store (a directory), the merge is incremental: the records are logged
+    to that MasterStore, which is created from the master on first use, and the
+    master is not rewritten. The output is then only written when given, and
+    upserts are resolved when the store is read. Merging the same unchanged
+    inputs into a store again logs nothing.
+
+    Returns a summary dict: files, parsed, failed, resumed, records, failures
+    ([(path, error)]), output, unreadable (unreadable_master_values: date and
+    salary columns kept as text) and, with upsert, the upsert summary; with store,
+    store and logged (records added to its log) instead of the upsert summary.
+    """
+    fmt = fmt or master_export_format(master)
+    if store:
+        # Fails before any parsing if the store belongs to another master.
+        MasterStore.open(store, master).close()
+        checkpoint = checkpoint or os.path.join(store, "merge.checkpoint.sqlite3")
+    else:
+        output = output or default_output_path(master, fmt, compress)
+        checkpoint = checkpoint or output + ".checkpoint.sqlite3"
+    paths = find_input_files(inputs)
+    stamps = {path: file_stamp(path, use_ai) for path in paths}
+
+    saved = Checkpoint(checkpoint)
+    try:
+        if not resume:
+            saved.clear()
+        done = {
+            path: (records, error)
+            for path, (stamp, records, error) in saved.load().items()
+            if stamps.get(path) == stamp
+        }
+        resumed = sum(1 for path in paths if path in done)
+        todo = [path for path in paths if path not in done]
+        start = time.perf_counter()
+        if progress and resumed:
+            n_failed = sum(1 for path in paths if path in done and done[path][1])
+            progress(resumed, len(paths), resumed - n_failed, n_failed, 0.0)
+        for offset in range(0, len(todo), batch_size):
+            batch = todo[offset:offset + batch_size]
+            with ExitStack() as files:
+                jobs = []
+                for path in batch:
+                    fileobj = files.enter_context(open(path, "rb"))
+                    if path.lower().endswith(DOCUMENT_EXTENSIONS):
+                        fileobj = fileobj.read()  # small, and sent to worker processes
+                    # Spreadsheets are parsed straight from the open file, never read whole.
+                    # Every sheet of a workbook is read; sheets without employee columns give no records.
+                    jobs.append((os.path.basename(path), fileobj, None))
+                results = ingest_employee_files(
+                    jobs, use_ai=use_ai, max_workers=max_workers, max_processes=max_processes,
+                    use_cache=False, debug=debug,
+                )
+            entries = [(path, stamps[path], result.records, result.error) for path, result in zip(batch, results)]
+            saved.save(entries)
+            done.update((path, (records, error)) for path, _, records, error in entries)
+            if progress:
+                n_done = resumed + offset + len(batch)
+                n_failed = sum(1 for path in paths if path in done and done[path][1])
+                rate = (offset + len(batch)) / max(time.perf_counter() - start, 1e-9)
+                progress(n_done, len(paths), n_done - n_failed, n_failed, rate)
+    finally:
+        saved.close()
+
+    records = [record for path in paths for record in done[path][0]]
+    failures = [(path, done[path][1]) for path in paths if done[path][1]]
+    summary = {
+        "files": len(paths), "parsed": len(paths) - len(failures), "failed": len(failures),
+        "resumed": resumed, "records": len(records), "failures": failures, "output": output,
+    }
+    master_name = os.path.basename(master)
+    if store:
+        master_store = MasterStore.open(store)
+        try:
+            summary["store"] = store
+            summary["logged"] = master_store.append(records, upsert=upsert, key=batch_key(stamps, upsert), debug=debug)
+            summary["unreadable"] = unreadable_master_values(append_employee_records(empty_master_frame(), records))
+            if output:
+                _write_output(master_store, output, fmt, compress)
+        finally:
+            master_store.close()
+    else:
+        if upsert:
+            df, summary["upsert"] = upsert_employee_records(load_master_file(master, master_name), records, debug=debug)
+        else:
+            df = load_master_file(master, master_name, lazy=True)
+            if isinstance(df, LazyMaster):
+                df = df.append(records, debug=debug)
+            else:
+                df = append_employee_records(df, records, debug=debug)  # .xls: loaded whole
+        # A streamed master's own rows are copied as they are; only the new ones are typed.
+        summary["unreadable"] = unreadable_master_values(df.new_rows if isinstance(df, LazyMaster) else df)
+        _write_output(df, output, fmt, compress)
+    if not keep_checkpoint:
+        os.remove(checkpoint)
+    return summary
+
+def _write_output(df, output, fmt, compress):
+    # Written to a temporary file first and moved into place, so output may be the master itself.
+    tmp_output = output + ".tmp"
+    write_master_file(df, tmp_output, fmt=fmt, compress=compress)
+    os.replace(tmp_output, output)
+
+def export_store(store, output, fmt=None, compress=False):
+    """Write the full master held in a MasterStore to output (format from its extension unless given)."""
+    master_store = MasterStore.open(store)
+    try:
+        _write_output(master_store, output, fmt or master_export_format(output), compress)
+    finally:
+        master_store.close()
+
+def compact_store(store):
+    """Fold the batches logged to a MasterStore into its base. Returns (batches, records) folded."""
+    master_store = MasterStore.open(store)
+    try:
+        pending = master_store.pending()
+        master_store.compact()
+    finally:
+        master_store.close()
+    return pending
+
+# =========================
+# Command line
+# =========================
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m onboarding", description="Bulk employee onboarding without Streamlit.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    cmd = commands.add_parser("merge", help="Merge a directory of employee files into a master file.")
+    cmd.add_argument("--master", required=True, help="Master file (.xlsx, .xls, .csv or .txt).")
+    cmd.add_argument("--inputs", required=True, nargs="+", help="Employee files or directories to search.")
+    cmd.add_argument("--output", help="Where to write the updated master (default: <master>_updated.<ext>).")
+    cmd.add_argument("--format", choices=sorted(EXPORT_FORMATS), help="Output format (default: that of the master).")
+    cmd.add_argument("--compress", action="store_true", help="gzip CSV output / use gzip for Parquet.")
+    cmd.add_argument("--ai", action="store_true", help="Map columns with GPT (needs OPENAI_API_KEY).")
+    cmd.add_argument("--upsert", action="store_true", help="Update employees already in the master instead of appending.")
+    cmd.add_argument("--batch-size", type=int, default=200, help="Files parsed per batch and checkpoint (default 200).")
+    cmd.add_argument("--workers", type=int, default=4, help="Threads for CSV/Excel parsing (default 4).")
+    cmd.add_argument("--processes", type=int, help="Processes for DOCX/PDF parsing (default: one per CPU).")
+    cmd.add_argument("--checkpoint", help="Checkpoint file (default: <output>.checkpoint.sqlite3).")
+    cmd.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint and parse everything again.")
+    cmd.add_argument("--keep-checkpoint", action="store_true", help="Keep the checkpoint after a successful run.")
+    cmd.add_argument("--quiet", action="store_true", help="No progress output.")
+    cmd.add_argument("--report", help="Write per-stage timings and counters to this JSON file.")
+    cmd.add_argument("--profile", action="store_true", help="Also run cProfile and list the slowest functions in the report.")
+    cmd.add_argument("--incremental", action="store_true",
+                     help="Log the records to a master store (<master>.store) instead of rewriting the master; "
+                          "see the export and compact commands.")
+    cmd.add_argument("--store", help="Master store directory (implies --incremental).")
+    cmd.add_argument("--debug", action="store_true", help="Log debug output (extracted lines, mappings) to stderr.")
+    cmd = commands.add_parser("export", help="Write the full master held in a master store.")
+    cmd.add_argument("--store", required=True, help="Master store directory.")
+    cmd.add_argument("--output", required=True, help="File to write (.xlsx, .csv, .csv.gz or .parquet).")
+    cmd.add_argument("--format", choices=sorted(EXPORT_FORMATS), help="Output format (default: from --output).")
+    cmd.add_argument("--compress", action="store_true", help="gzip CSV output / use gzip for Parquet.")
+    cmd = commands.add_parser("compact", help="Fold the batches logged to a master store into its base snapshot.")
+    cmd.add_argument("--store", required=True, help="Master store directory.")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "export":
+        export_store(args.store, args.output, fmt=args.format, compress=args.compress)
+        print(f"Master store {args.store} written to {args.output}")
+        return 0
+    if args.command == "compact":
+        batches, records = compact_store(args.store)
+        print(f"{batches} batch(es) with {records} record(s) folded into {args.store}")
+        return 0
+    level = logging.DEBUG if args.debug else logging.INFO if args.report or args.profile else logging.WARNING
+    logging.basicConfig(level=level, format="%(levelname)s %(name)s: %(message)s")
+    store = args.store or (default_store_path(args.master) if args.incremental else None)
+    with instrumented(args.report, profile=args.profile) if args.report or args.profile else nullcontext():
+        summary = merge(
+            args.master, args.inputs, output=args.output, fmt=args.format, compress=args.compress,
+            use_ai=args.ai, upsert=args.upsert, batch_size=args.batch_size, max_workers=args.workers,
+            max_processes=args.processes, checkpoint=args.checkpoint, resume=not args.restart,
+            keep_checkpoint=args.keep_checkpoint, progress=None if args.quiet else print_progress, store=store,
+            debug=args.debug,
+        )
+    for path, error in summary["failures"]:
+        print(f"Error processing {path}: {error}", file=sys.stderr)
+    if store:
+        message = (f"{summary['logged']} of {summary['records']} record(s) from {summary['parsed']} of "
+                   f"{summary['files']} file(s) logged to {store}")
+        if summary["records"] and not summary["logged"]:
+            message += " (these files were already merged)"
+        if summary["output"]:
+            message += f"; full master written to {summary['output']}"
+    else:
+        message = f"{summary['records']} record(s) from {summary['parsed']} of {summary['files']} file(s) written to {summary['output']}"
+    if "upsert" in summary:
+        upserted = summary["upsert"]
+        message += (f" ({upserted['inserted']} added, {upserted['updated']} updated, "
+                    f"{len(upserted['conflicts'])} conflict(s) skipped)")
+    print(message)
+    for col, (count, examples) in summary["unreadable"].items():
+        kind = "numbers" if MASTER_SCHEMA[col] == "Float64" else "dates"
+        print(f"Warning: {count} value(s) in {col} are not {kind} (e.g. {', '.join(map(repr, examples))}); "
+              "the column is kept as text.", file=sys.stderr)
+    # A partial merge still writes its output, but tells schedulers something failed.
+    return 1 if summary["failures"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
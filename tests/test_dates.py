@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import bench
+import logic
+
+
+def assert_same_dates(expected, actual):
+    same = (expected == actual) | (expected.isna() & actual.isna())
+    assert same.all(), pd.DataFrame({"expected": expected, "actual": actual})[~same].head()
+
+
+@pytest.mark.parametrize("column", ["Date Of Birth", "Hire Date"])
+def test_robust_parse_dates_matches_scalar_parser(column):
+    values = bench.make_employee_table(2_000, seed=1)[column]
+    assert_same_dates(values.map(logic.robust_parse_date_str), logic.robust_parse_dates(values))
+
+
+def test_robust_parse_dates_matches_scalar_parser_on_messy_dates():
+    values = pd.Series(bench.make_messy_dates(2_000, seed=2))
+    assert_same_dates(values.map(logic.robust_parse_date_str), logic.robust_parse_dates(values))
+
+
+def test_iso_dates_are_year_first():
+    values = pd.Series(["2024-01-02", "2024-01-02 09:30:00", "2024-01-02T09:30", None])
+    parsed = logic.robust_parse_dates(values)
+    assert list(parsed[:3].dt.month) == [1, 1, 1] and list(parsed[:3].dt.day) == [2, 2, 2]
+    assert pd.isna(parsed[3])
+    assert_same_dates(values.map(logic.robust_parse_date_str), parsed)
+
+
+def test_native_dates_pass_through():
+    values = pd.Series(pd.to_datetime(["1985-03-21", "1990-12-01", None]))
+    parsed = logic.robust_parse_dates(values)
+    assert parsed.dtype == np.dtype("datetime64[ns]")
+    assert_same_dates(values, parsed)
@@ -0,0 +1,27 @@
+import pandas as pd
+
+import bench
+import logic
+
+
+def test_map_excel_employee_frame_matches_per_row_mapping():
+    df = bench.make_employee_table(500, seed=3)
+    per_row = [logic.map_excel_employee_data(row.to_dict()) for _, row in df.iterrows()]
+    frame = logic.map_excel_employee_frame(df).to_dict("records")
+    assert bench._same_records(per_row, frame)
+
+
+def test_workbook_read_matches_read_excel_per_sheet():
+    file_bytes = bench.make_workbook(n_sheets=3, rows_per_sheet=200)
+    expected = pd.DataFrame(bench._legacy_parse_workbook(file_bytes))
+    actual = pd.DataFrame(logic.parse_excel_employee(file_bytes))
+    pd.testing.assert_frame_equal(actual.astype(str), expected.astype(str))
+
+
+def test_workbook_handle_is_reused_for_selected_sheets():
+    file_bytes = bench.make_workbook(n_sheets=3, rows_per_sheet=20)
+    book = logic.open_workbook(file_bytes)
+    assert logic.excel_sheet_names(file_bytes) == book.sheet_names == ["Site 1", "Site 2", "Site 3"]
+    records = logic.parse_excel_employee(book, sheet_name=["Site 1", "Site 3"])
+    ni_numbers = {record["NINumber"] for record in records}
+    assert len(records) == 40 and {ni[:2] for ni in ni_numbers} == {"Q0", "Q2"}
@@ -0,0 +1,63 @@
+import pytest
+
+import bench
+import logic
+
+CORRUPT = {
+    "corrupt.xlsx": b"PK\x03\x04 not a workbook",
+    "corrupt.csv": b'Firstname,Surname\n"Ann,Lee\n',  # quote never closed
+}
+
+
+@pytest.fixture(autouse=True)
+def offline(monkeypatch):
+    def fail(df_columns, mapped_columns):
+        raise ConnectionError("no GPT in tests")
+    monkeypatch.setattr(logic, "_request_gpt_mapping", fail)
+    monkeypatch.setattr(logic, "MAPPING_CACHE", logic.MappingCache(path=None))
+
+
+@pytest.mark.parametrize("use_ai", [False, True])
+def test_corrupt_files_come_back_as_errors(use_ai):
+    good = bench.make_employee_table(5).to_csv(index=False).encode("utf-8")
+    files = [("starters.csv", good)] + list(CORRUPT.items())
+    results = logic.ingest_employee_files(files, use_ai=use_ai, use_cache=False)
+    assert [result.file_name for result in results] == ["starters.csv", "corrupt.xlsx", "corrupt.csv"]
+    assert results[0].error is None and len(results[0].records) == 5
+    for result in results[1:]:
+        assert result.error and result.records == []
+
+
+def test_failed_files_are_not_cached():
+    name, data = "corrupt.csv", CORRUPT["corrupt.csv"]
+    logic.PARSE_CACHE.clear()
+    logic.ingest_employee_files([(name, data)])
+    assert logic.PARSE_CACHE.get(logic.file_fingerprint(name, data, None, False)) is None
+
+
+def test_fallback_mappings_are_not_cached(monkeypatch):
+    table = bench.make_employee_table(5)
+    table["Pronouns"] = "they/them"  # nothing ColumnMatcher resolves, so it needs GPT
+    name, data = "starters.csv", table.to_csv(index=False).encode("utf-8")
+    key = logic.file_fingerprint(name, data, None, True)
+    logic.PARSE_CACHE.clear()
+    logic.GPT_CLIENT.reset()
+    with monkeypatch.context() as down:
+        down.setattr(logic.GPT_CLIENT, "map_many", lambda batches, mapped_columns: [ConnectionError("down")] * len(batches))
+        [result] = logic.ingest_employee_files([(name, data)], use_ai=True)
+    assert result.error is None and result.fallback and len(result.records) == 5
+    assert logic.PARSE_CACHE.get(key) is None
+    with bench.StubChatCompletion():
+        [result] = logic.ingest_employee_files([(name, data)], use_ai=True)
+    assert not result.fallback
+    assert logic.PARSE_CACHE.get(key) is not None
+
+
+def test_parse_cache_is_bounded_by_records():
+    cache = logic.ParseCache(maxsize=10, max_records=5)
+    cache.set("a", [{"n": 1}] * 3)
+    cache.set("b", [{"n": 2}] * 2)
+    cache.set("c", [{"n": 3}] * 2)  # over 5 records: the oldest file goes
+    assert cache.get("a") is None and len(cache) == 2
+    cache.set("d", [{"n": 4}] * 6)  # larger than the whole cache: not kept
+    assert cache.get("d") is None and cache.get("b") is not None
@@ -0,0 +1,108 @@
+import time
+
+import pytest
+
+import bench
+import logic
+
+COLUMNS = ["Pronouns", "Employee ID", "Department"]  # nothing ColumnMatcher resolves locally
+
+
+@pytest.fixture
+def stub():
+    saved = logic.MAPPING_CACHE
+    logic.GPT_CLIENT.reset()
+    with bench.StubChatCompletion() as stub:
+        yield stub
+    logic.MAPPING_CACHE = saved
+
+
+def lookup(stub, cache, field_map):
+    # (API calls made, cache statistic that moved) for one gpt_map_columns call.
+    logic.MAPPING_CACHE = cache
+    calls, before = stub.calls, dict(cache.stats)
+    logic.gpt_map_columns(COLUMNS, field_map)
+    return stub.calls - calls, next((key for key in cache.stats if cache.stats[key] != before[key]), None)
+
+
+def test_mapping_cache_tiers(stub, tmp_path):
+    path = str(tmp_path / "mappings.sqlite3")
+    field_map = dict(logic.EXCEL_FIELD_MAP)
+    cache = logic.MappingCache(path=path)
+    assert lookup(stub, cache, field_map) == (1, "misses")
+    assert lookup(stub, cache, field_map) == (0, "memory_hits")
+    assert lookup(stub, logic.MappingCache(path=path), field_map) == (0, "disk_hits")
+    assert lookup(stub, cache, dict(field_map, Pronouns="Pronouns")) == (1, "misses")
+
+
+@pytest.mark.parametrize("path", [None, "disk"])
+def test_mapping_cache_entries_expire(stub, tmp_path, path):
+    path = path and str(tmp_path / "mappings.sqlite3")
+    field_map = dict(logic.EXCEL_FIELD_MAP)
+    hit = "memory_hits" if path is None else "disk_hits"
+    cache = logic.MappingCache(path=path, ttl=0.2)
+    assert lookup(stub, cache, field_map) == (1, "misses")
+    reader = cache if path is None else logic.MappingCache(path=path, ttl=0.2)
+    assert lookup(stub, reader, field_map) == (0, hit)
+    time.sleep(0.3)
+    assert lookup(stub, reader, field_map) == (1, "misses")
+
+
+@pytest.fixture
+def gpt_down(monkeypatch):
+    # Every GPT request fails, so columns the matcher is unsure about get its fallback guess.
+    def fail(df_columns, mapped_columns):
+        raise ConnectionError("GPT is down")
+    monkeypatch.setattr(logic, "_request_gpt_mapping", fail)
+    monkeypatch.setattr(logic, "MAPPING_CACHE", logic.MappingCache(path=None))
+
+
+def test_partial_header_match_is_not_confident():
+    matcher = logic.column_matcher(logic.EXCEL_FIELD_MAP)
+    mapping, unresolved = matcher.map_columns(["Telephone Number", "Mobile Telephone Number", "Adress Line4"])
+    assert "Telephone Number" in unresolved
+    assert mapping == {"Mobile Telephone Number": "Mobile Telephone Number", "Adress Line4": "Address 4"}
+
+
+def test_mapping_never_overwrites_another_key(gpt_down):
+    record = {"Full Name": "Ann Smith", "Telephone Number": "0113 496 0000", "Mobile Telephone Number": "07700 900123"}
+    mapped = logic.map_employee_data(logic.apply_ai_mapping_to_dict(record, use_ai=True))
+    assert (mapped["HomeNumber"], mapped["MobileNumber"]) == ("0113 496 0000", "07700 900123")
+
+
+def test_fallback_does_not_guess_from_one_shared_word(gpt_down):
+    assert logic._fallback_map_columns(["Emergency Contact Address"], logic.EXCEL_FIELD_MAP) == {
+        "Emergency Contact Address": "Emergency Contact Address"}
+    record = {"Home Address": "1 High Street, Leeds", "Emergency Contact Address": "2 Low Road, York"}
+    mapped = logic.apply_ai_mapping_to_dict(record, use_ai=True)
+    assert mapped["Home Address"] == "1 High Street, Leeds"
+
+
+def test_unmatched_columns_keep_their_name(gpt_down):
+    mapped = logic.map_employee_data(logic.apply_ai_mapping_to_dict({"Full Name": "Ann Smith"}, use_ai=True))
+    assert (mapped["FirstName*"], mapped["Surname*"]) == ("Ann", "Smith")
+
+
+def test_half_open_circuit_lets_one_probe_through(stub, monkeypatch):
+    client = logic.GPTMappingClient(max_retries=0, failure_threshold=1, cooldown=0.05, max_concurrency=8)
+    monkeypatch.setattr(logic, "load_openai_key", lambda: None)
+    answer = stub.acreate
+
+    async def down(messages, **kwargs):
+        stub.calls += 1
+        raise logic.openai.error.APIConnectionError("GPT is down")
+
+    async def slow(messages, **kwargs):
+        await logic.asyncio.sleep(0.05)  # the others arrive while the probe is in flight
+        return await answer(messages, **kwargs)
+
+    monkeypatch.setattr(logic.openai.ChatCompletion, "acreate", down)
+    assert isinstance(client.map_many([COLUMNS], logic.EXCEL_FIELD_MAP)[0], Exception)
+    assert client.circuit_open()
+    time.sleep(0.06)
+    monkeypatch.setattr(logic.openai.ChatCompletion, "acreate", slow)
+    calls = stub.calls
+    replies = client.map_many([COLUMNS] * 5, logic.EXCEL_FIELD_MAP)
+    assert stub.calls - calls == 1
+    assert sum(isinstance(reply, logic.GPTUnavailableError) for reply in replies) == 4
+    assert not client.circuit_open()
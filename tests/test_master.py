@@ -0,0 +1,85 @@
+import os
+
+import pandas as pd
+import pytest
+
+import bench
+import logic
+
+
+@pytest.fixture
+def master():
+    df = bench.make_master(300)
+    df["NINumber"] = [f"QQ{i:06d}C" for i in range(len(df))]
+    df["HomeNumber"] = [f"0{7700900000 + i}" for i in range(len(df))]  # leading zeros to keep
+    return df
+
+
+@pytest.fixture
+def new_records():
+    records = [logic.map_employee_data(row) for row in bench.make_employee_rows(20, seed=3)]
+    for i, record in enumerate(records):
+        record["NINumber"] = f"QQ{900 + i:06d}C"  # not in the master
+    return records
+
+
+def test_batched_append_matches_row_by_row(master, new_records):
+    expected = master
+    for record in new_records:
+        expected = logic.append_employee_record(expected, record)
+    pd.testing.assert_frame_equal(logic.append_employee_records(master, new_records), expected)
+
+
+def test_upsert_updates_present_people_and_adds_the_rest(master, new_records):
+    returning = dict(master.iloc[5].to_dict(), PensionableSalary="50000")
+    df, summary = logic.upsert_employee_records(master, new_records[:3] + [returning])
+    assert (summary["inserted"], summary["updated"]) == (3, 1)
+    assert len(df) == len(master) + 3
+    assert df.loc[df["NINumber"] == "QQ000005C", "PensionableSalary"].tolist() == [50000.0]
+
+
+def test_store_matches_eager_append_and_upsert(tmp_path, master, new_records):
+    path = os.path.join(tmp_path, "master.csv")
+    logic.write_master_file(master, path, fmt="csv")
+    store = logic.MasterStore.open(os.path.join(tmp_path, "master.store"), path, compact_ratio=10)
+    try:
+        store.append(new_records[:10])
+        store.append(new_records[10:], upsert=True)
+        actual = store.to_frame()
+        store.compact()
+        compacted = store.to_frame()
+    finally:
+        store.close()
+    expected = logic.append_employee_records(logic.load_master_file(path, "master.csv"), new_records[:10])
+    expected, _ = logic.upsert_employee_records(expected, new_records[10:])
+    pd.testing.assert_frame_equal(actual.reset_index(drop=True), expected.reset_index(drop=True))
+    pd.testing.assert_frame_equal(compacted.reset_index(drop=True), expected.reset_index(drop=True))
+
+
+def test_records_round_trip_through_json():
+    records = [{"a": "x", "b": float("nan"), "c": None, "d": pd.Timestamp("1985-03-21 10:00:00.000000123"),
+                "e": pd.NaT, "f": 1.5, "g": "é"}]
+    loaded = logic.records_from_json(logic.records_to_json(records))[0]
+    assert loaded["d"] == records[0]["d"] and isinstance(loaded["d"], pd.Timestamp)
+    assert loaded["e"] is pd.NaT and pd.isna(loaded["b"])
+    assert {k: loaded[k] for k in "acfg"} == {k: records[0][k] for k in "acfg"}
+
+
+def test_unreadable_master_values_are_kept_as_text(master):
+    master = master.astype(object)
+    master.loc[0, "PensionableSalary"] = "TBC"
+    typed = logic.apply_master_schema(master)
+    assert typed.loc[0, "PensionableSalary"] == "TBC"
+    assert set(logic.unreadable_master_values(typed)) == {"PensionableSalary"}
+
+
+@pytest.mark.parametrize("fmt", ["csv", "xlsx"])
+def test_eager_and_streamed_loads_read_text_columns_alike(tmp_path, master, fmt):
+    master["MobileNumber"] = master["MobileNumber"].astype(object)
+    master.loc[1, "MobileNumber"] = "NA"
+    path = str(tmp_path / f"master.{fmt}")
+    logic.write_master_file(master, path, fmt=fmt)
+    eager = logic.load_master_file(path, f"master.{fmt}")
+    streamed = logic.load_master_file(path, f"master.{fmt}", lazy=True).to_frame()
+    assert eager.loc[0, "HomeNumber"] == "07700900000" and eager.loc[1, "MobileNumber"] == "NA"
+    pd.testing.assert_frame_equal(eager, streamed)
@@ -0,0 +1,22 @@
+import bench
+import logic
+import onboarding
+
+
+def test_merge_fails_on_a_corrupt_input(tmp_path, capsys):
+    master = tmp_path / "master.csv"
+    logic.write_master_file(bench.make_master(10), str(master), fmt="csv")
+    inputs = tmp_path / "inputs"
+    inputs.mkdir()
+    (inputs / "starters.csv").write_bytes(bench.make_employee_table(3).to_csv(index=False).encode("utf-8"))
+    (inputs / "corrupt.xlsx").write_bytes(b"PK\x03\x04 not a workbook")
+    output = tmp_path / "updated.csv"
+
+    status = onboarding.main(["merge", "--master", str(master), "--inputs", str(inputs),
+                              "--output", str(output), "--quiet", "--processes", "0"])
+
+    assert status == 1
+    captured = capsys.readouterr()
+    assert "corrupt.xlsx" in captured.err
+    assert "3 record(s) from 1 of 2 file(s)" in captured.out
+    assert len(logic.load_master_file(str(output), "updated.csv")) == 13